@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+import datetime
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import analytics
+
+# Compares the old report approach (sqlite3.Row loop + Counter) with the
+# columnar analytics module on a synthetic login_attempts table.
+#
+#   python scripts/benchmark_analytics.py --rows 1000000
+
+COUNTRIES = ["BRAZIL", "CHINA", "AUSTRIA", "UNITED STATES", "GERMANY", "RUSSIA", "INDIA", "UNKNOWN"]
+
+def make_database(path, rows, seed=1):
+    rng = random.Random(seed)
+    start = datetime.datetime(2025, 1, 1)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE login_attempts (id INTEGER PRIMARY KEY, timestamp TEXT, ip TEXT, user TEXT, "
+                 "result TEXT, country TEXT, raw_log TEXT)")
+    batch = []
+    for i in range(rows):
+        ts = start + datetime.timedelta(seconds=i * 30 + rng.randrange(30))
+        batch.append((ts.strftime("%Y-%m-%d %H:%M:%S"), f"10.{rng.randrange(64)}.{rng.randrange(256)}.{rng.randrange(256)}",
+                      f"user{rng.randrange(5000)}", "fail" if rng.random() < 0.3 else "success",
+                      rng.choice(COUNTRIES), None))
+        if len(batch) == 100000:
+            conn.executemany("INSERT INTO login_attempts (timestamp, ip, user, result, country, raw_log) "
+                             "VALUES (?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO login_attempts (timestamp, ip, user, result, country, raw_log) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+
+# The way report.py used to work: one sqlite3.Row per attempt, counted in Python
+def counter_top_countries(conn):
+    conn.row_factory = sqlite3.Row
+    rows = conn.execute("SELECT country FROM login_attempts").fetchall()
+    return Counter(row["country"] for row in rows if row["country"] != "UNKNOWN").most_common(5)
+
+def counter_fail_rate(conn):
+    conn.row_factory = sqlite3.Row
+    attempts, failures = Counter(), Counter()
+    for row in conn.execute("SELECT timestamp, user, result FROM login_attempts"):
+        key = (row["timestamp"][:10], row["user"])
+        attempts[key] += 1
+        if row["result"] == "fail":
+            failures[key] += 1
+    return sorted(((k, failures[k] / n) for k, n in attempts.items()), key=lambda r: -r[1])[:20]
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--db", help="existing database to use instead of a synthetic one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db
+        if not path:
+            path = os.path.join(tmp, "bench.db")
+            _, seconds = timed(make_database, path, args.rows)
+            print(f"Generated {args.rows} rows in {seconds:.1f}s")
+
+        conn = sqlite3.connect(path)
+        _, counter_top = timed(counter_top_countries, conn)
+        _, counter_rate = timed(counter_fail_rate, conn)
+        conn.row_factory = None
+
+        # Each query loads only the columns it uses, like the CLI does
+        table, top_load = timed(analytics.load_columns, conn, ("country",))
+        mask = table.where("country", "UNKNOWN")
+        mask = ~mask if analytics.np is not None else [not m for m in mask]
+        _, top = timed(analytics.top_k, table, "country", 5, mask)
+
+        table, rate_load = timed(analytics.load_columns, conn, ("time", "user", "result"))
+        _, rate = timed(analytics.fail_rate, table, "user", "day", 1, 20)
+
+        table, churn_load = timed(analytics.load_columns, conn, ("time", "ip"))
+        _, churn = timed(analytics.ip_churn, table, "day")
+
+        table, new_load = timed(analytics.load_columns, conn)
+        _, new = timed(analytics.new_country_logins, table)
+        conn.close()
+
+    backend = "numpy" if analytics.np is not None else "array (NumPy not installed)"
+    print(f"{len(table)} rows, analytics backend: {backend}\n")
+    analytics.print_rows(["query", "Counter", "columnar load", "columnar query", "columnar total"], [
+        ("top 5 countries", f"{counter_top:.2f}s", f"{top_load:.2f}s", f"{top:.3f}s", f"{top_load + top:.2f}s"),
+        ("fail rate user/day", f"{counter_rate:.2f}s", f"{rate_load:.2f}s", f"{rate:.3f}s", f"{rate_load + rate:.2f}s"),
+        ("ip churn/day", "-", f"{churn_load:.2f}s", f"{churn:.3f}s", f"{churn_load + churn:.2f}s"),
+        ("new-country logins", "-", f"{new_load:.2f}s", f"{new:.3f}s", f"{new_load + new:.2f}s"),
+    ])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+import parser as log_parser
+
+# Parses the same nginx access events written as the combined text format
+# (regex) and as JSON lines, with orjson (if installed) and the standard
+# library json module.
+#
+#   python scripts/benchmark_json.py --events 500000
+
+def make_events(count, seed=1):
+    rng = random.Random(seed)
+    start = datetime.datetime(2025, 9, 7)
+    events = []
+    for i in range(count):
+        stamp = start + datetime.timedelta(seconds=i // 50)
+        ip = f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}"
+        user = rng.choice(["-", f"user{rng.randrange(1000)}"])
+        method = rng.choice(["GET", "GET", "POST"])
+        status = rng.choice([200, 200, 302, 403, 404])
+        events.append((stamp, ip, user, method, status, rng.randrange(100, 50000)))
+    return events
+
+def text_line(event):
+    stamp, ip, user, method, status, size = event
+    return (f'{ip} - {user} [{stamp:%d/%b/%Y:%H:%M:%S} +0000] "{method} /login HTTP/1.1" {status} {size} '
+            f'"-" "Mozilla/5.0"')
+
+def json_line(event):
+    stamp, ip, user, method, status, size = event
+    return json.dumps({"time_iso8601": f"{stamp:%Y-%m-%dT%H:%M:%S}+00:00", "remote_addr": ip,
+                       "remote_user": "" if user == "-" else user, "request_method": method,
+                       "request_uri": "/login", "status": status, "body_bytes_sent": size,
+                       "http_user_agent": "Mozilla/5.0"}, separators=(",", ":"))
+
+def parse_all(lines):
+    parse = log_parser.parse_log_line
+    start = time.perf_counter()
+    parsed = sum(1 for line in lines if parse(line, "bench"))
+    return parsed, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=500000)
+    args = parser.parse_args()
+
+    events = make_events(args.events)
+    text = [text_line(e) for e in events]
+    lines = [json_line(e) for e in events]
+    runs = [("text (regex)", text, log_parser.json_loads)]
+    if log_parser.orjson is not None:
+        runs.append(("JSON (orjson)", lines, log_parser.orjson.loads))
+    runs.append(("JSON (json)", lines, json.loads))
+
+    print(f"{args.events} events\n")
+    for name, data, loads in runs:
+        log_parser.json_loads = loads
+        log_parser.source_formats.clear()
+        parsed, seconds = parse_all(data)
+        print(f"{name:<16}{seconds:>8.2f}s{parsed / seconds / 1e6:>8.2f}M lines/s")
+
+if __name__ == "__main__":
+    main()
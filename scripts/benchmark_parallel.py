@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import contextlib
+import tempfile
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import database
+import ip_utils
+from analyzer import init_state, process_line
+from backfill import run_backfill
+from parallel import ShardedIngestor
+
+# Backfill throughput of the single-process pipeline and of ShardedIngestor
+# with 1, 2 and 4 shards over the same log. Parsing and the per-IP detectors
+# run in worker processes, but database writes, user profiles and the
+# distributed-attack check stay serial in the coordinator: its busy time
+# ("coordinator s") bounds the speedup at lines / coordinator time, whatever
+# the number of cores.
+#
+#   python scripts/benchmark_parallel.py --lines 200000 --shards 1 2 4
+
+# 10.x in Brazil, 20.x in China (allowed), 30.x in France (blocked)
+GEOIP_RANGES = [("10.0.0.0", "10.255.255.255", "BR"), ("20.0.0.0", "20.255.255.255", "CN"),
+                ("30.0.0.0", "30.255.255.255", "FR")]
+
+def make_log(path, count, seed=1):
+    rng = random.Random(seed)
+    start = datetime.datetime(2025, 9, 1)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            ts = start + datetime.timedelta(seconds=i // 20)
+            ip = f"{rng.choice((10, 10, 20, 30))}.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+            result = "fail" if rng.random() < 0.8 else "success"
+            f.write(f"{ts:%Y-%m-%d %H:%M:%S}, IP: {ip}, user: user{rng.randrange(5000)}, action: login, result: {result}\n")
+
+def make_config(directory):
+    geoip = os.path.join(directory, "geoip.csv")
+    with open(geoip, "w") as f:
+        f.writelines(f"{start},{end},{code}\n" for start, end, code in GEOIP_RANGES)
+    return {
+        "allowed_countries": ["BRAZIL", "CHINA"],
+        "login_fail_limit": 5,
+        "login_fail_window": 60,
+        "ip_to_user_limit": 10,
+        "user_to_ip_limit": 20,
+        "geoip_database": geoip,
+        "geoip_http_fallback": False,
+    }
+
+def run(log_file, directory, config, logger, shards):
+    database.DATA_DIR = directory
+    database.DB_FILE = os.path.join(directory, f"shards{shards}.db")
+    with contextlib.redirect_stdout(None):
+        database.init_db()
+    database.init_writer(5000, 1.0)
+    database.init_partitions("day")
+    database.init_profile_cache()
+    ip_utils.configure_geoip(config, logger)
+    ip_utils.configure_ip_cache(config)
+    state = init_state(config)
+    state["event_time"] = True
+
+    start = time.perf_counter()
+    coordinator = None
+    if shards:
+        ingestor = ShardedIngestor(config, logger, state, shards)
+        lines, _ = run_backfill([log_file], ingestor.submit, logger, 0)
+        ingestor.close()
+        coordinator = ingestor.stats()["apply_seconds"]
+    else:
+        lines, _ = run_backfill([log_file], lambda line, source: process_line(line, logger, config, state, source),
+                                logger, 0)
+    database.close_writer()
+    return lines, time.perf_counter() - start, coordinator
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+    logger = logging.getLogger("benchmark")
+    logging.disable(logging.CRITICAL)  # alerts are logged per event
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_file = os.path.join(tmp, "bench.log")
+        make_log(log_file, args.lines)
+        config = make_config(tmp)
+        print(f"{args.lines} lines, {os.cpu_count()} CPUs\n")
+        print(f"{'mode':<12}{'seconds':>9}{'lines/s':>10}{'coordinator s':>15}{'max lines/s':>13}")
+        for shards in [0] + args.shards:
+            lines, seconds, coordinator = run(log_file, tmp, config, logger, shards)
+            name = f"{shards} shards" if shards else "single"
+            bound = f"{lines / coordinator:.0f}" if coordinator else "-"
+            busy = f"{coordinator:.2f}" if coordinator is not None else "-"
+            print(f"{name:<12}{seconds:>9.2f}{lines / seconds:>10.0f}{busy:>15}{bound:>13}")
+
+if __name__ == "__main__":
+    main()
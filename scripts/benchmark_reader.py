@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+import parser as log_parser
+
+# Compares ways of reading the lines of a log file:
+#  - text mode iteration with strip per line (the old watchdog/backfill path)
+#  - binary iteration with one decode per line (the first tailer)
+#  - read_line_chunks, with and without byte offsets, and through mmap
+#
+#   python scripts/benchmark_reader.py --mb 200
+
+SSH_LINE = "Sep  7 12:{:02d}:{:02d} server sshd[{}]: Failed password for user{} from 10.0.{}.{} port 22 ssh2\n"
+
+def make_log(path, size_mb, seed=1):
+    rng = random.Random(seed)
+    target = size_mb * 1024 * 1024
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < target:
+            chunk = "".join(SSH_LINE.format(rng.randrange(60), rng.randrange(60), rng.randrange(99999),
+                                            rng.randrange(5000), rng.randrange(256), rng.randrange(256))
+                            for _ in range(10000))
+            f.write(chunk)
+            written += len(chunk)
+
+def text_lines(path):
+    count = 0
+    with open(path, "r", encoding="utf-8", errors="ignore", buffering=log_parser.READ_BUFFER_SIZE) as f:
+        for line in f:
+            if line.strip():
+                line = line.strip()
+                count += 1
+    return count
+
+def binary_lines(path):
+    count = 0
+    offset = 0
+    with open(path, "rb") as f:
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            offset += len(raw)
+            if raw.decode("utf-8", "ignore").strip():
+                count += 1
+    return count
+
+def chunk_lines(path, with_offsets=False, use_mmap=False):
+    count = 0
+    with open(path, "rb", buffering=0) as f:
+        for lines, _ in log_parser.read_line_chunks(f, with_offsets=with_offsets, use_mmap=use_mmap):
+            count += sum(1 for line in lines if line)
+    return count
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mb", type=int, default=200)
+    parser.add_argument("--file", help="existing log file to use instead of a synthetic one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.file
+        if not path:
+            path = os.path.join(tmp, "auth.log")
+            make_log(path, args.mb)
+        size = os.path.getsize(path) / (1024 * 1024)
+        log_parser.MMAP_THRESHOLD = 0
+
+        rows = []
+        for name, fn, extra in [
+            ("text, strip per line", text_lines, ()),
+            ("binary, decode per line", binary_lines, ()),
+            ("read_line_chunks", chunk_lines, ()),
+            ("read_line_chunks + offsets", chunk_lines, (True,)),
+            ("read_line_chunks + offsets, mmap", chunk_lines, (True, True)),
+        ]:
+            fn(path, *extra)  # warm the page cache
+            count, seconds = timed(fn, path, *extra)
+            rows.append((name, f"{count}", f"{seconds:.2f}s", f"{size / seconds:.0f} MB/s",
+                         f"{count / seconds / 1e6:.2f}M"))
+
+    print(f"{size:.0f} MB\n")
+    for row in [("reader", "lines", "time", "throughput", "lines/s")] + rows:
+        print(f"{row[0]:<36}{row[1]:>10}{row[2]:>9}{row[3]:>13}{row[4]:>9}")
+
+if __name__ == "__main__":
+    main()
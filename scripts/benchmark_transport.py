@@ -0,0 +1,88 @@
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+import tempfile
+import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+import parser as log_parser
+import windows_agent
+
+# Compares the two windows_agent outputs on the analyzer side: the CSV
+# (read as text, then parse_windows_csv per line) and the binary records
+# (read_event_records, fields unpacked in place into EventRecord tuples).
+# In CPython the per-record loop costs more than splitting CSV text in C, so
+# the binary format wins on size, not on parse time.
+#
+#   python scripts/benchmark_transport.py --events 1000000
+
+USERS = [f"user{i}" for i in range(2000)] + ["administrator", "joão.silva", "svc_backup"]
+
+def make_rows(count, seed=1):
+    rng = random.Random(seed)
+    start = datetime.datetime(2025, 9, 1)
+    rows = []
+    for i in range(count):
+        stamp = start + datetime.timedelta(seconds=i // 20)  # ~20 logons per second
+        ip = f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(256)}"
+        rows.append([stamp.strftime("%Y-%m-%d %H:%M:%S"), ip, rng.choice(USERS), "login",
+                     "fail" if rng.random() < 0.3 else "success"])
+    return rows
+
+def write_files(rows, directory):
+    csv_file = os.path.join(directory, "windows_events.csv")
+    evt_file = os.path.join(directory, "windows_events.lmevt")
+    with open(csv_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Timestamp", "IP", "User", "Action", "Result"])
+        writer.writerows(rows)
+    with open(evt_file, "wb") as f:
+        f.write(windows_agent.EVENT_MAGIC)
+        windows_agent.BinaryEventWriter(f).writerows(rows)
+    return csv_file, evt_file
+
+def read_only(path):
+    count = 0
+    for _ in log_parser.read_logs([path]):
+        count += 1
+    return count
+
+def read_and_parse(path):
+    count = 0
+    parse = log_parser.parse_log_line
+    for line in log_parser.read_logs([path]):
+        if parse(line, path):
+            count += 1
+    return count
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_file, evt_file = write_files(make_rows(args.events), tmp)
+        rows = []
+        for name, path in (("CSV", csv_file), ("binary", evt_file)):
+            read_only(path)  # warm the page cache
+            _, read_seconds = timed(read_only, path)
+            parsed, total_seconds = timed(read_and_parse, path)
+            rows.append((name, f"{os.path.getsize(path) / 1e6:.1f} MB", f"{read_seconds:.2f}s",
+                         f"{total_seconds:.2f}s", f"{parsed / total_seconds / 1e6:.2f}M"))
+
+    print(f"{args.events} events\n")
+    for row in [("format", "size", "read", "read+parse", "events/s")] + rows:
+        print(f"{row[0]:<8}{row[1]:>10}{row[2]:>8}{row[3]:>12}{row[4]:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,74 @@
 import sqlite3
 import os
-from collections import Counter
+import sys
 
 # Database's file
 DB_FILE = os.path.join("data", "log_analyzer.db")
 
-# Generate report
-def generate_report():
-    conn = sqlite3.connect(DB_FILE)
+# Rollups read below are complete from this schema version on (failed
+# attempts per IP were added in version 10)
+MIN_SCHEMA_VERSION = 10
+
+# Generate report. Everything is read from the rollup tables and indexes, so
+# the time doesn't depend on how many login attempts are stored.
+def generate_report(db_file=DB_FILE):
+    conn = sqlite3.connect(f"file:{db_file}?mode=ro", uri=True)
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
 
+    if cursor.execute("PRAGMA user_version").fetchone()[0] < MIN_SCHEMA_VERSION:
+        print("O banco de dados é de uma versão antiga. Execute o analisador uma vez para atualizá-lo.")
+        conn.close()
+        return
+
     print("--- Relatório de Segurança---")
 
     # 1. The total of processed logs
-    total_logs = cursor.execute("SELECT COUNT(*) FROM logs").fetchone()[0]
+    total_logs = cursor.execute("SELECT COALESCE(SUM(count), 0) FROM login_totals WHERE dim = 'result'").fetchone()[0]
     print(f"\n[+] Total de logs analisados: {total_logs}")
 
-    # 2. Top 5 países com mais tentativas de login
-    cursor.execute("SELECT country FROM logs WHERE action = 'login'")
-    countries = [row['country'] for row in cursor.fetchall() if row['country'] != 'UNKNOWN']
-    top_countries = Counter(countries).most_common(5)
+    # 2. Attempts by result
+    cursor.execute("SELECT key, count FROM login_totals WHERE dim = 'result' ORDER BY count DESC")
+    print("\n[+] Tentativas por resultado:")
+    for row in cursor.fetchall():
+        print(f"  - {row['key']}: {row['count']}")
+
+    # 3. Top 5 countries with most login attempts
+    cursor.execute(
+        "SELECT key, count FROM login_totals WHERE dim = 'country' AND key NOT IN ('UNKNOWN', '') "
+        "ORDER BY count DESC LIMIT 5"
+    )
     print("\n[+] Top 5 países por tentativas de login:")
-    for country, count in top_countries:
-        print(f"  - {country}: {count} tentativas")
+    for row in cursor.fetchall():
+        print(f"  - {row['key']}: {row['count']} tentativas")
 
-    # 3. Top 5 IPs que geraram alertas
-    cursor.execute("SELECT ip FROM alerts")
-    alert_ips = [row['ip'] for row in cursor.fetchall()]
-    top_alert_ips = Counter(alert_ips).most_common(5)
+    # 4. Top 5 IPs by failed attempts in the last 24 hours of data
+    last_hour = cursor.execute("SELECT MAX(bucket) FROM login_rollups WHERE period = 'hour' AND dim = 'ip'").fetchone()[0]
+    if last_hour:
+        cursor.execute(
+            "SELECT key, SUM(count) AS total FROM login_rollups "
+            "WHERE period = 'hour' AND dim = 'failed_ip' AND bucket > datetime(? || ':00:00', '-24 hours') "
+            "GROUP BY key ORDER BY total DESC LIMIT 5",
+            (last_hour,)
+        )
+        print(f"\n[+] Top 5 IPs por tentativas com falha nas últimas 24 horas (até {last_hour}h):")
+        for row in cursor.fetchall():
+            print(f"  - {row['key']}: {row['total']} falhas")
+
+    # 5. Top 5 IPs that generated alerts
+    cursor.execute("SELECT ip, count FROM alert_totals ORDER BY count DESC LIMIT 5")
     print("\n[+] Top 5 IPs que geraram mais alertas:")
-    for ip, count in top_alert_ips:
-        print(f"  - {ip}: {count} alertas")
-        
-    # 4. Últimos 5 IPs bloqueados
+    for row in cursor.fetchall():
+        print(f"  - {row['ip']}: {row['count']} alertas")
+
+    # 6. Last 5 blocked IPs
     cursor.execute("SELECT ip, country, block_time FROM blocked_ips ORDER BY id DESC LIMIT 5")
     last_blocked = cursor.fetchall()
     print("\n[+] Últimos 5 IPs bloqueados:")
     for row in last_blocked:
         print(f"  - IP: {row['ip']} ({row['country']}) em {row['block_time']}")
 
-
     conn.close()
 
 if __name__ == "__main__":
-    generate_report()
\ No newline at end of file
+    generate_report(sys.argv[1] if len(sys.argv) > 1 else DB_FILE)
@@ -0,0 +1,81 @@
+import time
+import random
+import socket
+import argparse
+import datetime
+
+# Sends sshd login messages to the analyzer's syslog server, as if from many
+# hosts, to test collection and measure throughput.
+#
+#   python scripts/syslog_loadgen.py --proto tcp --count 100000 --hosts 50
+#   python scripts/syslog_loadgen.py --proto udp --rfc 5424 --rate 5000
+
+def make_messages(count, hosts=10, rfc="3164", seed=1):
+    rng = random.Random(seed)
+    now = datetime.datetime.now().replace(microsecond=0)
+    messages = []
+    for i in range(count):
+        host = f"host{rng.randrange(hosts):03d}"
+        ip = f"203.0.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+        verb = "Failed" if rng.random() < 0.7 else "Accepted"
+        text = f"{verb} password for user{rng.randrange(500)} from {ip} port {rng.randrange(1024, 65535)} ssh2"
+        pid = 1000 + i % 5000
+        if rfc == "5424":
+            stamp = now.astimezone().isoformat(timespec="milliseconds")
+            message = f"<38>1 {stamp} {host} sshd {pid} - - {text}"
+        else:
+            message = f"<38>{now:%b} {now.day:2d} {now:%H:%M:%S} {host} sshd[{pid}]: {text}"
+        messages.append(message.encode("utf-8"))
+    return messages
+
+def _pace(sent, start, rate):
+    if rate:
+        ahead = sent / rate - (time.monotonic() - start)
+        if ahead > 0:
+            time.sleep(ahead)
+
+def send_udp(host, port, messages, rate=None):
+    start = time.monotonic()
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for sent, message in enumerate(messages, 1):
+            sock.sendto(message, (host, port))
+            if sent % 100 == 0:
+                _pace(sent, start, rate)
+    return time.monotonic() - start
+
+# framing: "octet" (RFC 6587 octet counting) or "newline"
+def send_tcp(host, port, messages, framing="octet", rate=None, batch=100):
+    start = time.monotonic()
+    with socket.create_connection((host, port)) as sock:
+        for first in range(0, len(messages), batch):
+            chunk = messages[first:first + batch]
+            if framing == "octet":
+                data = b"".join(b"%d %s" % (len(m), m) for m in chunk)
+            else:
+                data = b"".join(m + b"\n" for m in chunk)
+            sock.sendall(data)
+            _pace(first + len(chunk), start, rate)
+    return time.monotonic() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=514)
+    parser.add_argument("--proto", choices=["udp", "tcp"], default="tcp")
+    parser.add_argument("--framing", choices=["octet", "newline"], default="octet")
+    parser.add_argument("--rfc", choices=["3164", "5424"], default="3164")
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--hosts", type=int, default=10)
+    parser.add_argument("--rate", type=float, help="messages per second (default: as fast as possible)")
+    args = parser.parse_args()
+
+    messages = make_messages(args.count, args.hosts, args.rfc)
+    if args.proto == "udp":
+        seconds = send_udp(args.host, args.port, messages, args.rate)
+    else:
+        seconds = send_tcp(args.host, args.port, messages, args.framing, args.rate)
+    print(f"Sent {len(messages)} messages over {args.proto} in {seconds:.2f}s "
+          f"({len(messages) / seconds:.0f} msg/s)")
+
+if __name__ == "__main__":
+    main()
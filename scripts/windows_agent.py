@@ -1,7 +1,12 @@
 import os
 import csv
+import time
+import struct
+import calendar
+import ipaddress
 import subprocess
 import datetime
+import itertools
 import xml.etree.ElementTree as ET
 import random
 
@@ -19,142 +24,248 @@ else:
     LOG_DIR = r"YOUR_REMOTE_SHARE_PATH_HERE"
     print("🚀 PROD MODE ON: SMB Network Path + Real IPs.")
 
-LOG_FILE = os.path.join(LOG_DIR, "windows_events.csv")
-LAST_RUN_FILE = os.path.join(os.environ["USERPROFILE"], "agent_last_run.txt")
+# "csv" (windows_events.csv) or "binary" (windows_events.lmevt, compact records
+# the analyzer reads without parsing text)
+OUTPUT_FORMAT = "csv"
+
+LOG_FILE = os.path.join(LOG_DIR, "windows_events.lmevt" if OUTPUT_FORMAT == "binary" else "windows_events.csv")
+# EventRecordID of the last exported event
+WATERMARK_FILE = os.path.join(os.environ.get("USERPROFILE", os.path.expanduser("~")), "agent_watermark.txt")
+
+# Events per wevtutil query; pages are fetched until one comes back short
+PAGE_SIZE = 5000
+# Without a watermark (first run) only the newest events are exported
+FIRST_RUN_EVENTS = 20
+# CSV rows are written in batches of this size
+WRITE_BATCH = 1000
+READ_CHUNK = 64 * 1024
+
+EVENT_NS = "{http://schemas.microsoft.com/win/2004/08/events/event}"
+
+# Binary record format, read by read_event_records in src/parser.py (keep both
+# in sync): EVENT_MAGIC, then per event EVENT_HEADER + IP text (when not IPv4)
+# + user in UTF-8. Header: length u16 (bytes after it), time u32 (epoch
+# seconds, UTC), ipv4 u32 (0: IP as text), result u8 (1 success), ip_len u8
+EVENT_MAGIC = b"LAEVT01\n"
+EVENT_HEADER = struct.Struct("<HIIBB")
 
 # IPs for testing (Australia, Russia, China, Google DNS, Spain)
 SPOOFED_IPS = ["223.255.255.255", "109.252.255.255", "36.125.146.54", "8.8.8.8", "5.83.64.88"]
 
-def ensure_setup():
-    if not os.path.exists(LOG_DIR):
+def ensure_setup(log_file=None, output_format=None):
+    log_file = log_file or LOG_FILE
+    output_format = output_format or OUTPUT_FORMAT
+    log_dir = os.path.dirname(log_file)
+    if not os.path.exists(log_dir):
         try:
-            os.makedirs(LOG_DIR)
+            os.makedirs(log_dir)
         except OSError as e:
-            print(f"⚠️  Warning: Could not create directory {LOG_DIR}. Check permissions or network path. Error: {e}")
+            print(f"⚠️  Warning: Could not create directory {log_dir}. Check permissions or network path. Error: {e}")
 
-    if not os.path.exists(LOG_FILE):
+    if output_format == "binary":
+        if not os.path.exists(log_file) or os.path.getsize(log_file) == 0:
+            try:
+                with open(log_file, "wb") as f:
+                    f.write(EVENT_MAGIC)
+            except IOError as e:
+                print(f"❌ Error initializing event file: {e}")
+    elif not os.path.exists(log_file):
         try:
-            with open(LOG_FILE, "w", newline='', encoding="utf-8") as f:
+            with open(log_file, "w", newline='', encoding="utf-8") as f:
                 writer = csv.writer(f)
                 writer.writerow(["Timestamp", "IP", "User", "Action", "Result"])
         except IOError as e:
             print(f"❌ Error initializing CSV file: {e}")
 
-def get_last_run_time():
-    if os.path.exists(LAST_RUN_FILE):
-        with open(LAST_RUN_FILE, "r") as f:
-            return f.read().strip()
-    return None
-
-def update_last_run_time():
-    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open(LAST_RUN_FILE, "w") as f:
-        f.write(now)
-
-
-def fetch_windows_events():
-    # Native Windows query (wevtutil) to retrieve raw XML.
-    # Filter Security log, Event ID 4624 or 4625, last 20 events (/c:20), reverse order (/rd:true)
-    # Note: In production, adjust the query to filter by TimeCreated.
-    cmd = [
-        "wevtutil", "qe", "Security",
-        "/q:*[System[(EventID=4624 or EventID=4625)]]",
-        "/f:xml",
-        "/c:20",
-        "/rd:true"
-    ]
+def load_watermark(path=None):
+    path = path or WATERMARK_FILE
+    try:
+        with open(path, "r") as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+# Written to a temporary file first so a crash never leaves half a number
+def save_watermark(record_id, path=None):
+    path = path or WATERMARK_FILE
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(str(record_id))
+    os.replace(tmp, path)
+
+# Native Windows query (wevtutil) for logon events (4624/4625), streamed as
+# raw XML chunks. With a watermark: the next `count` events after it, oldest
+# first; without one: the newest `count` events.
+def fetch_windows_events(after=None, count=PAGE_SIZE):
+    query = "*[System[(EventID=4624 or EventID=4625)"
+    query += f" and EventRecordID>{after}]]" if after is not None else "]]"
+    cmd = ["wevtutil", "qe", "Security", f"/q:{query}", "/f:xml", f"/c:{count}"]
+    if after is None:
+        cmd.append("/rd:true")
 
     try:
-        output = subprocess.check_output(cmd, stderr=subprocess.STDOUT).decode("utf-8", errors="ignore")
-        return output
-    except subprocess.CalledProcessError:
-        return ""
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
     except FileNotFoundError:
         print("❌ Error: 'wevtutil' command not found. Ensure you are running this on a Windows system.")
-        return ""
-    
-def parse_and_save(xml_content):
-    if not xml_content.strip():
-        print("ℹ️  No event found.")
         return
+    with process:
+        for chunk in iter(lambda: process.stdout.read(READ_CHUNK), b""):
+            yield chunk
+    if process.returncode:
+        raise RuntimeError(f"wevtutil exited with code {process.returncode}")
 
-# wevtutil returns multiple <Event> elements without a root, so it needs to be wrapped.
-    wrapped_xml = f"<Root>{xml_content}</Root>"
+def _event_fields(event):
+    system = event.find(f"{EVENT_NS}System")
+    record = system.find(f"{EVENT_NS}EventRecordID")
+    time_created = system.find(f"{EVENT_NS}TimeCreated")
+    event_id = system.find(f"{EVENT_NS}EventID")
 
-    try:
-        root = ET.fromstring(wrapped_xml)
-    except ET.ParseError:
-        print("❌ Failed to parse XML content.")
-        return
-    
-    new_logs_count = 0
+    ip_address = "-"
+    target_user = "-"
+    event_data = event.find(f"{EVENT_NS}EventData")
+    if event_data is not None:
+        for data in event_data.iter(f"{EVENT_NS}Data"):
+            name = data.get("Name")
+            if name == "IpAddress":
+                ip_address = data.text
+            elif name == "TargetUserName":
+                target_user = data.text
+
+    return (int(record.text), time_created.get("SystemTime") if time_created is not None else "",
+            event_id.text if event_id is not None else "", ip_address, target_user)
+
+# Stream-parse wevtutil output (a sequence of <Event> elements with no root)
+# and yield (record_id, system_time, event_id, ip, user) per event. Each
+# event is dropped from the tree once read, so memory doesn't grow with the page.
+def parse_events(chunks):
+    parser = ET.XMLPullParser(events=("start", "end"))
+    parser.feed(b"<Root>")
+    root = None
+    for chunk in itertools.chain(chunks, [b"</Root>"]):
+        parser.feed(chunk)
+        for kind, elem in parser.read_events():
+            if kind == "start":
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag != f"{EVENT_NS}Event":
+                continue
+            try:
+                yield _event_fields(elem)
+            except Exception as e:
+                print(f"⚠️ Error processing an event: {e}")
+            root.remove(elem)
+
+# CSV row for an event, or None when it is not relevant
+def event_to_row(system_time, event_id, ip_address, target_user):
+    # Format date to YYYY-MM-DD HH:MM:SS (SystemTime is UTC with 7 fractional digits)
+    dt = datetime.datetime.strptime(system_time[:19], "%Y-%m-%dT%H:%M:%S")
+    timestamp = dt.strftime("%Y-%m-%d %H:%M:%S")
+
+    # Filter empty IPs (Local System)
+    if not LAB_MODE and (not ip_address or ip_address == "-"):
+        return None
 
+    # LAB MODE LOGIC (Spoofing)
+    if LAB_MODE:
+        ip_address = random.choice(SPOOFED_IPS)
+        target_user = f"{target_user}-TEST"
+
+    # Normalize Action/Result
+    action = "login"
+    result = "success" if event_id == "4624" else "fail"
+    return [timestamp, ip_address, target_user, action, result]
+
+def pack_event(row):
+    timestamp, ip_address, target_user, action, result = row
+    stamp = calendar.timegm(time.strptime(timestamp, "%Y-%m-%d %H:%M:%S"))
     try:
-        with open(LOG_FILE, "a", newline='', encoding="utf-8") as f:
-            writer = csv.writer(f)
-            ns = {"ns": "http://schemas.microsoft.com/win/2004/08/events/event"}
-
-            for event in root.findall("ns:Event", ns):
-                try:
-                    # Extract timestamp
-                    time_created = event.find('ns:System/ns:TimeCreated', ns)
-                    timestamp_raw = time_created.get('SystemTime') if time_created is not None else ""
-                    # Format date to YYYY-MM-DD HH:MM:SS
-                    dt = datetime.datetime.fromisoformat(timestamp_raw.replace('Z', '+00:00'))
-                    timestamp = dt.strftime("%Y-%m-%d %H:%M:%S")
-
-                    # Extract Event ID
-                    event_id_tag = event.find('ns:System/ns:EventID', ns)
-                    event_id = event_id_tag.text if event_id_tag is not None else ""
-
-                    # Extract Data fields
-                    ip_address = "-"
-                    target_user = "-"
-                
-                    event_data = event.find('ns:EventData', ns)
-                    if event_data is not None:
-                        for data in event_data.findall('ns:Data', ns):
-                            name = data.get('Name')
-                            if name == 'IpAddress':
-                                ip_address = data.text
-                            elif name == 'TargetUserName':
-                                target_user = data.text
-
-                    # Filter empty IPs (Local System)
-                    if not LAB_MODE and (not ip_address or ip_address == "-"):
-                        continue
-
-                    # LAB MODE LOGIC (Spoofing)
-                    if LAB_MODE:
-                        ip_address = random.choice(SPOOFED_IPS)
-                        target_user = f"{target_user}-TEST"
-
-                    # Normalize Action/Result
-                    action = "login"
-                    result = "success" if event_id == "4624" else "fail"
-
-                    # Write in CSV
-                    writer.writerow([timestamp, ip_address, target_user, action, result])
-                    new_logs_count += 1
-                
-                except Exception as e:
-                    print(f"⚠️ Error processing an event: {e}")
-                    continue
-    except IOError as e:
-        print(f"❌ Error writing to CSV file: {e}")
-        return
-    
-    if new_logs_count > 0:
-        print(f"✅ {new_logs_count} new logs saved in {LOG_FILE}")
+        ipv4 = int(ipaddress.IPv4Address(ip_address))
+    except ValueError:
+        ipv4 = 0
+    ip_text = b"" if ipv4 else str(ip_address).encode("utf-8")[:255]
+    user = str(target_user or "").encode("utf-8")[:60000]
+    length = EVENT_HEADER.size - 2 + len(ip_text) + len(user)
+    return EVENT_HEADER.pack(length, stamp, ipv4, result == "success", len(ip_text)) + ip_text + user
+
+class BinaryEventWriter:
+    # Same writerows() as csv.writer, so write_events works with both formats
+    def __init__(self, f):
+        self.f = f
+
+    def writerows(self, rows):
+        self.f.write(b"".join(map(pack_event, rows)))
+
+# Append the events of one page to the output file in batches. Returns
+# (events, rows written, highest EventRecordID seen).
+def write_events(events, writer):
+    count = written = 0
+    last = None
+    rows = []
+    for record_id, system_time, event_id, ip_address, target_user in events:
+        count += 1
+        last = record_id if last is None else max(last, record_id)
+        try:
+            row = event_to_row(system_time, event_id, ip_address, target_user)
+        except Exception as e:
+            print(f"⚠️ Error processing an event: {e}")
+            continue
+        if row is not None:
+            rows.append(row)
+        if len(rows) >= WRITE_BATCH:
+            writer.writerows(rows)
+            written += len(rows)
+            rows = []
+    writer.writerows(rows)
+    return count, written + len(rows), last
+
+# Export every event after the watermark, page by page. The watermark is
+# saved after each page's rows are on disk, so a run that stops halfway
+# continues from the last complete page.
+def export_events(fetch=fetch_windows_events, log_file=None, watermark_file=None,
+                  page_size=PAGE_SIZE, first_run_events=FIRST_RUN_EVENTS, output_format=None):
+    log_file = log_file or LOG_FILE
+    after = load_watermark(watermark_file)
+    total = 0
+    if (output_format or OUTPUT_FORMAT) == "binary":
+        f = open(log_file, "ab")
+        writer = BinaryEventWriter(f)
     else:
-        print("ℹ️  Events processed, but none relevant saved.")
+        f = open(log_file, "a", newline='', encoding="utf-8")
+        writer = csv.writer(f)
+    with f:
+        while True:
+            if after is None:
+                # Newest events come newest first: write them in order
+                events = sorted(parse_events(fetch(None, first_run_events)))
+                requested = None
+            else:
+                events = parse_events(fetch(after, page_size))
+                requested = page_size
+            count, written, last = write_events(events, writer)
+            total += written
+            if last is None:
+                break
+            f.flush()
+            os.fsync(f.fileno())
+            save_watermark(last, watermark_file)
+            after = last
+            if requested is None or count < requested:
+                break
+    return total
 
 if __name__ == "__main__":
     ensure_setup()
     print("🔍 Searching for security events (via Python)...")
     if LAB_MODE:
         print("🧪 LAB MODE ACTIVE: IPs are being masked.")
-        
-    xml_data = fetch_windows_events()
-    parse_and_save(xml_data)
-    update_last_run_time()
\ No newline at end of file
+
+    try:
+        new_logs_count = export_events()
+    except (IOError, RuntimeError, ET.ParseError) as e:
+        print(f"❌ Error exporting events: {e}")
+    else:
+        if new_logs_count > 0:
+            print(f"✅ {new_logs_count} new logs saved in {LOG_FILE}")
+        else:
+            print("ℹ️  No new relevant events.")
@@ -0,0 +1,336 @@
+import sys
+import time
+import array
+import sqlite3
+import argparse
+import datetime
+import collections
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Ad-hoc analytics over login_attempts. Rows are loaded in chunks into columns:
+# the time as epoch seconds and ip/user/result/country as dictionary-encoded int
+# codes. Group-by, top-K and time-bucket operations then work on whole columns
+# (NumPy when installed, array + Counter otherwise) instead of sqlite3.Row loops.
+#
+#   python src/analytics.py top --by country -k 10
+#   python src/analytics.py fail-rate --by user --bucket day --min-attempts 20
+#   python src/analytics.py new-countries
+#   python src/analytics.py ip-churn --bucket hour
+
+DIMS = ("ip", "user", "result", "country")
+COLUMNS = ("time",) + DIMS
+# unixepoch() (SQLite 3.38+) is cheaper than strftime('%s')
+TIME_SQL = "unixepoch(timestamp)" if sqlite3.sqlite_version_info >= (3, 38, 0) else "CAST(strftime('%s', timestamp) AS INTEGER)"
+COLUMN_SQL = {"time": f"COALESCE({TIME_SQL}, 0)",
+              "ip": "ip", "user": "user", "result": "result", "country": "country"}
+BUCKETS = {"minute": 60, "hour": 3600, "day": 86400, "week": 7 * 86400}
+
+class Dictionary(dict):
+    # Dictionary encoding: each distinct string gets a small int code. Known
+    # values are looked up in C; __missing__ only runs for new ones.
+    def __init__(self):
+        super().__init__()
+        self.values = []
+
+    def __missing__(self, value):
+        code = self[value] = len(self.values)
+        self.values.append(value)
+        return code
+
+    def encode(self, items):
+        return list(map(self.__getitem__, items))
+
+    def code(self, value):
+        return self.get(value, -1)
+
+class LoginColumns:
+    def __init__(self, columns=COLUMNS):
+        self.columns = tuple(columns)
+        self.dims = [c for c in self.columns if c != "time"]
+        self.dicts = {dim: Dictionary() for dim in self.dims}
+        self._time = array.array("q")
+        self._codes = {dim: array.array("l") for dim in self.dims}
+        self.rows = 0
+        self.time = None
+        self.codes = None
+
+    def __len__(self):
+        return self.rows
+
+    def append(self, rows):
+        self.rows += len(rows)
+        for column, values in zip(self.columns, zip(*rows)):
+            if column == "time":
+                self._time.extend(values)
+            else:
+                self._codes[column].extend(self.dicts[column].encode(values))
+
+    # Freeze the loaded columns (NumPy arrays when available)
+    def finish(self):
+        if np is not None:
+            self.time = np.frombuffer(self._time, dtype=np.int64).copy()
+            self.codes = {dim: np.frombuffer(col, dtype=np.dtype(f"i{col.itemsize}")).astype(np.int64)
+                          for dim, col in self._codes.items()}
+        else:
+            self.time = self._time
+            self.codes = self._codes
+        self._time, self._codes = None, None
+        return self
+
+    def decode(self, dim, code):
+        return self.dicts[dim].values[code]
+
+    # Start of the time bucket of each row
+    def bucket(self, seconds):
+        if np is not None:
+            return self.time // seconds * seconds
+        return array.array("q", (t // seconds * seconds for t in self.time))
+
+    # Row mask for dim == value
+    def where(self, dim, value):
+        code = self.dicts[dim].code(value)
+        if np is not None:
+            return self.codes[dim] == code
+        return [c == code for c in self.codes[dim]]
+
+# Load the given columns of login_attempts, optionally between since/until
+# ("YYYY-MM-DD[ HH:MM:SS]"). Only loading what a query needs matters: the
+# fetch and the encoding of near-unique values (IPs) are most of the cost.
+def load_columns(conn, columns=COLUMNS, since=None, until=None, chunk_size=100000):
+    columns = [c for c in COLUMNS if c in columns]
+    sql = f"SELECT {', '.join(COLUMN_SQL[c] for c in columns)} FROM login_attempts"
+    params, conditions = [], []
+    if since:
+        conditions.append("timestamp >= ?")
+        params.append(since)
+    if until:
+        conditions.append("timestamp < ?")
+        params.append(until)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    table = LoginColumns(columns)
+    cursor = conn.execute(sql, params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        table.append(rows)
+    return table.finish()
+
+def _select(values, mask):
+    if mask is None:
+        return values
+    if np is not None:
+        return values[mask]
+    return [v for v, keep in zip(values, mask) if keep]
+
+# Pack several int columns into one int64 per row (NumPy only). The packed
+# values sort like the tuples they encode.
+def _pack(keys):
+    layout, combined = [], np.zeros(len(keys[0]), dtype=np.int64)
+    for key in keys:
+        low = int(key.min()) if len(key) else 0
+        size = int(key.max()) - low + 1 if len(key) else 1
+        combined = combined * size + (key - low)
+        layout.append((low, size))
+    return combined, layout
+
+def _unpack(packed, layout):
+    columns = []
+    for low, size in reversed(layout):
+        columns.append(packed % size + low)
+        packed = packed // size
+    return columns[::-1]
+
+# Count rows per combination of the given key columns (lists of equal length)
+def group_count(keys, mask=None):
+    keys = [_select(key, mask) for key in keys]
+    if np is None:
+        return collections.Counter(zip(*keys))
+    if not len(keys[0]):
+        return {}
+    combined, layout = _pack(keys)
+    unique, counts = np.unique(combined, return_counts=True)
+    columns = [column.tolist() for column in _unpack(unique, layout)]
+    return dict(zip(zip(*columns), counts.tolist()))
+
+# The k most frequent values of one dimension: [(value, count)]
+def top_k(table, dim, k=10, mask=None):
+    codes = _select(table.codes[dim], mask)
+    if np is None:
+        return [(table.decode(dim, code), count) for code, count in collections.Counter(codes).most_common(k)]
+    counts = np.bincount(codes, minlength=len(table.dicts[dim]))
+    k = min(k, int(np.count_nonzero(counts)))
+    if k <= 0:
+        return []
+    best = np.argpartition(-counts, k - 1)[:k]
+    best = best[np.lexsort((best, -counts[best]))]
+    return [(table.decode(dim, int(code)), int(counts[code])) for code in best]
+
+# Attempts, failures and failure rate per (bucket, dim value), highest rate
+# first, then most attempts. Only the first `limit` rows are decoded.
+def fail_rate(table, dim="user", bucket="day", min_attempts=1, limit=None):
+    starts = table.bucket(BUCKETS[bucket])
+    failed_mask = table.where("result", "fail")
+    if np is None:
+        attempts = group_count([starts, table.codes[dim]])
+        failures = group_count([starts, table.codes[dim]], failed_mask)
+        rows = []
+        for (start, code), total in attempts.items():
+            if total >= min_attempts:
+                failed = failures.get((start, code), 0)
+                rows.append((start, code, total, failed, failed / total))
+        rows.sort(key=lambda r: (-r[4], -r[2], r[0], r[1]))
+        return [(start, table.decode(dim, code), total, failed, rate)
+                for start, code, total, failed, rate in rows[:limit]]
+    if not len(table):
+        return []
+    combined, layout = _pack([starts, table.codes[dim]])
+    unique, totals = np.unique(combined, return_counts=True)
+    failed_keys, failed_counts = np.unique(combined[failed_mask], return_counts=True)
+    failures = np.zeros_like(totals)
+    failures[np.searchsorted(unique, failed_keys)] = failed_counts
+    keep = totals >= min_attempts
+    unique, totals, failures = unique[keep], totals[keep], failures[keep]
+    rates = failures / totals
+    order = np.lexsort((unique, -totals, -rates))[:limit]
+    bucket_starts, codes = _unpack(unique[order], layout)
+    return [(start, table.decode(dim, code), total, failed, rate) for start, code, total, failed, rate in
+            zip(bucket_starts.tolist(), codes.tolist(), totals[order].tolist(), failures[order].tolist(), rates[order].tolist())]
+
+# Successful logins from a country the user had not logged in from before
+# (the first country of each user is not reported): [(time, user, country, ip)]
+def new_country_logins(table):
+    success = table.where("result", "success")
+    times = _select(table.time, success)
+    users = _select(table.codes["user"], success)
+    countries = _select(table.codes["country"], success)
+    ips = _select(table.codes["ip"], success)
+    if np is not None:
+        order = np.argsort(times, kind="stable")
+        pairs = users[order] * max(1, len(table.dicts["country"])) + countries[order]
+        _, first_pair = np.unique(pairs, return_index=True)
+        _, first_user = np.unique(users[order], return_index=True)
+        rows = order[np.sort(np.setdiff1d(first_pair, first_user))].tolist()
+    else:
+        order = sorted(range(len(times)), key=times.__getitem__)
+        seen_users, seen_pairs, rows = set(), set(), []
+        for i in order:
+            user, pair = users[i], (users[i], countries[i])
+            if pair not in seen_pairs:
+                seen_pairs.add(pair)
+                if user in seen_users:
+                    rows.append(i)
+                seen_users.add(user)
+    return [(int(times[i]), table.decode("user", users[i]), table.decode("country", countries[i]),
+             table.decode("ip", ips[i])) for i in rows]
+
+# Per time bucket: active IPs, IPs seen for the first time and IPs active in
+# the previous bucket but not in this one: [(start, active, new, gone)]
+def ip_churn(table, bucket="day"):
+    seconds = BUCKETS[bucket]
+    if not len(table):
+        return []
+    if np is not None:
+        index = table.time // seconds
+        first = int(index.min())
+        index = index - first
+        n_ips = max(1, len(table.dicts["ip"]))
+        keys = np.unique(index * n_ips + table.codes["ip"])  # sorted by bucket, then IP
+        key_bucket, key_ip = keys // n_ips, keys % n_ips
+        n_buckets = int(key_bucket.max()) + 1
+        active = np.bincount(key_bucket, minlength=n_buckets)
+        _, first_seen = np.unique(key_ip, return_index=True)
+        new = np.bincount(key_bucket[first_seen], minlength=n_buckets)
+        following = np.minimum(np.searchsorted(keys, keys + n_ips), len(keys) - 1)
+        continues = keys[following] == keys + n_ips
+        gone = np.bincount(key_bucket[~continues] + 1, minlength=n_buckets + 1)[:n_buckets]
+        columns = zip(active.tolist(), new.tolist(), gone.tolist())
+        return [((first + i) * seconds, a, n, g) for i, (a, n, g) in enumerate(columns) if a or g]
+    per_bucket = collections.defaultdict(set)
+    for t, ip in zip(table.time, table.codes["ip"]):
+        per_bucket[t // seconds].add(ip)
+    rows, seen, previous = [], set(), set()
+    for index in range(min(per_bucket), max(per_bucket) + 1):
+        ips = per_bucket.get(index, set())
+        if ips or previous:
+            rows.append((index * seconds, len(ips), len(ips - seen), len(previous - ips)))
+        seen |= ips
+        previous = ips
+    return rows
+
+def format_time(epoch):
+    return datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+def print_rows(header, rows):
+    rows = [[str(value) for value in row] for row in rows]
+    widths = [max([len(h)] + [len(r[i]) for r in rows]) for i, h in enumerate(header)]
+    print("  ".join(h.ljust(w) for h, w in zip(header, widths)))
+    for row in rows:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ad-hoc analytics over the login attempts database")
+    parser.add_argument("--db", default="data/log_analyzer.db")
+    parser.add_argument("--since", help="first timestamp to load (YYYY-MM-DD[ HH:MM:SS])")
+    parser.add_argument("--until", help="load rows before this timestamp")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    top = commands.add_parser("top", help="most frequent IPs, users or countries")
+    top.add_argument("--by", choices=DIMS, default="ip")
+    top.add_argument("--result", help="only rows with this result (e.g. fail)")
+    top.add_argument("-k", type=int, default=10)
+
+    rate = commands.add_parser("fail-rate", help="failure rate per user/IP per time bucket")
+    rate.add_argument("--by", choices=DIMS, default="user")
+    rate.add_argument("--bucket", choices=BUCKETS, default="day")
+    rate.add_argument("--min-attempts", type=int, default=1)
+    rate.add_argument("-k", type=int, default=20)
+
+    new = commands.add_parser("new-countries", help="successful logins from a new country for the user")
+    new.add_argument("-k", type=int, default=50)
+
+    churn = commands.add_parser("ip-churn", help="active, new and gone IPs per time bucket")
+    churn.add_argument("--bucket", choices=BUCKETS, default="day")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "top":
+        columns = {args.by, "result"} if args.result else {args.by}
+    elif args.command == "fail-rate":
+        columns = {"time", args.by, "result"}
+    elif args.command == "ip-churn":
+        columns = {"time", "ip"}
+    else:
+        columns = COLUMNS
+
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    start = time.perf_counter()
+    table = load_columns(conn, columns, args.since, args.until)
+    conn.close()
+    loaded = time.perf_counter()
+
+    if args.command == "top":
+        mask = table.where("result", args.result) if args.result else None
+        print_rows([args.by, "attempts"], top_k(table, args.by, args.k, mask))
+    elif args.command == "fail-rate":
+        rows = fail_rate(table, args.by, args.bucket, args.min_attempts, args.k)
+        print_rows([args.bucket, args.by, "attempts", "failures", "rate"],
+                   [(format_time(s), key, total, failed, f"{rate:.1%}") for s, key, total, failed, rate in rows])
+    elif args.command == "new-countries":
+        rows = new_country_logins(table)[-args.k:]
+        print_rows(["time", "user", "country", "ip"], [(format_time(t), *rest) for t, *rest in rows])
+    elif args.command == "ip-churn":
+        print_rows([args.bucket, "active", "new", "gone"],
+                   [(format_time(s), *rest) for s, *rest in ip_churn(table, args.bucket)])
+
+    backend = "numpy" if np is not None else "array"
+    print(f"\n{len(table)} rows loaded in {loaded - start:.2f}s, query in {time.perf_counter() - loaded:.3f}s ({backend})",
+          file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
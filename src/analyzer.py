@@ -1,14 +1,17 @@
+import sys
 import yaml
 import datetime
-import collections
 import re
 from log_utils import setup_logger, mask_user
-from ip_utils import get_country_by_ip
-from parser import parse_log_line
-from database import init_db, add_login_attempt, add_blocked_ip, add_alert, get_all_blocked_ips, is_ip_alerted, get_or_create_user_profile, update_user_profile_country, update_user_login_counters
+from ip_utils import get_country_by_ip, get_cached_country, resolve_country, configure_geoip, configure_ip_cache
+from geo_pipeline import GeoPipeline
+from parser import parse_log_line, configure_json_fields
+from time_utils import to_epoch
+from state_store import StateStore, ip_key, user_key
+from database import init_db, get_writer, init_writer, close_writer, init_partitions, get_partitions, set_raw_log_mode, get_raw_log_stats, add_login_attempt, add_blocked_ip, add_alert, get_all_blocked_ips, is_ip_alerted, get_user_profile, init_profile_cache, get_profile_cache, update_user_profile_country, update_user_login_counters, load_ip_cache, save_ip_cache_entry, purge_ip_cache, load_file_offsets, save_file_offset, load_journal_cursors, save_journal_cursor
     
 def extract_user_from_error_line(line: str) -> str:
-    match = re.search(r"user:\s*([^,]+)", line)
+    match = re.search(r'user"?:\s*"?([^,"]+)', line)  # "user: bob" or JSON "user": "bob"
     if match:
         return mask_user(match.group(1).strip())
     return "unknown"
@@ -26,24 +29,25 @@ def normalize_action(action: str) -> str:
         return "login"
     return action
 
-def process_line(line, logger, config, state):
-    data = parse_log_line(line)
+# Parse, filter and normalize a raw line. Returns (timestamp, ip, user, action, result) or None
+def prepare_event(line, logger, source=None):
+    data = parse_log_line(line, source)
     if not data:
         masked_user = extract_user_from_error_line(line)
-        masked_line = re.sub(r"user:\s*([^, ]+)", f"user: {masked_user}", line)
+        masked_line = re.sub(r'(user"?:\s*"?)[^, "]+', lambda m: m.group(1) + masked_user, line)
         logger.error(f"Invalid log line: {masked_line}")
-        return
+        return None
     
     timestamp, ip, user, action, result = data
 
     clean_user = user.replace("-TEST", "") if user.endswith("-TEST") else user
 
     if user.endswith("$") or user.endswith("$-TEST"):
-        return # Skip machine accounts
+        return None # Skip machine accounts
     
     system_accounts = ["SYSTEM", "ANONYMOUS LOGON", "LOCAL SERVICE", "NETWORK SERVICE"]
     if clean_user in system_accounts:
-        return  # Skip system accounts
+        return None # Skip system accounts
 
     # Normalize
     action = normalize_action(action)
@@ -53,7 +57,18 @@ def process_line(line, logger, config, state):
     if not user or user == "-":
         user = "unknown user"
 
-    country_norm = get_country_by_ip(ip, logger)
+    return timestamp, ip, user, action, result
+
+def process_line(line, logger, config, state, source=None):
+    event = prepare_event(line, logger, source)
+    if event is None:
+        return
+    country_norm = get_country_by_ip(event[1], logger)
+    handle_event(event, line, country_norm, logger, config, state)
+
+# Persist the event and run the detectors once its country is known
+def handle_event(event, line, country_norm, logger, config, state):
+    timestamp, ip, user, action, result = event
 
     add_login_attempt(timestamp, ip, user, result, country_norm, line)
 
@@ -61,136 +76,285 @@ def process_line(line, logger, config, state):
         return
     
     if result == "success":
-        profile = get_or_create_user_profile(user)
-        min_history_threshold = config.get("suspicious_login_min_history", 10)
-
-        has_sufficient_history = profile['successful_logins'] >= min_history_threshold
-        known_countries = profile['known_countries'].split(",") if profile['known_countries'] else []
-
-        if has_sufficient_history and country_norm not in known_countries:
-            logger.warning(f"SUSPICIOUS LOGIN: User {mask_user(user)} logged in from a new country: {country_norm} (IP: {ip}); (previous: {known_countries})")
-
-        update_user_profile_country(user, country_norm)
-        update_user_login_counters(user, success=True)
+        record_success(event, country_norm, logger, config)
 
     elif result == "fail":
         update_user_login_counters(user, success=False)
 
-    # Block IPs from not allowed countries
-        if country_norm not in state["allowed_countries"]:
-            if ip not in state["blocked_ips"]:
-                logger.warning(f"IP {ip} from ({country_norm}), user: {mask_user(user)} blocked (country restriction).")
-                state["blocked_ips"].add(ip)
-                add_blocked_ip(ip, user, country_norm, timestamp)
-            else:
-                if ip not in state["processed_blocks"]:
-                    logger.info(f"IP {ip} from ({country_norm}), user: {mask_user(user)} already blocked.")
-            state["processed_blocks"].add(ip)
-            return
-
-        if ip in state["blocked_ips"]:
-            return
-    
         # Spraying and distributed attack logic
-        now = datetime.datetime.now()
-        window = datetime.timedelta(seconds=state.get("attack_detection_window", 300))
-
-        # Detection of password spraying
-        state["ip_to_user"][ip].append((now, user))
-        state["ip_to_user"][ip] = [t for t in state["ip_to_user"][ip] if now - t[0] < window]
-        unique_users = len(set(t[1] for t in state["ip_to_user"][ip])) 
-
-        ip_limit = config.get("ip_to_user_limit", 10)
-        if unique_users >= ip_limit:
-            reason = f"Password spraying: IP tried to access {unique_users} accounts"
-            logger.warning(f"PASSWORD SPRAYING DETECTED: IP {ip} ({country_norm}) tried to access {unique_users} accounts.")
-            add_alert(ip, None, country_norm, now, reason)
-            state["ip_to_user"][ip] = []  
+        # (backfill uses the event time so windows follow the replayed logs)
+        now = timestamp if state.get("event_time") else datetime.datetime.now()
+        state["store"].tick()  # Once per event: keeps the detector state within budget
+
+        verdict, value = check_ip_rules(event, country_norm, now, config, state)
+        if verdict:
+            report_ip_verdict(event, country_norm, verdict, value, now, logger)
             return
 
-        # Detection of distributed attack
-        state["user_to_ips"][user].append((now, ip))
-        state["user_to_ips"][user] = [t for t in state["user_to_ips"][user] if now - t[0] < window]
-        unique_ips = len(set(t[1] for t in state["user_to_ips"][user]))
-
-        user_limit = config.get("user_to_ip_limit", 20)
-        if unique_ips >= user_limit:
-            reason = f"Distributed attack: User account targeted from {unique_ips} IPs"
-            logger.warning(f"DISTRIBUTED ATTACK DETECTED: User {mask_user(user)} targeted from {unique_ips} IPs.")
-            add_alert(None, user, None, now, reason)
-            state["user_to_ips"][user] = []  
+        if check_distributed_attack(event, now, logger, config, state):
             return
 
-    # Count failed logins
-        state["fail_logins"][ip].append(timestamp)
-        window_start = timestamp - datetime.timedelta(seconds=state["login_fail_window"])
-        state["fail_logins"][ip] = [t for t in state["fail_logins"][ip] if t >= window_start]
+        failures = check_brute_force(event, state)
+        if failures:
+            report_brute_force(event, country_norm, failures, now, logger)
 
-        if len(state["fail_logins"][ip]) >= state["login_fail_limit"]:
-            if ip not in state["alert_ips"] and not is_ip_alerted(ip):
-                    
-                profile = get_or_create_user_profile(user)
-                
-                current_attack_fails = len(state["fail_logins"][ip])
-                historical_fails = profile['failed_logins'] - current_attack_fails
-                historical_total = profile['successful_logins'] + historical_fails
-
-                if historical_total > 20:
-                    historical_fail_rate = historical_fails / historical_total if historical_total > 0 else 0
-
-                    if historical_fail_rate < 0.05:
-                        reason = f"High-confidence brute-force: {len(state['fail_logins'][ip])} failures agaisnt a low-error rate account"
-                        add_alert(ip, user, country_norm, datetime.datetime.now(), reason)
-                        logger.critical(f"HIGH-CONFIDENCE BRUTE-FORCE DETECTED: User {mask_user(user)} (low fail rate) is under brute-force from IP {ip} ({country_norm}).")
-                    else:
-                        reason = f"Brute-force detected: {len(state['fail_logins'][ip])} failed login attempts"
-                        add_alert(ip, user, country_norm, datetime.datetime.now(), reason)
-                        logger.warning(f"IP {ip} ({country_norm}), user: {mask_user(user)} exceeded login attempts. Added to alert list.")
-                else:
-                    reason = f"Brute-force detected: {len(state['fail_logins'][ip])} failed login attempts"
-                    add_alert(ip, user, country_norm, datetime.datetime.now(), reason)
-                    logger.warning(f"IP {ip} ({country_norm}), user: {mask_user(user)} exceeded login attempts. Added to alert list.")
-
-                state["alert_ips"].add(ip)
+def record_success(event, country_norm, logger, config):
+    timestamp, ip, user, action, result = event
+
+    profile = get_user_profile(user)
+    min_history_threshold = config.get("suspicious_login_min_history", 10)
+
+    has_sufficient_history = profile.successful_logins >= min_history_threshold
+
+    if has_sufficient_history and country_norm not in profile.known_countries:
+        logger.warning(f"SUSPICIOUS LOGIN: User {mask_user(user)} logged in from a new country: {country_norm} (IP: {ip}); (previous: {sorted(profile.known_countries)})")
+
+    update_user_profile_country(user, country_norm)
+    update_user_login_counters(user, success=True)
+
+# Checks on a failed login that only use state keyed by its IP (country block
+# and password spraying), so they can run wherever that IP's state lives.
+# Returns (verdict, value); verdict is None when processing should continue.
+def check_ip_rules(event, country_norm, now, config, state):
+    timestamp, ip, user, action, result = event
+    key = ip_key(ip)
+
+    # Block IPs from not allowed countries
+    if country_norm not in state["allowed_countries"]:
+        if key not in state["blocked_ips"]:
+            state["blocked_ips"].add(key)
+            verdict = ("block", "new")
+        elif key not in state["processed_blocks"]:
+            verdict = ("block", "known")
+        else:
+            verdict = ("block", None)
+        state["processed_blocks"].add(key)
+        return verdict
+
+    if key in state["blocked_ips"]:
+        return ("blocked", None)
+
+    # Detection of password spraying
+    unique_users = state["ip_to_user"].add(key, to_epoch(now), user_key(user)).distinct()
+
+    if unique_users >= config.get("ip_to_user_limit", 10):
+        state["ip_to_user"].clear(key)
+        return ("spraying", unique_users)
+
+    return (None, None)
+
+# Log and persist the outcome of check_ip_rules
+def report_ip_verdict(event, country_norm, verdict, value, now, logger):
+    timestamp, ip, user, action, result = event
+
+    if verdict == "block":
+        if value == "new":
+            logger.warning(f"IP {ip} from ({country_norm}), user: {mask_user(user)} blocked (country restriction).")
+            add_blocked_ip(ip, user, country_norm, timestamp)
+        elif value == "known":
+            logger.info(f"IP {ip} from ({country_norm}), user: {mask_user(user)} already blocked.")
+
+    elif verdict == "spraying":
+        reason = f"Password spraying: IP tried to access {value} accounts"
+        logger.warning(f"PASSWORD SPRAYING DETECTED: IP {ip} ({country_norm}) tried to access {value} accounts.")
+        add_alert(ip, None, country_norm, now, reason)
+
+# Detection of distributed attack (keyed by user, so it needs every IP's events)
+def check_distributed_attack(event, now, logger, config, state):
+    timestamp, ip, user, action, result = event
+
+    unique_ips = state["user_to_ips"].add(user_key(user), to_epoch(now), ip_key(ip)).distinct()
+
+    user_limit = config.get("user_to_ip_limit", 20)
+    if unique_ips >= user_limit:
+        reason = f"Distributed attack: User account targeted from {unique_ips} IPs"
+        logger.warning(f"DISTRIBUTED ATTACK DETECTED: User {mask_user(user)} targeted from {unique_ips} IPs.")
+        add_alert(None, user, None, now, reason)
+        state["user_to_ips"].clear(user_key(user))
+        return True
+    return False
+
+# Count failed logins. Returns the number of failures in the window the first
+# time the IP reaches login_fail_limit, otherwise 0.
+def check_brute_force(event, state):
+    timestamp, ip, user, action, result = event
+
+    key = ip_key(ip)
+    failures = len(state["fail_logins"].add(key, to_epoch(timestamp)))
+    if failures >= state["login_fail_limit"] and key not in state["alert_ips"]:
+        state["alert_ips"].add(key)
+        return failures
+    return 0
+
+def report_brute_force(event, country_norm, failures, now, logger):
+    timestamp, ip, user, action, result = event
+
+    if is_ip_alerted(ip):
+        return
+
+    profile = get_user_profile(user)
+    
+    current_attack_fails = failures
+    historical_fails = profile.failed_logins - current_attack_fails
+    historical_total = profile.successful_logins + historical_fails
+
+    if historical_total > 20:
+        historical_fail_rate = historical_fails / historical_total if historical_total > 0 else 0
+
+        if historical_fail_rate < 0.05:
+            reason = f"High-confidence brute-force: {failures} failures agaisnt a low-error rate account"
+            add_alert(ip, user, country_norm, now, reason)
+            logger.critical(f"HIGH-CONFIDENCE BRUTE-FORCE DETECTED: User {mask_user(user)} (low fail rate) is under brute-force from IP {ip} ({country_norm}).")
+        else:
+            reason = f"Brute-force detected: {failures} failed login attempts"
+            add_alert(ip, user, country_norm, now, reason)
+            logger.warning(f"IP {ip} ({country_norm}), user: {mask_user(user)} exceeded login attempts. Added to alert list.")
+    else:
+        reason = f"Brute-force detected: {failures} failed login attempts"
+        add_alert(ip, user, country_norm, now, reason)
+        logger.warning(f"IP {ip} ({country_norm}), user: {mask_user(user)} exceeded login attempts. Added to alert list.")
                 
 def init_state(config):
+    attack_window = config.get("attack_detection_window", 300)
+    max_tracked_ips = config.get("state_max_tracked_ips", 100000)
+    store = StateStore(config.get("state_memory_budget_mb", 256) * 1024 * 1024)
     return {
-        "fail_logins": collections.defaultdict(list),
-        "blocked_ips": get_all_blocked_ips(),
-        "alert_ips": set(),
-        "processed_blocks": set(),
-        "processed_alerts": set(),
-        "ip_to_user": collections.defaultdict(list),
-        "user_to_ips": collections.defaultdict(list),
+        "store": store,
+        "fail_logins": store.window_map("fail_logins", config["login_fail_window"], inclusive=True, track_values=False),
+        "blocked_ips": {ip_key(ip) for ip in get_all_blocked_ips()},
+        "alert_ips": store.bounded_set("alert_ips", max_size=max_tracked_ips),
+        "processed_blocks": store.bounded_set("processed_blocks", max_size=max_tracked_ips),
+        "ip_to_user": store.window_map("ip_to_user", attack_window),
+        "user_to_ips": store.window_map("user_to_ips", attack_window),
         "allowed_countries": set(config["allowed_countries"]),
         "login_fail_limit": config["login_fail_limit"],
         "login_fail_window": config["login_fail_window"],
+        "attack_detection_window": attack_window,
+        "event_time": False,
     }
 
 def main():
-    # Load database
-    init_db()
-
     # Load config
     with open("config.yaml", "r") as f:
         config = yaml.safe_load(f)
 
-    logger = setup_logger(config["monitor_log_dir"])
-    state = init_state(config)
-
-    # Choose between watchdog or journalctl
-    from realtime import start_watchdog, stream_journal
-
-    mode = config.get("mode", "watchdog")  # "watchdog" or "journalctl"
+    # "python src/analyzer.py backfill [paths...]" overrides the configured mode
+    mode = sys.argv[1] if len(sys.argv) > 1 else config.get("mode", "watchdog")  # "watchdog", "journalctl", "syslog" or "backfill"
 
-    if mode == "watchdog":
-        start_watchdog(config["log_dir"], logger, lambda line: process_line(line, logger, config, state))
-    elif mode == "journalctl":
-        services = config.get("services", ["sshd", "apache2", "nginx"])
-        stream_journal(services, lambda line: process_line(line, logger, state), logger)
+    # Load database
+    init_db()
+    if mode == "backfill":
+        init_writer(config.get("backfill_batch_size", 5000), config.get("db_max_latency", 1.0))
     else:
-        logger.error(f"Unknown mode: {mode}")     
+        init_writer(config.get("db_batch_size", 500), config.get("db_max_latency", 1.0))
+    init_partitions(config.get("db_partition", "day"), config.get("db_retention_days", 0))
+    set_raw_log_mode(config.get("db_raw_log", "inline"))
+    init_profile_cache(config.get("profile_cache_size", 10000), config.get("profile_max_dirty", 1000),
+                       config.get("profile_max_latency", 5.0))
 
+    logger = setup_logger(config["monitor_log_dir"])
+    configure_geoip(config, logger)
+    configure_json_fields(config.get("json_fields"))
+
+    # Warm the IP cache with lookups from previous runs
+    purge_ip_cache()
+    ip_cache = configure_ip_cache(config, persist=save_ip_cache_entry)
+    logger.info(f"Loaded {ip_cache.load(load_ip_cache())} cached IP locations")
+    state = init_state(config)
+    state["event_time"] = mode == "backfill"
+
+    # Geolocation runs in a separate stage so unresolved IPs don't block ingestion
+    pipeline = None
+    if config.get("geoip_async", True):
+        pipeline = GeoPipeline(
+            lambda ip: resolve_country(ip, logger),
+            lambda item, country: release(item, country),
+            get_cached_country,
+            logger,
+            concurrency=config.get("geoip_concurrency", 16),
+            deadline=config.get("geoip_deadline", 5.0),
+            max_pending=config.get("geoip_max_pending", 10000),
+        )
+
+    # done(), if given, is run with the writes of the line (e.g. to checkpoint
+    # the file offset after it), so both are committed together
+    def ingest(line, source=None, done=None):
+        if pipeline is None:
+            with get_writer().unit():
+                process_line(line, logger, config, state, source)
+                if done is not None:
+                    done()
+            return
+        event = prepare_event(line, logger, source)
+        if event is not None:
+            pipeline.submit(event[1], (event, line, done))
+        elif done is not None:
+            pipeline.call(done)
+
+    def release(item, country):
+        event, line, done = item
+        with get_writer().unit():
+            handle_event(event, line, country, logger, config, state)
+            if done is not None:
+                done()
+
+    try:
+        if mode == "backfill":
+            from backfill import run_backfill
+            paths = sys.argv[2:] or config.get("backfill_paths") or [config["log_dir"]]
+            shards = config.get("parallel_shards", 0)
+            if shards:
+                # Parse and run per-IP detectors in worker processes
+                from parallel import ShardedIngestor
+                sharded = ShardedIngestor(config, logger, state, shards,
+                                          config.get("parallel_parse_workers"),
+                                          config.get("parallel_chunk_size", 5000))
+                run_backfill(paths, sharded.submit, logger, config.get("backfill_report_every", 100000))
+                sharded.close()
+                logger.info(f"Parallel ingestion stats: {sharded.stats()}")
+            else:
+                run_backfill(paths, ingest, logger, config.get("backfill_report_every", 100000))
+        elif mode == "watchdog":
+            from realtime import start_watchdog
+
+            start_watchdog(config["log_dir"], logger, ingest, save_file_offset, load_file_offsets(),
+                           readers=config.get("watch_readers", 2),
+                           queue_size=config.get("watch_queue_size", 1000),
+                           batch_lines=config.get("watch_batch_lines", 1000),
+                           max_batches=config.get("watch_max_batches", 16),
+                           stats_every=config.get("watch_stats_every", 300),
+                           backend=config.get("watch_backend", "native"),
+                           poll_min_interval=config.get("watch_poll_min_interval", 1.0),
+                           poll_max_interval=config.get("watch_poll_max_interval", 30.0),
+                           poll_max_stats=config.get("watch_poll_max_stats", 500),
+                           poll_rescan=config.get("watch_poll_rescan", 10.0))
+        elif mode == "journalctl":
+            from realtime import stream_journal
+            services = config.get("services", ["sshd", "apache2", "nginx"])
+            stream_journal(services, ingest, logger, save_journal_cursor, load_journal_cursors().get("journal"),
+                           backend=config.get("journal_backend", "auto"))
+        elif mode == "syslog":
+            from syslog_server import serve_syslog
+            serve_syslog(logger, ingest,
+                         host=config.get("syslog_host", "0.0.0.0"),
+                         udp_port=config.get("syslog_udp_port", 514),
+                         tcp_port=config.get("syslog_tcp_port", 514),
+                         batch_lines=config.get("syslog_batch_lines", 1000),
+                         max_batches=config.get("syslog_max_batches", 16),
+                         stats_every=config.get("watch_stats_every", 300))
+        else:
+            logger.error(f"Unknown mode: {mode}")
+    finally:
+        if pipeline is not None:
+            pipeline.close()
+            logger.info(f"GeoIP pipeline stats: {pipeline.stats()}")
+        logger.info(f"IP cache stats: {ip_cache.stats()}")
+        logger.info(f"Detector state: {state['store'].stats()}")
+        logger.info(f"Profile cache stats: {get_profile_cache().stats()}")
+        logger.info(f"Login partitions: {get_partitions().stats()}")
+        logger.info(f"Raw log storage: {get_raw_log_stats()}")
+        # Flush the last batch of writes before exiting
+        close_writer()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
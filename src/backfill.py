@@ -0,0 +1,51 @@
+import os
+import time
+from parser import get_log_files, read_logs, open_log_file, is_event_file, has_event_magic
+
+# Expand directories (recursively) into log files, oldest first so rotated
+# archives (auth.log.2.gz, auth.log.1) are replayed before the live file
+def collect_backfill_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(get_log_files(path, recursive=True))
+        elif os.path.isfile(path):
+            files.append(path)
+    return sorted(set(files), key=lambda f: (os.path.getmtime(f), f))
+
+# Stream every line of the given files/directories through process(line, source)
+# and report throughput. Returns (lines, seconds).
+def run_backfill(paths, process, logger, report_every=100000):
+    files = collect_backfill_files(paths)
+    if not files:
+        logger.warning(f"Backfill: no log files found in {paths}")
+        return 0, 0.0
+
+    logger.info(f"Backfill: {len(files)} files to process")
+    start = time.monotonic()
+    total = 0
+    next_report = report_every
+
+    for path in files:
+        if is_event_file(path):
+            with open_log_file(path) as f:
+                if not has_event_magic(f):
+                    logger.warning(f"Backfill: {path} is not an event record file, skipping it")
+                    continue
+        file_start = time.monotonic()
+        file_lines = 0
+        for line in read_logs([path]):
+            process(line, path)
+            file_lines += 1
+            total += 1
+            if report_every and total >= next_report:
+                elapsed = time.monotonic() - start
+                logger.info(f"Backfill: {total} lines, {total / elapsed:.0f} lines/s")
+                next_report += report_every
+        file_elapsed = time.monotonic() - file_start
+        logger.info(f"Backfill: {path} done, {file_lines} lines in {file_elapsed:.1f}s")
+
+    elapsed = time.monotonic() - start
+    rate = total / elapsed if elapsed > 0 else 0.0
+    logger.info(f"Backfill finished: {total} lines from {len(files)} files in {elapsed:.1f}s ({rate:.0f} lines/s)")
+    return total, elapsed
@@ -1,159 +1,1070 @@
 import sqlite3
 import os
+import time
+import zlib
+import atexit
+import contextlib
+import datetime
+import threading
+import collections
 
 DATA_DIR = "data"
 DB_FILE = os.path.join(DATA_DIR, "log_analyzer.db")
 
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_MAX_LATENCY = 1.0
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Per-connection settings. With WAL, synchronous=NORMAL only syncs at
+# checkpoints: a power loss can drop the last commits but never corrupts the file.
+def configure_connection(conn):
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA mmap_size = {int(MMAP_SIZE)}")
+    conn.execute("PRAGMA busy_timeout = 5000")
+    return conn
+
 # Create and return a connection with the database
 def get_db_connection():
     conn = sqlite3.connect(DB_FILE)
     conn.row_factory = sqlite3.Row
-    return conn
+    return configure_connection(conn)
+
+class DatabaseWriter:
+    # Long-lived connection that groups writes into one transaction per batch.
+    # Statements run inside an open transaction, so reads on the same connection
+    # already see them; the batch is committed when it reaches batch_size or when
+    # its oldest write is older than max_latency seconds. If the process dies,
+    # SQLite rolls back the open batch on next start, so the file stays consistent.
+    def __init__(self, db_file=None, batch_size=DEFAULT_BATCH_SIZE, max_latency=DEFAULT_MAX_LATENCY):
+        self.db_file = db_file or DB_FILE
+        self.batch_size = max(1, int(batch_size))
+        self.max_latency = max_latency
+        self.conn = sqlite3.connect(self.db_file, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        configure_connection(self.conn)
+        self.lock = threading.RLock()
+        self.pending = 0
+        self.batch_started = None
+        self.commits = 0
+        self.closed = False
+        self.commit_hooks = []  # called with the writer just before each COMMIT
+        self.depth = 0          # open unit() blocks
+
+        self._stop = threading.Event()
+        self._flusher = None
+        if self.max_latency and self.max_latency > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name="db-writer-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        interval = min(self.max_latency, 0.5)
+        while not self._stop.wait(interval):
+            with self.lock:
+                if self.batch_started is not None and time.monotonic() - self.batch_started >= self.max_latency:
+                    self._commit()
+
+    def _commit(self):
+        if self.batch_started is not None:
+            for hook in self.commit_hooks:
+                hook(self)
+            self.conn.execute("COMMIT")
+            self.pending = 0
+            self.batch_started = None
+            self.commits += 1
+
+    # Open the batch transaction if there isn't one
+    def begin(self):
+        if self.closed:
+            raise sqlite3.ProgrammingError("DatabaseWriter is closed")
+        if self.batch_started is None:
+            self.conn.execute("BEGIN")
+            self.batch_started = time.monotonic()
+
+    # Queue a write statement in the current batch. count=False is for
+    # bookkeeping statements (e.g. creating a partition) that ride along with
+    # the batch without filling it.
+    def execute(self, sql, params=(), count=True):
+        with self.lock:
+            self.begin()
+            try:
+                cursor = self.conn.execute(sql, params)
+            finally:
+                self.pending += count
+            if count and self.pending >= self.batch_size and not self.depth:
+                self._commit()
+            return cursor
+
+    # Queue the same statement for many rows (counts as len(rows) writes)
+    def executemany(self, sql, rows, count=True):
+        rows = list(rows)
+        if not rows:
+            return
+        with self.lock:
+            self.begin()
+            try:
+                self.conn.executemany(sql, rows)
+            finally:
+                self.pending += len(rows) if count else 0
+            if count and self.pending >= self.batch_size and not self.depth:
+                self._commit()
+
+    # Group the writes of one unit of work (e.g. one log line and the file
+    # offset after it): no commit happens in the middle of it
+    @contextlib.contextmanager
+    def unit(self):
+        with self.lock:
+            self.depth += 1
+            try:
+                yield self
+            finally:
+                self.depth -= 1
+                if not self.depth and self.pending >= self.batch_size:
+                    self._commit()
+
+    # Run a read on the writer connection (sees writes not yet committed)
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def flush(self):
+        with self.lock:
+            self._commit()
+
+    def close(self):
+        self._stop.set()
+        if self._flusher is not None and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        with self.lock:
+            if self.closed:
+                return
+            self._commit()
+            self.conn.close()
+            self.closed = True
 
-# Initialize the database and create necessary tables if they don't exist
+_writer = None
+_writer_lock = threading.Lock()
+
+# Create the shared writer used by the functions below
+def init_writer(batch_size=DEFAULT_BATCH_SIZE, max_latency=DEFAULT_MAX_LATENCY, db_file=None):
+    global _writer, _profiles
+    if _profiles is not None and _writer is not None and not _writer.closed:
+        _profiles.flush()
+    _profiles = None
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+        _writer = DatabaseWriter(db_file, batch_size, max_latency)
+        return _writer
+
+# Return the shared writer, creating one with default settings if needed
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None or _writer.closed:
+            _writer = DatabaseWriter()
+        return _writer
+
+# Write back cached profiles, commit pending writes and close the shared writer
+def close_writer():
+    global _writer, _profiles
+    if _profiles is not None:
+        if _writer is not None and not _writer.closed:
+            _profiles.flush()
+        _profiles = None
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+
+atexit.register(close_writer)
+
+# Schema migrations, applied in order. PRAGMA user_version stores the number of
+# the last one applied; databases created by 1.3.0 and earlier are version 0
+# but already have the tables of migration 1 (hence IF NOT EXISTS).
+MIGRATIONS = [
+    # 1: base schema
+    [
+        # Main table for all the login events
+        """
+        CREATE TABLE IF NOT EXISTS login_attempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            ip TEXT NOT NULL,
+            user TEXT NOT NULL,
+            result TEXT NOT NULL,
+            country TEXT,
+            raw_log TEXT 
+        )
+        """,
+        # Profile of each user
+        """
+        CREATE TABLE IF NOT EXISTS user_profiles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user TEXT NOT NULL UNIQUE,
+            known_countries TEXT NOT NULL, 
+            successful_logins INTEGER DEFAULT 0,
+            failed_logins INTEGER DEFAULT 0
+        )
+        """,
+        # Blocked IPs
+        """
+        CREATE TABLE IF NOT EXISTS blocked_ips (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip TEXT NOT NULL UNIQUE,
+            user TEXT,
+            country TEXT,
+            block_time TEXT NOT NULL
+        )
+        """,
+        # Alerts
+        """
+        CREATE TABLE IF NOT EXISTS alerts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip TEXT,
+            user TEXT,
+            country TEXT,
+            alert_time TEXT NOT NULL,
+            reason TEXT NOT NULL
+        )
+        """,
+    ],
+    # 2: persisted IP -> country cache
+    [
+        """
+        CREATE TABLE IF NOT EXISTS ip_cache (
+            ip TEXT PRIMARY KEY,
+            country TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+        """,
+    ],
+    # 3: indexes for is_ip_alerted and the reports
+    [
+        "CREATE INDEX IF NOT EXISTS idx_alerts_ip ON alerts(ip)",
+        "CREATE INDEX IF NOT EXISTS idx_login_attempts_timestamp ON login_attempts(timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_login_attempts_ip ON login_attempts(ip)",
+        "CREATE INDEX IF NOT EXISTS idx_login_attempts_user_result ON login_attempts(user, result)",
+    ],
+    # 4: login_attempts becomes a view over time partitions
+    [
+        """
+        CREATE TABLE IF NOT EXISTS login_partitions (
+            name TEXT PRIMARY KEY,
+            start TEXT NOT NULL,
+            end TEXT NOT NULL
+        )
+        """,
+        lambda conn: partition_login_attempts(conn, LOGIN_COLUMNS_V4),
+    ],
+    # 5: raw lines can be stored as compressed blocks, referenced by raw_ref
+    [
+        """
+        CREATE TABLE IF NOT EXISTS raw_blocks (
+            id INTEGER PRIMARY KEY,
+            lines INTEGER NOT NULL,
+            data BLOB
+        )
+        """,
+        lambda conn: add_raw_ref_column(conn),
+    ],
+    # 6: rollups kept up to date on ingestion, filled from the existing rows
+    [
+        """
+        CREATE TABLE IF NOT EXISTS login_rollups (
+            period TEXT NOT NULL,
+            dim TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (period, dim, bucket, key)
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS login_totals (
+            dim TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (dim, key)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_login_totals_count ON login_totals(dim, count)",
+        """
+        CREATE TABLE IF NOT EXISTS alert_totals (
+            ip TEXT PRIMARY KEY,
+            count INTEGER NOT NULL,
+            last_alert TEXT
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_alert_totals_count ON alert_totals(count)",
+        lambda conn: fill_rollups(conn),
+    ],
+    # 7: read offsets of tailed log files
+    [
+        """
+        CREATE TABLE IF NOT EXISTS file_offsets (
+            path TEXT PRIMARY KEY,
+            dev INTEGER NOT NULL,
+            ino INTEGER NOT NULL,
+            offset INTEGER NOT NULL
+        )
+        """,
+    ],
+    # 8: position of journal sources (journald cursor)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS journal_cursors (
+            source TEXT PRIMARY KEY,
+            cursor TEXT NOT NULL
+        )
+        """,
+    ],
+    # 9: newest row timestamp of each raw block, so retention can delete blocks
+    [
+        "ALTER TABLE raw_blocks ADD COLUMN last_time TEXT",
+        lambda conn: fill_raw_block_times(conn),
+        "CREATE INDEX IF NOT EXISTS idx_raw_blocks_last_time ON raw_blocks(last_time)",
+    ],
+    # 10: failed attempts per IP, for the report's top IPs
+    [
+        lambda conn: fill_failed_ip_rollups(conn),
+    ],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+# Apply the migrations the database doesn't have yet, each in its own transaction
+def migrate(conn):
+    version = get_schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(f"Database schema version {version} is newer than this program ({SCHEMA_VERSION})")
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    try:
+        for number in range(version + 1, SCHEMA_VERSION + 1):
+            conn.execute("BEGIN")
+            try:
+                for statement in MIGRATIONS[number - 1]:
+                    if callable(statement):
+                        statement(conn)
+                    else:
+                        conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {number}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    finally:
+        conn.isolation_level = isolation_level
+    return version
+
+# Initialize the database and bring its schema up to date
 def init_db():
     os.makedirs(DATA_DIR, exist_ok=True)
-    if os.path.exists(DB_FILE):
-        return
-    
-    print("Making new database...")
+    new = not os.path.exists(DB_FILE)
+    if new:
+        print("Making new database...")
     conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Main table for all the login events
-    cursor.execute("""
-    CREATE TABLE login_attempts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        timestamp TEXT NOT NULL,
-        ip TEXT NOT NULL,
-        user TEXT NOT NULL,
-        result TEXT NOT NULL,
-        country TEXT,
-        raw_log TEXT 
-    )
-    """)
+    # WAL is stored in the file, so setting it once is enough
+    conn.execute("PRAGMA journal_mode = WAL")
+    old_version = migrate(conn)
+    conn.close()
+    if new:
+        print("Database created successfully.")
+    elif old_version < SCHEMA_VERSION:
+        print(f"Database upgraded from schema version {old_version} to {SCHEMA_VERSION}.")
 
-    # New table to create a profile of each user
-    cursor.execute("""
-    CREATE TABLE user_profiles (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user TEXT NOT NULL UNIQUE,
-        known_countries TEXT NOT NULL, 
-        successful_logins INTEGER DEFAULT 0,
-        failed_logins INTEGER DEFAULT 0
-    )
+# login_attempts is split into time partitions: one table per day or week, listed
+# in login_partitions with its [start, end) range, behind a UNION ALL view that
+# keeps the old name, so readers don't change. Old data is removed by dropping
+# whole partitions instead of running DELETEs.
+PARTITION_SCHEMES = {"day": 1, "week": 7}
+LOGIN_COLUMNS = "id, timestamp, ip, user, result, country, raw_log, raw_ref"
+LOGIN_COLUMNS_V4 = "id, timestamp, ip, user, result, country, raw_log"
+LEGACY_PARTITION = "login_attempts_legacy"
+VIEW_CHUNK = 400  # SQLite allows at most 500 terms in one compound SELECT
+
+def create_login_view(execute, names, columns=LOGIN_COLUMNS):
+    execute("DROP VIEW IF EXISTS login_attempts")
+    selects = [f"SELECT {columns} FROM {name}" for name in names]
+    if not selects:
+        empty = ", ".join(f"NULL AS {column}" for column in columns.split(", "))
+        selects = [f"SELECT {empty} WHERE 0"]
+    chunks = [" UNION ALL ".join(selects[i:i + VIEW_CHUNK]) for i in range(0, len(selects), VIEW_CHUNK)]
+    if len(chunks) > 1:
+        chunks = [f"SELECT * FROM ({chunk})" for chunk in chunks]
+    execute(f"CREATE VIEW login_attempts AS {' UNION ALL '.join(chunks)}")
+
+def login_partition_names(query):
+    return [row[0] for row in query("SELECT name FROM login_partitions ORDER BY start, name")]
+
+# Migration 4: keep the rows of an existing login_attempts table as the legacy partition
+def partition_login_attempts(conn, columns=LOGIN_COLUMNS):
+    kind = conn.execute("SELECT type FROM sqlite_master WHERE name = 'login_attempts'").fetchone()
+    if kind and kind[0] == "table":
+        first, last = conn.execute("SELECT MIN(timestamp), MAX(timestamp) FROM login_attempts").fetchone()
+        if first is None:
+            conn.execute("DROP TABLE login_attempts")
+        else:
+            conn.execute(f"ALTER TABLE login_attempts RENAME TO {LEGACY_PARTITION}")
+            conn.execute("INSERT INTO login_partitions (name, start, end) VALUES (?, ?, ?)",
+                         (LEGACY_PARTITION, first, last))
+    create_login_view(conn.execute, login_partition_names(lambda sql: conn.execute(sql).fetchall()), columns)
+
+# Migration 5
+def add_raw_ref_column(conn):
+    names = login_partition_names(lambda sql: conn.execute(sql).fetchall())
+    for name in names:
+        conn.execute(f"ALTER TABLE {name} ADD COLUMN raw_ref INTEGER")
+    create_login_view(conn.execute, names)
+
+# Migration 9: blocks whose rows were all dropped by retention are deleted
+def fill_raw_block_times(conn):
+    conn.execute(f"""
+    CREATE TEMP TABLE raw_block_times AS
+    SELECT raw_ref / {RAW_BLOCK_LINES} AS id, MAX(timestamp) AS last_time
+    FROM login_attempts WHERE raw_ref IS NOT NULL GROUP BY 1
     """)
+    conn.execute("DELETE FROM raw_blocks WHERE id NOT IN (SELECT id FROM raw_block_times)")
+    conn.execute("UPDATE raw_blocks SET last_time = (SELECT last_time FROM raw_block_times t WHERE t.id = raw_blocks.id)")
+    conn.execute("DROP TABLE raw_block_times")
 
-    # Table to store blocked IPs
-    cursor.execute("""
-    CREATE TABLE blocked_ips (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        ip TEXT NOT NULL UNIQUE,
-        user TEXT,
-        country TEXT,
-        block_time TEXT NOT NULL
-    )
+class LoginPartitions:
+    # Picks (and creates on rollover) the partition table for each new row.
+    # retention_days > 0 drops partitions that ended more than that many days
+    # before the newest partition, checked at startup and on every rollover.
+    def __init__(self, scheme="day", retention_days=0):
+        if scheme not in PARTITION_SCHEMES:
+            raise ValueError(f"Unknown partition scheme {scheme!r}, expected one of {sorted(PARTITION_SCHEMES)}")
+        self.scheme = scheme
+        self.retention_days = max(0, int(retention_days or 0))
+        self.writer = None
+        self.current = None  # (start, end, table) of the last partition used
+        self.created = 0
+        self.dropped = 0
+        self.expired = 0  # rows older than retention that were not stored
+
+    @staticmethod
+    def _schema(writer):
+        return lambda sql: writer.execute(sql, count=False)
+
+    def start_of(self, timestamp):
+        day = timestamp.date()
+        if self.scheme == "week":
+            day -= datetime.timedelta(days=day.weekday())
+        return day
+
+    # Table to insert a row with this timestamp ("YYYY-MM-DD HH:MM:SS") into,
+    # or None when its partition would already be past retention (e.g. a
+    # backfill of older logs after live ingestion): the row is not stored
+    def table_for(self, writer, stamp):
+        current = self.current
+        if writer is self.writer and current and current[0] <= stamp < current[1]:
+            return current[2]
+        with writer.lock:
+            self.writer = writer
+            rows = writer.query(
+                "SELECT start, end, name FROM login_partitions WHERE start <= ? AND ? < end ORDER BY start DESC LIMIT 1",
+                (stamp, stamp)
+            )
+            if rows:
+                self.current = tuple(rows[0])
+                return self.current[2]
+            start, end = self._bounds(stamp)
+            cutoff = self._cutoff(writer)
+            if cutoff is not None and end <= cutoff:
+                self.expired += 1
+                return None
+            self.current = self._create(writer, start, end)
+            self.apply_retention(writer)
+            return self.current[2]
+
+    def _bounds(self, stamp):
+        start = self.start_of(datetime.datetime.strptime(stamp[:10], "%Y-%m-%d"))
+        return start, start + datetime.timedelta(days=PARTITION_SCHEMES[self.scheme])
+
+    # Partitions ending on or before this date are dropped (None: no retention)
+    def _cutoff(self, writer):
+        if not self.retention_days:
+            return None
+        newest = writer.query("SELECT MAX(start) FROM login_partitions")[0][0]
+        if newest is None:
+            return None
+        return datetime.date.fromisoformat(newest[:10]) - datetime.timedelta(days=self.retention_days)
+
+    def _create(self, writer, start, end):
+        name = f"login_attempts_{self.scheme[0]}{start:%Y%m%d}"
+        writer.execute(f"""
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            ip TEXT NOT NULL,
+            user TEXT NOT NULL,
+            result TEXT NOT NULL,
+            country TEXT,
+            raw_log TEXT,
+            raw_ref INTEGER
+        )
+        """, count=False)
+        writer.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_timestamp ON {name}(timestamp)", count=False)
+        writer.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_ip ON {name}(ip)", count=False)
+        writer.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_user_result ON {name}(user, result)", count=False)
+        writer.execute("INSERT OR REPLACE INTO login_partitions (name, start, end) VALUES (?, ?, ?)",
+                       (name, start.isoformat(), end.isoformat()), count=False)
+        create_login_view(self._schema(writer), login_partition_names(writer.query))
+        self.created += 1
+        return start.isoformat(), end.isoformat(), name
+
+    # Drop partitions past the retention period. Returns the dropped table names.
+    def apply_retention(self, writer):
+        if not self.retention_days:
+            return []
+        with writer.lock:
+            cutoff = self._cutoff(writer)
+            if cutoff is None:
+                return []
+            names = [row[0] for row in writer.query("SELECT name FROM login_partitions WHERE end <= ?", (cutoff.isoformat(),))]
+            for name in names:
+                writer.execute(f"DROP TABLE IF EXISTS {name}", count=False)
+                writer.execute("DELETE FROM login_partitions WHERE name = ?", (name,), count=False)
+            if names:
+                # Compressed raw lines of the dropped rows, in the same transaction
+                # (the open block is sealed first: it may only hold dropped rows)
+                if _raw_blocks.writer is writer:
+                    _raw_blocks.seal(writer)
+                writer.execute("DELETE FROM raw_blocks WHERE last_time < ?", (cutoff.isoformat(),), count=False)
+                create_login_view(self._schema(writer), login_partition_names(writer.query))
+                self.dropped += len(names)
+                if self.current and self.current[2] in names:
+                    self.current = None
+            # Rollup buckets of the same period (including any left from before
+            # retention was turned on)
+            _rollups.prune(writer, cutoff.isoformat())
+            return names
+
+    def stats(self):
+        count = len(self.writer.query("SELECT 1 FROM login_partitions")) if self.writer and not self.writer.closed else None
+        return {"scheme": self.scheme, "partitions": count, "created": self.created, "dropped": self.dropped,
+                "expired": self.expired}
+
+_partitions = None
+
+def init_partitions(scheme="day", retention_days=0):
+    global _partitions
+    _partitions = LoginPartitions(scheme, retention_days)
+    _partitions.apply_retention(get_writer())
+    return _partitions
+
+def get_partitions():
+    global _partitions
+    if _partitions is None:
+        _partitions = LoginPartitions()
+    return _partitions
+
+# With db_raw_log "compressed" the raw lines of each write batch are stored
+# together as one zlib block in raw_blocks instead of in the rows; a row keeps
+# raw_log NULL and raw_ref = block id * RAW_BLOCK_LINES + line number. Lines are
+# only decompressed when something asks for them (get_raw_log, RawLogReader).
+RAW_LOG_MODES = ("inline", "compressed")
+RAW_BLOCK_LINES = 65536
+
+def pack_raw_block(lines):
+    return zlib.compress("\n".join(lines).encode("utf-8", "replace"), 6)
+
+def unpack_raw_block(data):
+    return zlib.decompress(data).decode("utf-8").split("\n")
+
+class RawLogBlocks:
+    # Collects the raw lines of the open batch; the block row is reserved on the
+    # first line and filled in by a commit hook, so rows and their block are
+    # committed (or lost) together.
+    def __init__(self):
+        self.writer = None
+        self.block_id = None
+        self.lines = []
+        self.last_time = ""
+        self.blocks = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def add(self, writer, line, stamp):
+        with writer.lock:
+            if writer is not self.writer:
+                self.writer = writer
+                self.block_id = None
+                self.lines = []
+                self.last_time = ""
+                writer.commit_hooks.append(self.seal)
+            elif len(self.lines) >= RAW_BLOCK_LINES:
+                self.seal(writer)
+            if self.block_id is None:
+                self.block_id = writer.execute("INSERT INTO raw_blocks (lines) VALUES (0)", count=False).lastrowid
+            self.lines.append(line)
+            if stamp > self.last_time:
+                self.last_time = stamp
+            return self.block_id * RAW_BLOCK_LINES + len(self.lines) - 1
+
+    def seal(self, writer):
+        if self.block_id is None:
+            return
+        data = pack_raw_block(self.lines)
+        writer.execute("UPDATE raw_blocks SET lines = ?, data = ?, last_time = ? WHERE id = ?",
+                       (len(self.lines), data, self.last_time, self.block_id), count=False)
+        self.blocks += 1
+        self.raw_bytes += sum(len(line) for line in self.lines)
+        self.stored_bytes += len(data)
+        self.block_id = None
+        self.lines = []
+        self.last_time = ""
+
+    # Line of the open block, or None if ref points to a stored block
+    def pending(self, ref):
+        block_id, index = divmod(ref, RAW_BLOCK_LINES)
+        if block_id == self.block_id:
+            return self.lines[index]
+        return None
+
+    def stats(self):
+        ratio = self.raw_bytes / self.stored_bytes if self.stored_bytes else 0.0
+        return {"blocks": self.blocks, "raw_bytes": self.raw_bytes, "stored_bytes": self.stored_bytes,
+                "ratio": round(ratio, 1)}
+
+class RawLogReader:
+    # Resolves (raw_log, raw_ref) pairs on any connection, keeping the last few
+    # decompressed blocks. query(sql, params) must return rows.
+    def __init__(self, query, max_blocks=8):
+        self.query = query
+        self.max_blocks = max_blocks
+        self.blocks = collections.OrderedDict()
+
+    def get(self, raw_log, raw_ref):
+        if raw_ref is None:
+            return raw_log
+        block_id, index = divmod(raw_ref, RAW_BLOCK_LINES)
+        lines = self.blocks.get(block_id)
+        if lines is None:
+            rows = self.query("SELECT data FROM raw_blocks WHERE id = ?", (block_id,))
+            if not rows or rows[0][0] is None:
+                return None
+            lines = unpack_raw_block(rows[0][0])
+            self.blocks[block_id] = lines
+            if len(self.blocks) > self.max_blocks:
+                self.blocks.popitem(last=False)
+        else:
+            self.blocks.move_to_end(block_id)
+        return lines[index] if index < len(lines) else None
+
+_raw_mode = "inline"
+_raw_blocks = RawLogBlocks()
+_raw_reader = None
+
+def set_raw_log_mode(mode):
+    global _raw_mode
+    if mode not in RAW_LOG_MODES:
+        raise ValueError(f"Unknown raw log mode {mode!r}, expected one of {list(RAW_LOG_MODES)}")
+    _raw_mode = mode
+
+def get_raw_log_stats():
+    return {"mode": _raw_mode, **_raw_blocks.stats()}
+
+# Raw text of a login attempt row, decompressing its block only when needed
+def get_raw_log(raw_log, raw_ref):
+    global _raw_reader
+    if raw_ref is None:
+        return raw_log
+    line = _raw_blocks.pending(raw_ref)
+    if line is not None:
+        return line
+    writer = get_writer()
+    if _raw_reader is None or _raw_reader.query != writer.query:
+        _raw_reader = RawLogReader(writer.query)
+    return _raw_reader.get(raw_log, raw_ref)
+
+# Pre-aggregated counts so reports don't scan login_attempts/alerts:
+#   login_rollups: attempts per hour by country, result, ip and user, failed
+#                  attempts per hour by ip (dim "failed_ip"), and per minute
+#                  by result
+#   login_totals:  all-time attempts by the same dimensions (top-K via index)
+#   alert_totals:  alerts per IP
+# Counts are accumulated in memory and upserted by a commit hook, so they are
+# committed in the same transaction as the rows they count.
+ROLLUP_DIMS = ("country", "result", "ip", "user")
+FAILED_RESULT = "fail"
+
+# Migration 6
+def fill_rollups(conn):
+    for dim in ROLLUP_DIMS:
+        conn.execute(f"""
+        INSERT INTO login_rollups (period, dim, bucket, key, count)
+        SELECT 'hour', '{dim}', substr(timestamp, 1, 13), COALESCE({dim}, ''), COUNT(*)
+        FROM login_attempts GROUP BY 3, 4
+        """)
+    conn.execute("""
+    INSERT INTO login_rollups (period, dim, bucket, key, count)
+    SELECT 'minute', 'result', substr(timestamp, 1, 16), result, COUNT(*)
+    FROM login_attempts GROUP BY 3, 4
+    """)
+    conn.execute("""
+    INSERT INTO login_totals (dim, key, count)
+    SELECT dim, key, SUM(count) FROM login_rollups WHERE period = 'hour' GROUP BY dim, key
+    """)
+    conn.execute("""
+    INSERT INTO alert_totals (ip, count, last_alert)
+    SELECT ip, COUNT(*), MAX(alert_time) FROM alerts WHERE ip IS NOT NULL GROUP BY ip
     """)
 
-    # Table to store alerts
-    cursor.execute("""
-    CREATE TABLE alerts (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        ip TEXT,
-        user TEXT,
-        country TEXT,
-        alert_time TEXT NOT NULL,
-        reason TEXT NOT NULL
-    )
+# Migration 10. Rows already dropped by retention are not counted in the totals.
+def fill_failed_ip_rollups(conn):
+    conn.execute("""
+    INSERT INTO login_rollups (period, dim, bucket, key, count)
+    SELECT 'hour', 'failed_ip', substr(timestamp, 1, 13), ip, COUNT(*)
+    FROM login_attempts WHERE result = ? GROUP BY 3, 4
+    """, (FAILED_RESULT,))
+    conn.execute("""
+    INSERT INTO login_totals (dim, key, count)
+    SELECT dim, key, SUM(count) FROM login_rollups WHERE period = 'hour' AND dim = 'failed_ip' GROUP BY key
     """)
 
-    conn.commit()
-    conn.close()
-    print("Database created successfully.")
+class Rollups:
+    def __init__(self):
+        self.writer = None
+        self.buckets = collections.Counter()
+        self.totals = collections.Counter()
+        self.alerts = {}  # ip -> [count, last alert time]
+        self.flushes = 0
+
+    def _attach(self, writer):
+        if writer is not self.writer:
+            self.writer = writer
+            self.buckets.clear()
+            self.totals.clear()
+            self.alerts.clear()
+            writer.commit_hooks.append(self.flush)
+
+    def add_attempt(self, writer, stamp, ip, user, result, country):
+        with writer.lock:
+            self._attach(writer)
+            hour = stamp[:13]
+            buckets, totals = self.buckets, self.totals
+            for dim, key in (("country", country or ""), ("result", result), ("ip", ip), ("user", user)):
+                buckets["hour", dim, hour, key] += 1
+                totals[dim, key] += 1
+            if result == FAILED_RESULT:
+                buckets["hour", "failed_ip", hour, ip] += 1
+                totals["failed_ip", ip] += 1
+            buckets["minute", "result", stamp[:16], result] += 1
 
-# Add a new log attempt to the logs table
+    def add_alert(self, writer, ip, stamp):
+        if ip is None:
+            return
+        with writer.lock:
+            self._attach(writer)
+            entry = self.alerts.get(ip)
+            if entry is None:
+                self.alerts[ip] = [1, stamp]
+            else:
+                entry[0] += 1
+                entry[1] = max(entry[1], stamp)
+
+    # Drop hour/minute buckets before `cutoff` (a date), stored or pending,
+    # along with the partitions they summarize. The all-time totals are kept.
+    def prune(self, writer, cutoff):
+        with writer.lock:
+            for dim in (*ROLLUP_DIMS, "failed_ip"):
+                writer.execute("DELETE FROM login_rollups WHERE period = 'hour' AND dim = ? AND bucket < ?",
+                               (dim, cutoff), count=False)
+            writer.execute("DELETE FROM login_rollups WHERE period = 'minute' AND dim = 'result' AND bucket < ?",
+                           (cutoff,), count=False)
+            if writer is self.writer:
+                for key in [key for key in self.buckets if key[2] < cutoff]:
+                    del self.buckets[key]
+
+    def flush(self, writer):
+        if self.buckets:
+            writer.executemany(
+                "INSERT INTO login_rollups (period, dim, bucket, key, count) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(period, dim, bucket, key) DO UPDATE SET count = count + excluded.count",
+                [(*key, count) for key, count in self.buckets.items()], count=False
+            )
+            writer.executemany(
+                "INSERT INTO login_totals (dim, key, count) VALUES (?, ?, ?) "
+                "ON CONFLICT(dim, key) DO UPDATE SET count = count + excluded.count",
+                [(*key, count) for key, count in self.totals.items()], count=False
+            )
+        if self.alerts:
+            writer.executemany(
+                "INSERT INTO alert_totals (ip, count, last_alert) VALUES (?, ?, ?) "
+                "ON CONFLICT(ip) DO UPDATE SET count = count + excluded.count, "
+                "last_alert = max(last_alert, excluded.last_alert)",
+                [(ip, count, last) for ip, (count, last) in self.alerts.items()], count=False
+            )
+        if self.buckets or self.alerts:
+            self.flushes += 1
+        self.buckets.clear()
+        self.totals.clear()
+        self.alerts.clear()
+
+_rollups = Rollups()
+
+# Add a new log attempt to its login_attempts partition
 def add_login_attempt(timestamp, ip, user, result, country, raw_log):
-    conn = get_db_connection()
-    conn.execute(
-        "INSERT INTO login_attempts (timestamp, ip, user, result, country, raw_log) VALUES (?, ?, ?, ?, ?, ?)",
-        (timestamp.strftime("%Y-%m-%d %H:%M:%S"), ip, user, result, country, raw_log)
+    writer = get_writer()
+    stamp = timestamp.strftime("%Y-%m-%d %H:%M:%S")
+    table = get_partitions().table_for(writer, stamp)
+    if table is None:
+        return  # Already past retention
+    if type(raw_log) is not str:
+        raw_log = str(raw_log)  # e.g. a parser.EventRecord, rendered only now
+    raw_ref = None
+    if _raw_mode == "compressed":
+        raw_ref = _raw_blocks.add(writer, raw_log, stamp)
+        raw_log = None
+    _rollups.add_attempt(writer, stamp, ip, user, result, country)
+    writer.execute(
+        f"INSERT INTO {table} (timestamp, ip, user, result, country, raw_log, raw_ref) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (stamp, ip, user, result, country, raw_log, raw_ref)
     )
-    conn.commit()
-    conn.close()
 
 # Add a new blocked IP entry to the blocked_ips table
 def add_blocked_ip(ip, user, country, timestamp):
-    conn = get_db_connection()
-    conn.execute(
+    get_writer().execute(
         "INSERT OR IGNORE INTO blocked_ips (ip, user, country, block_time) VALUES (?, ?, ?, ?)",
         (ip, user, country, timestamp.strftime("%Y-%m-%d %H:%M:%S"))
     )
-    conn.commit()
-    conn.close()
 
 # Add a new alert entry to the alerts table
 def add_alert(ip, user, country, timestamp, reason):
-    conn = get_db_connection()
-    conn.execute(
+    writer = get_writer()
+    stamp = timestamp.strftime("%Y-%m-%d %H:%M:%S")
+    _rollups.add_alert(writer, ip, stamp)
+    writer.execute(
         "INSERT INTO alerts (ip, user, country, alert_time, reason) VALUES (?, ?, ?, ?, ?)",
-        (ip, user, country, timestamp.strftime("%Y-%m-%d %H:%M:%S"), reason)
+        (ip, user, country, stamp, reason)
     )
-    conn.commit()
-    conn.close()
 
 # Return a set with all blocked IPs
 def get_all_blocked_ips():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT ip FROM blocked_ips")
-    ips = {row["ip"] for row in cursor.fetchall()}
-    conn.close()
-    return ips
+    rows = get_writer().query("SELECT ip FROM blocked_ips")
+    return {row["ip"] for row in rows}
 
 # Check if an IP is already in the alert list
 def is_ip_alerted(ip:str) -> bool:
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM alerts WHERE ip =?", (ip,))
-    result = cursor.fetchone()
-    conn.close()
-    return result is not None
+    rows = get_writer().query("SELECT 1 FROM alerts WHERE ip = ? LIMIT 1", (ip,))
+    return bool(rows)
+
+class UserProfile:
+    __slots__ = ("user", "known_countries", "successful_logins", "failed_logins")
+
+    def __init__(self, user, known_countries=(), successful_logins=0, failed_logins=0):
+        self.user = user
+        self.known_countries = set(known_countries)
+        self.successful_logins = successful_logins
+        self.failed_logins = failed_logins
+
+    def as_dict(self):
+        return {
+            "user": self.user,
+            "known_countries": ",".join(sorted(self.known_countries)),
+            "successful_logins": self.successful_logins,
+            "failed_logins": self.failed_logins,
+        }
+
+class ProfileCache:
+    # Hot user profiles kept in memory (LRU, max_size entries). Counter increments
+    # and new countries only change the cached object; changed profiles are written
+    # back together as one batch of upserts when max_dirty of them accumulate,
+    # after max_latency seconds, when they are evicted, and on flush()/shutdown.
+    # Users without a profile are cached as None so failures for unknown users
+    # don't hit the database either.
+    UPSERT = (
+        "INSERT INTO user_profiles (user, known_countries, successful_logins, failed_logins) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(user) DO UPDATE SET known_countries = excluded.known_countries, "
+        "successful_logins = excluded.successful_logins, failed_logins = excluded.failed_logins"
+    )
+
+    def __init__(self, max_size=10000, max_dirty=1000, max_latency=DEFAULT_MAX_LATENCY):
+        self.max_size = max(1, int(max_size))
+        self.max_dirty = max(1, int(max_dirty))
+        self.max_latency = max_latency
+        self.profiles = collections.OrderedDict()  # user -> UserProfile or None
+        self.dirty = {}                             # user -> UserProfile
+        self.dirty_since = None
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    # Return the cached profile, loading it on a miss; create=True makes a new one
+    def get(self, user, create=False):
+        with self.lock:
+            if user in self.profiles:
+                self.profiles.move_to_end(user)
+                profile = self.profiles[user]
+                self.hits += 1
+            else:
+                self.misses += 1
+                rows = get_writer().query("SELECT * FROM user_profiles WHERE user = ?", (user,))
+                profile = None
+                if rows:
+                    row = rows[0]
+                    countries = [c for c in row["known_countries"].split(",") if c]
+                    profile = UserProfile(user, countries, row["successful_logins"], row["failed_logins"])
+                self._store(user, profile)
+
+            if profile is None and create:
+                profile = UserProfile(user)
+                self.profiles[user] = profile
+                self._mark_dirty(profile)
+            return profile
+
+    def _store(self, user, profile):
+        self.profiles[user] = profile
+        while len(self.profiles) > self.max_size:
+            old_user, _ = self.profiles.popitem(last=False)
+            if old_user in self.dirty:
+                self.flush()
+
+    def _mark_dirty(self, profile):
+        if not self.dirty:
+            self.dirty_since = time.monotonic()
+        self.dirty[profile.user] = profile
+        if len(self.dirty) >= self.max_dirty or time.monotonic() - self.dirty_since >= self.max_latency:
+            self.flush()
+
+    def add_country(self, user, country):
+        with self.lock:
+            profile = self.get(user, create=True)
+            if country not in profile.known_countries:
+                profile.known_countries.add(country)
+                self._mark_dirty(profile)
+
+    # Count a login; failures are only counted for users that already have a profile
+    def record_login(self, user, success=False):
+        with self.lock:
+            profile = self.get(user, create=success)
+            if profile is None:
+                return
+            if success:
+                profile.successful_logins += 1
+            else:
+                profile.failed_logins += 1
+            self._mark_dirty(profile)
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            rows = [(p.user, ",".join(sorted(p.known_countries)), p.successful_logins, p.failed_logins)
+                    for p in self.dirty.values()]
+            get_writer().executemany(self.UPSERT, rows)
+            self.writes += len(rows)
+            self.dirty.clear()
+            self.dirty_since = None
+
+    def stats(self):
+        with self.lock:
+            return {"size": len(self.profiles), "dirty": len(self.dirty),
+                    "hits": self.hits, "misses": self.misses, "writes": self.writes}
+
+_profiles = None
+
+def init_profile_cache(max_size=10000, max_dirty=1000, max_latency=DEFAULT_MAX_LATENCY):
+    global _profiles
+    if _profiles is not None:
+        _profiles.flush()
+    _profiles = ProfileCache(max_size, max_dirty, max_latency)
+    return _profiles
+
+def get_profile_cache():
+    global _profiles
+    if _profiles is None:
+        _profiles = ProfileCache()
+    return _profiles
+
+# Get (or create) the cached profile of a user
+def get_user_profile(user, create=True):
+    return get_profile_cache().get(user, create)
 
 # Get or create user profile from logs table
 def get_or_create_user_profile(user):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM user_profiles WHERE user = ?", (user,))
-    profile = cursor.fetchone()
-    if not profile:
-        cursor.execute("INSERT INTO user_profiles (user, known_countries) VALUES (?, ?)", (user, ""))
-        conn.commit()
-        cursor.execute("SELECT * FROM user_profiles WHERE user = ?", (user,))
-        profile = cursor.fetchone()
-    conn.close()
-    return dict(profile)
+    return get_profile_cache().get(user, create=True).as_dict()
 
 # Update user profile country in logs table
 def update_user_profile_country(user, country):
-    profile = get_or_create_user_profile(user)
-    known_countries = set(profile["known_countries"].split(","))   
-    if country not in known_countries:
-        known_countries.add(country)
-        known_countries.discard('')
-        new_countries_str = ",".join(sorted(list(known_countries)))
-
-        conn = get_db_connection()
-        conn.execute("UPDATE user_profiles SET known_countries = ? WHERE user = ?", (new_countries_str, user))
-        conn.commit()
-        conn.close()
+    get_profile_cache().add_country(user, country)
 
 # Update user profile login counts in logs table
 def update_user_login_counters(user, success= False):
-    conn = get_db_connection()
-    if success:
-        conn.execute("UPDATE user_profiles SET successful_logins = successful_logins + 1 WHERE user = ?", (user,))
-    else:
-        conn.execute("UPDATE user_profiles SET failed_logins = failed_logins + 1 WHERE user = ?", (user,))
-    conn.commit()
-    conn.close()
-    
+    get_profile_cache().record_login(user, success)
+
+# Return persisted IP cache entries that have not expired yet
+def load_ip_cache():
+    rows = get_writer().query(
+        "SELECT ip, country, expires_at FROM ip_cache WHERE expires_at > ? ORDER BY expires_at",
+        (time.time(),)
+    )
+    return [(row["ip"], row["country"], row["expires_at"]) for row in rows]
+
+# Store one IP cache entry
+def save_ip_cache_entry(ip, country, expires_at):
+    get_writer().execute(
+        "INSERT OR REPLACE INTO ip_cache (ip, country, expires_at) VALUES (?, ?, ?)",
+        (ip, country, expires_at)
+    )
+
+# Remove expired IP cache entries
+def purge_ip_cache():
+    get_writer().execute("DELETE FROM ip_cache WHERE expires_at <= ?", (time.time(),))
+
+# Offsets of tailed files from the last run: {path: (dev, ino, offset)}
+def load_file_offsets():
+    rows = get_writer().query("SELECT path, dev, ino, offset FROM file_offsets")
+    return {row["path"]: (row["dev"], row["ino"], row["offset"]) for row in rows}
+
+class Checkpoints:
+    # Latest position of each source (a tailed file's offset, a journal cursor),
+    # written by a commit hook with `upsert` so the stored position always
+    # matches the events committed with it
+    def __init__(self, upsert):
+        self.upsert = upsert
+        self.writer = None
+        self.pending = {}
+
+    def set(self, writer, key, *value):
+        with writer.lock:
+            if writer is not self.writer:
+                self.writer = writer
+                self.pending = {}
+                writer.commit_hooks.append(self.flush)
+            writer.begin()
+            self.pending[key] = value
+
+    def flush(self, writer):
+        if self.pending:
+            writer.executemany(self.upsert, [(key, *value) for key, value in self.pending.items()], count=False)
+            self.pending = {}
+
+_file_offsets = Checkpoints(
+    "INSERT INTO file_offsets (path, dev, ino, offset) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(path) DO UPDATE SET dev = excluded.dev, ino = excluded.ino, offset = excluded.offset"
+)
+
+# Checkpoint a tailed file after the events read before this offset
+def save_file_offset(path, dev, ino, offset):
+    _file_offsets.set(get_writer(), path, dev, ino, offset)
+
+# Journal cursors from the last run: {source: cursor}
+def load_journal_cursors():
+    rows = get_writer().query("SELECT source, cursor FROM journal_cursors")
+    return {row["source"]: row["cursor"] for row in rows}
+
+_journal_cursors = Checkpoints(
+    "INSERT INTO journal_cursors (source, cursor) VALUES (?, ?) "
+    "ON CONFLICT(source) DO UPDATE SET cursor = excluded.cursor"
+)
+
+# Checkpoint a journal source after the entry at this cursor
+def save_journal_cursor(source, cursor):
+    _journal_cursors.set(get_writer(), source, cursor)
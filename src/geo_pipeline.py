@@ -0,0 +1,138 @@
+import time
+import threading
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+CALLBACK = object()  # "ip" of queued callbacks
+
+class GeoPipeline:
+    # Geolocation stage between parsing and detection.
+    # Events are queued in arrival order and released to `release(item, country)`
+    # once the country of their IP is known. Lookups for IPs that are not cached
+    # run in a thread pool (at most `concurrency` at a time) and each IP is looked
+    # up only once, however many queued events share it. An event that waits more
+    # than `deadline` seconds is released with country "UNKNOWN".
+    # Releases are serialized, so detection never runs in two threads at once.
+    def __init__(self, lookup, release, cached=None, logger=None, concurrency=16, deadline=5.0, max_pending=10000):
+        self.lookup = lookup
+        self.release = release
+        self.cached = cached or (lambda ip: None)
+        self.logger = logger
+        self.deadline = deadline
+        self.max_pending = max(1, int(max_pending))
+        self.executor = ThreadPoolExecutor(max_workers=max(1, int(concurrency)), thread_name_prefix="geoip")
+
+        self.pending = collections.deque()  # [ip, item, country or None, deadline]
+        self.inflight = {}                  # ip -> queued events still waiting for it
+        self.cond = threading.Condition()
+        self.closed = False
+
+        self.lookups = 0
+        self.released = 0
+        self.timeouts = 0
+        self.errors = 0
+
+        self.dispatcher = threading.Thread(target=self._dispatch_loop, name="geoip-dispatch", daemon=True)
+        self.dispatcher.start()
+
+    # Queue an event; blocks while max_pending events are waiting (backpressure)
+    def submit(self, ip, item):
+        country = self.cached(ip)
+        with self.cond:
+            while len(self.pending) >= self.max_pending and not self.closed:
+                self.cond.wait()
+            if self.closed:
+                raise RuntimeError("GeoPipeline is closed")
+
+            entry = [ip, item, country, time.monotonic() + self.deadline]
+            if country is None:
+                waiting = self.inflight.get(ip)
+                if waiting is None:
+                    self.inflight[ip] = [entry]
+                    self.lookups += 1
+                    self.executor.submit(self._resolve, ip)
+                else:
+                    waiting.append(entry)
+            self.pending.append(entry)
+            self._drain()
+
+    # Run fn() in release order, right after every event submitted before it
+    # (e.g. to checkpoint a file offset once its events have been written)
+    def call(self, fn):
+        with self.cond:
+            if self.closed:
+                raise RuntimeError("GeoPipeline is closed")
+            self.pending.append([CALLBACK, fn, "", 0.0])
+            self._drain()
+
+    def _resolve(self, ip):
+        try:
+            country = self.lookup(ip)
+        except Exception:
+            country = None
+        with self.cond:
+            for entry in self.inflight.pop(ip, []):
+                entry[2] = country or "UNKNOWN"
+            self.cond.notify_all()
+
+    # Release every event at the head of the queue that is ready or expired
+    def _drain(self):
+        now = time.monotonic()
+        while self.pending:
+            entry = self.pending[0]
+            ip, item, country, deadline = entry
+            if country is None:
+                if now < deadline:
+                    break
+                country = "UNKNOWN"
+                self.timeouts += 1
+                waiting = self.inflight.get(ip)
+                if waiting:
+                    waiting[:] = [e for e in waiting if e is not entry]
+            self.pending.popleft()
+            if ip is CALLBACK:
+                try:
+                    item()
+                except Exception as e:
+                    self.errors += 1
+                    if self.logger:
+                        self.logger.error(f"Error in pipeline callback: {e}")
+                continue
+            self.released += 1
+            try:
+                self.release(item, country)
+            except Exception as e:
+                self.errors += 1
+                if self.logger:
+                    self.logger.error(f"Error processing event for IP {ip}: {e}")
+        self.cond.notify_all()
+
+    def _dispatch_loop(self):
+        with self.cond:
+            while True:
+                self._drain()
+                if self.pending:
+                    self.cond.wait(max(0.0, self.pending[0][3] - time.monotonic()))
+                elif self.closed:
+                    break
+                else:
+                    self.cond.wait()
+
+    # Release everything still queued (waiting at most `deadline`) and stop the workers
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.dispatcher.join()
+        self.executor.shutdown(wait=False)
+
+    def stats(self):
+        with self.cond:
+            return {
+                "pending": len(self.pending),
+                "inflight": len(self.inflight),
+                "lookups": self.lookups,
+                "released": self.released,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+            }
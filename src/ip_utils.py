@@ -1,32 +1,278 @@
+import csv
+import time
+import bisect
+import threading
+import collections
+import array
+import functools
+import ipaddress
 import requests
 import pycountry
 import unicodedata
 
-ip_cache = {}
+try:
+    import maxminddb
+except ImportError:
+    maxminddb = None
+
+class IPCache:
+    # Size-bounded LRU of IP -> country. Each entry expires after ttl seconds;
+    # failed lookups ("UNKNOWN") use the shorter negative_ttl so they are retried.
+    # persist(ip, country, expires_at) is called for every new entry, if given.
+    def __init__(self, max_size=100000, ttl=7 * 86400, negative_ttl=3600, persist=None):
+        self.max_size = max(1, int(max_size))
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.persist = persist
+        self.entries = collections.OrderedDict()  # ip -> (country, expires_at)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, ip):
+        return self.get(ip) is not None
+
+    # Return the cached country or None if missing/expired
+    def get(self, ip):
+        with self.lock:
+            entry = self.entries.get(ip)
+            if entry is None:
+                self.misses += 1
+                return None
+            country, expires_at = entry
+            if expires_at <= time.time():
+                del self.entries[ip]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(ip)
+            self.hits += 1
+            return country
+
+    def set(self, ip, country):
+        ttl = self.negative_ttl if country == "UNKNOWN" else self.ttl
+        expires_at = time.time() + ttl
+        self._store(ip, country, expires_at)
+        if self.persist is not None:
+            self.persist(ip, country, expires_at)
+
+    def _store(self, ip, country, expires_at):
+        with self.lock:
+            self.entries[ip] = (country, expires_at)
+            self.entries.move_to_end(ip)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    # Warm the cache from persisted (ip, country, expires_at) rows, oldest first
+    def load(self, rows):
+        now = time.time()
+        loaded = 0
+        for ip, country, expires_at in rows:
+            if expires_at > now:
+                self._store(ip, country, expires_at)
+                loaded += 1
+        return loaded
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+ip_cache = IPCache()
+
+# Replace the IP cache with one sized from config.yaml
+def configure_ip_cache(config, persist=None):
+    global ip_cache
+    ip_cache = IPCache(
+        max_size=config.get("ip_cache_size", 100000),
+        ttl=config.get("ip_cache_ttl", 7 * 86400),
+        negative_ttl=config.get("ip_cache_negative_ttl", 3600),
+        persist=persist,
+    )
+    return ip_cache
 
 def normalize_country(name: str) -> str:
     nfkd_form = unicodedata.normalize('NFKD', name)
     only_ascii = ''.join([c for c in nfkd_form if not unicodedata.combining(c)])
     return only_ascii.upper().strip()
 
-def get_country_by_ip(ip: str, logger) -> str:
-    if ip in ip_cache:
-        return ip_cache[ip]
+# Turn an ISO alpha-2 code into the normalized country name used everywhere else
+@functools.lru_cache(maxsize=512)
+def country_from_code(country_code: str) -> str:
+    country = pycountry.countries.get(alpha_2=country_code)
+    return normalize_country(country.name) if country else normalize_country(country_code)
+
+def _parse_ip(value: str) -> int:
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    return int(ipaddress.ip_address(value))
+
+class LocalGeoIPResolver:
+    # Offline resolver over a CSV of IP ranges: start_ip,end_ip,country_code[,...]
+    # Addresses may be written dotted (1.0.0.0) or as integers (16777216).
+    # IPv4 ranges are kept in compact arrays and looked up with binary search.
+    name = "local"
+
+    def __init__(self, path):
+        self.path = path
+        self.countries = []
+        self.v4_starts = array.array("L")
+        self.v4_ends = array.array("L")
+        self.v4_country = array.array("H")
+        self.v6_starts = []
+        self.v6_ends = []
+        self.v6_country = []
+        self.load(path)
+
+    def load(self, path):
+        country_index = {}
+        v4, v6 = [], []
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            for row in csv.reader(f):
+                if len(row) < 3 or row[0].startswith("#"):
+                    continue
+                try:
+                    start, end = _parse_ip(row[0]), _parse_ip(row[1])
+                except ValueError:
+                    continue  # Header or malformed row
+                code = row[2].strip().upper()
+                if not code or code in ("-", "ZZ"):
+                    continue
+                if code not in country_index:
+                    country_index[code] = len(self.countries)
+                    self.countries.append(code)
+                entry = (start, end, country_index[code])
+                if end <= 0xFFFFFFFF and ":" not in row[0]:
+                    v4.append(entry)
+                else:
+                    v6.append(entry)
+
+        v4.sort()
+        v6.sort()
+        for start, end, idx in v4:
+            self.v4_starts.append(start)
+            self.v4_ends.append(end)
+            self.v4_country.append(idx)
+        for start, end, idx in v6:
+            self.v6_starts.append(start)
+            self.v6_ends.append(end)
+            self.v6_country.append(idx)
+
+    def __len__(self):
+        return len(self.v4_starts) + len(self.v6_starts)
 
-    try:
-        response = requests.get(f"https://ipinfo.io/{ip}/json", timeout=3)
+    # Return the country code for the IP or None if no range contains it
+    def lookup(self, ip: str):
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if addr.version == 4:
+            starts, ends, countries = self.v4_starts, self.v4_ends, self.v4_country
+        else:
+            starts, ends, countries = self.v6_starts, self.v6_ends, self.v6_country
+        value = int(addr)
+        pos = bisect.bisect_right(starts, value) - 1
+        if pos >= 0 and value <= ends[pos]:
+            return self.countries[countries[pos]]
+        return None
+
+class MaxMindResolver:
+    # Offline resolver over a MaxMind .mmdb file (needs the optional maxminddb package)
+    name = "mmdb"
+
+    def __init__(self, path):
+        if maxminddb is None:
+            raise RuntimeError("maxminddb is not installed; use a CSV database or pip install maxminddb")
+        self.path = path
+        self.reader = maxminddb.open_database(path)
+
+    def lookup(self, ip: str):
+        record = self.reader.get(ip)
+        if not record:
+            return None
+        country = record.get("country") or record.get("registered_country") or {}
+        return country.get("iso_code")
+
+class HttpResolver:
+    # Online lookup through ipinfo.io, kept as a fallback
+    name = "http"
+
+    def __init__(self, timeout=3):
+        self.timeout = timeout
+
+    def lookup(self, ip: str):
+        response = requests.get(f"https://ipinfo.io/{ip}/json", timeout=self.timeout)
         response.raise_for_status()
         data = response.json()
+        return data.get("country")
 
-        if "country" in data:
-            country_code = data["country"]
-            country = pycountry.countries.get(alpha_2=country_code)
-            country_norm = normalize_country(country.name) if country else normalize_country(country_code)
-        else:
-            country_norm = "UNKNOWN"
-    except Exception as e:
-        logger.error(f"Error fetching country for IP {ip}: {e}")
-        country_norm = "UNKNOWN"
+# Resolvers are tried in order until one returns a country code
+resolvers = [HttpResolver()]
+
+def load_geoip_database(path):
+    if path.endswith(".mmdb"):
+        return MaxMindResolver(path)
+    return LocalGeoIPResolver(path)
+
+# Build the resolver chain from config.yaml
+def configure_geoip(config, logger):
+    global resolvers
+    chain = []
+
+    path = config.get("geoip_database")
+    if path:
+        try:
+            resolver = load_geoip_database(path)
+            chain.append(resolver)
+            logger.info(f"Loaded GeoIP database {path}")
+        except Exception as e:
+            logger.error(f"Could not load GeoIP database {path}: {e}")
+
+    if config.get("geoip_http_fallback", True):
+        chain.append(HttpResolver(config.get("geoip_http_timeout", 3)))
+
+    if not chain:
+        logger.warning("No GeoIP resolver configured, every IP will be UNKNOWN.")
+    resolvers = chain
+    return chain
+
+# Return the cached country for the IP without doing any lookup, or None
+def get_cached_country(ip: str):
+    return ip_cache.get(ip)
+
+def get_country_by_ip(ip: str, logger) -> str:
+    cached = ip_cache.get(ip)
+    if cached is not None:
+        return cached
+    return resolve_country(ip, logger)
+
+# Ask the resolver chain for the IP country and store the answer in the cache
+def resolve_country(ip: str, logger) -> str:
+    country_norm = "UNKNOWN"
+    for resolver in resolvers:
+        try:
+            country_code = resolver.lookup(ip)
+        except Exception as e:
+            logger.error(f"Error fetching country for IP {ip} ({resolver.name}): {e}")
+            continue
+        if country_code:
+            country_norm = country_from_code(country_code)
+            break
 
-    ip_cache[ip] = country_norm
-    return country_norm
\ No newline at end of file
+    ip_cache.set(ip, country_norm)
+    return country_norm
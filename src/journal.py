@@ -0,0 +1,143 @@
+import json
+import time
+import datetime
+import functools
+import subprocess
+
+try:
+    from systemd import journal as systemd_journal
+except ImportError:
+    systemd_journal = None
+
+# "sshd" -> "sshd.service"
+def unit_name(service):
+    return service if "." in service else f"{service}.service"
+
+def _text(value):
+    if isinstance(value, list):  # journalctl -o json writes non-UTF-8 fields as byte arrays
+        return bytes(value).decode("utf-8", "ignore")
+    return "" if value is None else str(value)
+
+# Rebuild the line journalctl prints by default ("short" output), which is
+# what the parser formats expect: "Sep  7 12:00:00 host sshd[123]: message"
+def format_entry(entry):
+    stamp = entry.get("__REALTIME_TIMESTAMP")
+    if not isinstance(stamp, datetime.datetime):  # python-systemd already converts it
+        stamp = datetime.datetime.fromtimestamp(int(stamp) / 1e6)
+    host = _text(entry.get("_HOSTNAME")) or "localhost"
+    ident = _text(entry.get("SYSLOG_IDENTIFIER") or entry.get("_COMM")) or _text(entry.get("_SYSTEMD_UNIT"))
+    pid = _text(entry.get("SYSLOG_PID") or entry.get("_PID"))
+    prefix = f"{stamp:%b} {stamp.day:2d} {stamp:%H:%M:%S} {host} {ident}"
+    message = _text(entry.get("MESSAGE"))
+    return f"{prefix}[{pid}]: {message}" if pid else f"{prefix}: {message}"
+
+class JournalSource:
+    # One stream of journal entries for all the given services, matched on
+    # _SYSTEMD_UNIT. Reads through the systemd journal API when python-systemd
+    # is installed, else through "journalctl -o json". Entries are passed as
+    # process_line(line, unit) or, with a checkpoint(source, cursor) function,
+    # process_line(line, unit, done) where done() saves the entry's cursor.
+    # With a cursor from the last run, reading resumes right after it;
+    # without one only new entries are read.
+    name = "journal"
+
+    def __init__(self, services, logger, checkpoint=None, cursor=None, backend="auto",
+                 command="journalctl", restart_delay=5.0):
+        if backend == "auto":
+            backend = "systemd" if systemd_journal is not None else "journalctl"
+        if backend == "systemd" and systemd_journal is None:
+            raise RuntimeError("python-systemd is not installed; use journal_backend: journalctl")
+        self.units = [unit_name(service) for service in services]
+        self.unit_set = set(self.units)
+        self.logger = logger
+        self.checkpoint = checkpoint
+        self.cursor = cursor
+        self.backend = backend
+        self.command = command
+        self.restart_delay = restart_delay
+        self.entries = 0
+        self.skipped = 0
+        self.restarts = 0
+
+    def _handle(self, entry, emit):
+        cursor = _text(entry.get("__CURSOR"))
+        if cursor:
+            self.cursor = cursor
+        unit = _text(entry.get("_SYSTEMD_UNIT"))
+        if unit not in self.unit_set or not entry.get("MESSAGE"):
+            self.skipped += 1
+            return
+        line = format_entry(entry).strip()
+        self.entries += 1
+        if self.checkpoint is None or not cursor:
+            emit(line, unit)
+        else:
+            emit(line, unit, functools.partial(self.checkpoint, self.name, cursor))
+
+    # Read entries until stopped (follow) or until the end of the journal
+    def run(self, emit, follow=True):
+        self.logger.info(f"Reading the journal ({self.backend}) for {', '.join(self.units)}"
+                         + (" after the saved cursor" if self.cursor else ""))
+        if self.backend == "systemd":
+            self._run_systemd(emit, follow)
+            return
+        while True:
+            code = self._run_journalctl(emit, follow)
+            if not follow:
+                return
+            # journalctl should never end while following (e.g. journald restarted)
+            self.restarts += 1
+            self.logger.warning(f"journalctl exited with code {code}, restarting in {self.restart_delay}s")
+            time.sleep(self.restart_delay)
+
+    def command_args(self, follow):
+        args = [self.command, "-o", "json", "--no-pager"]
+        if follow:
+            args.append("-f")
+        if self.cursor:
+            args += ["--after-cursor", self.cursor]
+        elif follow:
+            args += ["-n", "0"]
+        return args + [f"_SYSTEMD_UNIT={unit}" for unit in self.units]
+
+    def _run_journalctl(self, emit, follow):
+        process = subprocess.Popen(self.command_args(follow), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            for raw in process.stdout:
+                try:
+                    entry = json.loads(raw)
+                except ValueError:
+                    self.logger.error(f"Invalid journal entry: {raw[:200]!r}")
+                    continue
+                self._handle(entry, emit)
+            _, errors = process.communicate()
+            if process.returncode:
+                self.logger.error(f"journalctl: {errors.decode('utf-8', 'ignore').strip()}")
+            return process.returncode
+        finally:
+            if process.poll() is None:
+                process.terminate()
+                process.wait()
+
+    def _run_systemd(self, emit, follow):
+        reader = systemd_journal.Reader()
+        for unit in self.units:
+            reader.add_match(_SYSTEMD_UNIT=unit)  # matches on one field are ORed
+        if self.cursor:
+            reader.seek_cursor(self.cursor)
+            reader.get_next()  # the entry at the cursor itself was already processed
+        elif follow:
+            reader.seek_tail()
+            reader.get_previous()
+        try:
+            while True:
+                for entry in reader:
+                    self._handle(entry, emit)
+                if not follow:
+                    return
+                reader.wait(1)
+        finally:
+            reader.close()
+
+    def stats(self):
+        return {"entries": self.entries, "skipped": self.skipped, "restarts": self.restarts}
@@ -1,14 +1,27 @@
 import os
 import re
+import json
+import bz2
+import gzip
+import mmap
+import socket
+import struct
 import datetime
-from typing import Optional, Tuple, Dict
+from itertools import accumulate
+from typing import Optional, Tuple, Dict, Callable
+from time_utils import parse_iso_timestamp, parse_apache_timestamp, parse_syslog_timestamp, from_epoch
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Define a type for the log entry
 LOG_FORMATS: Dict[str, Dict] = {
     "default": {
         "regex": r"(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}), IP: ([\d\.]+), user: ([^,]+), action: (\w+), result: (\w+)",
         "parser": lambda m: (
-            datetime.datetime.strptime(m.group(1), "%Y-%m-%d %H:%M:%S"),
+            parse_iso_timestamp(m.group(1)),
             m.group(2),   #ip
             m.group(3),   #user
             m.group(4),   #action
@@ -18,7 +31,7 @@ LOG_FORMATS: Dict[str, Dict] = {
     "apache": {
         "regex": r'((?:\d{1,3}\.){3}\d{1,3}) - (.*?) \[(\d{2}/\w{3}/\d{4}:\d{2}:\d{2}:\d{2}) [+\-]\d{4}\] "(\S+) (.*?) (\S+)" (\d{3}) (\d+)',
         "parser": lambda m: (
-            datetime.datetime.strptime(m.group(3), "%d/%b/%Y:%H:%M:%S"),
+            parse_apache_timestamp(m.group(3)),
             m.group(1),  # ip
             m.group(2),  # user
             m.group(4),  # action
@@ -28,7 +41,7 @@ LOG_FORMATS: Dict[str, Dict] = {
     "ssh": {
         "regex": r'(\w{3}\s+\d+\s+\d{2}:\d{2}:\d{2}) .*sshd.* (Failed|Accepted) password for (invalid user )?(.+?)(?=\s+from) from ((?:\d{1,3}\.){3}\d{1,3})',
         "parser": lambda m: (
-            datetime.datetime.strptime(m.group(1), "%b %d %H:%M:%S").replace(year=datetime.datetime.now().year),
+            parse_syslog_timestamp(m.group(1)),
             m.group(5),  # ip
             m.group(4),  # user 
             "ssh_login", # action
@@ -37,14 +50,197 @@ LOG_FORMATS: Dict[str, Dict] = {
     },
 }
 
-def get_log_files(log_dir):
-    return (os.path.join(log_dir, f) for f in os.listdir(log_dir) if f.endswith(".log") or f.endswith(".csv"))
+# Precompile every format once
+for fmt in LOG_FORMATS.values():
+    fmt["compiled"] = re.compile(fmt["regex"])
+
+READ_BUFFER_SIZE = 1024 * 1024
+
+def _base_name(name: str) -> str:
+    for ext in (".gz", ".bz2"):
+        if name.endswith(ext):
+            return name[:-len(ext)]
+    return name
+
+# Matches live files (auth.log, events.csv) and rotated ones (auth.log.1, access.log-20250901.gz)
+def is_log_file(name: str) -> bool:
+    base = _base_name(name)
+    return (base.endswith(".log") or base.endswith(".csv") or base.endswith(".jsonl")
+            or ".log." in base or ".log-" in base or ".csv." in base or ".jsonl." in base
+            or is_event_file(base))
+
+# Binary event record files written by scripts/windows_agent.py (not ".evt":
+# that is the extension of legacy Windows Event Log files)
+def is_event_file(name: str) -> bool:
+    base = _base_name(name)
+    return base.endswith(".lmevt") or ".lmevt." in base
+
+def get_log_files(log_dir, recursive=False):
+    if not recursive:
+        return (os.path.join(log_dir, f) for f in os.listdir(log_dir) if is_log_file(f))
+    return (os.path.join(root, f) for root, _, names in os.walk(log_dir) for f in names if is_log_file(f))
+
+# Appends at least this big are read through mmap when the caller asks for it
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+# Open a plain, gzip or bz2 log file in binary mode (lines are decoded per chunk)
+def open_log_file(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    return open(path, "rb", buffering=0)
+
+def _read_blocks(f, offset, chunk_size, use_mmap):
+    if use_mmap:
+        try:
+            size = os.fstat(f.fileno()).st_size
+        except (OSError, AttributeError, ValueError):
+            size = 0
+        if size - offset >= MMAP_THRESHOLD:
+            # Only up to the size seen now; a truncation while mapped raises SIGBUS,
+            # so this stays opt-in for files that are appended to, never rewritten
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as m:
+                for start in range(offset, size, chunk_size):
+                    yield m[start:start + chunk_size]
+            return
+    f.seek(offset)
+    read = f.read
+    while True:
+        block = read(chunk_size)
+        if not block:
+            return
+        yield block
+
+# Read a binary file from `offset` in large chunks and yield (lines, ends) per
+# chunk: the stripped lines (empty ones included) and, with with_offsets, the
+# byte offset right after each one. Each chunk is decoded once, and the bytes
+# after its last "\n" are carried into the next one. At EOF a line without
+# "\n" is still being written: it is left unread unless final is set.
+def read_line_chunks(f, offset=0, chunk_size=READ_BUFFER_SIZE, final=False,
+                     with_offsets=False, use_mmap=False):
+    carry = b""
+    pos = offset
+    ends = None
+    for block in _read_blocks(f, offset, chunk_size, use_mmap):
+        data = carry + block if carry else block
+        cut = data.rfind(b"\n") + 1
+        if not cut:
+            carry = data
+            continue
+        body, carry = data[:cut - 1], data[cut:]
+        # "\n" is never part of a multibyte sequence, so the decoded text
+        # splits into exactly the same lines as the bytes
+        text = body.decode("utf-8", "ignore")
+        pieces = text.split("\n")
+        lines = list(map(str.strip, pieces))
+        if with_offsets:
+            if len(text) != len(body):
+                pieces = body.split(b"\n")  # not plain ASCII: count bytes, not characters
+            lengths = list(map((1).__add__, map(len, pieces)))
+            lengths[0] += pos
+            ends = list(accumulate(lengths))
+        pos += cut
+        yield lines, ends
+    if carry and final:
+        yield [carry.decode("utf-8", "ignore").strip()], [pos + len(carry)] if with_offsets else None
+
+# Binary event records (scripts/windows_agent.py, OUTPUT_FORMAT = "binary").
+# After EVENT_MAGIC, each record is EVENT_HEADER followed by the IP text (only
+# when it is not IPv4) and the user name in UTF-8:
+#   length u16 (bytes after this field) | time u32 (epoch seconds, UTC)
+#   | ipv4 u32 (0: the IP follows as text) | result u8 (1 success, 0 fail) | ip_len u8
+EVENT_MAGIC = b"LAEVT01\n"
+EVENT_HEADER = struct.Struct("<HIIBB")
+
+class EventRecord(tuple):
+    # A record whose fields are already known, as parse_log_line returns them.
+    # It is passed on in place of a line; str() gives the equivalent Windows
+    # CSV line, which is only built when it is stored as raw_log.
+    __slots__ = ()
+
+    def __str__(self):
+        timestamp, ip, user, action, result = self
+        return f"{timestamp.isoformat(' ')},{ip},{user},{action},{result}"
+
+# IPv4 int -> text of recent records; a plain dict, cleared when full, since an
+# LRU's bookkeeping costs more than the conversion when addresses don't repeat
+IPV4_CACHE_SIZE = 65536
+_ipv4_texts: Dict[int, str] = {}
+
+# Whether the binary file `f` starts like an event record file. A header that
+# is still being written (empty or a prefix of EVENT_MAGIC) counts as one.
+def has_event_magic(f) -> bool:
+    f.seek(0)
+    return EVENT_MAGIC.startswith(f.read(len(EVENT_MAGIC)))
+
+# Read event records from `offset` in large chunks and yield (lines, ends)
+# like read_line_chunks, with an EventRecord per record. The fixed fields are
+# unpacked in place from the chunk and no text is built; an incomplete record at
+# the end is carried over, or left for the next read at EOF (also with final: it
+# can't be decoded). Records are variable-length, so struct.iter_unpack can't
+# walk them.
+def read_event_records(f, offset=0, chunk_size=READ_BUFFER_SIZE, final=False, with_offsets=False):
+    if offset == 0:
+        f.seek(0)
+        magic = f.read(len(EVENT_MAGIC))
+        if len(magic) < len(EVENT_MAGIC):
+            return
+        if magic != EVENT_MAGIC:
+            raise ValueError("Not an event record file (bad header)")
+        offset = len(EVENT_MAGIC)
+    unpack = EVENT_HEADER.unpack_from
+    header = EVENT_HEADER.size
+    new_record = tuple.__new__
+    ipv4_texts = _ipv4_texts
+    ntoa = socket.inet_ntoa
+    last_stamp = timestamp = None
+    carry = b""
+    pos = offset
+    ends = None
+    for block in _read_blocks(f, offset, chunk_size, False):
+        data = carry + block if carry else block
+        size = len(data)
+        lines = []
+        if with_offsets:
+            ends = []
+        start = 0
+        while start + header <= size:
+            length, stamp, ipv4, success, ip_len = unpack(data, start)
+            end = start + 2 + length
+            if end > size:
+                break
+            field = start + header
+            if ip_len:
+                ip = data[field:field + ip_len].decode("utf-8", "ignore")
+            else:
+                ip = ipv4_texts.get(ipv4)
+                if ip is None:
+                    if len(ipv4_texts) >= IPV4_CACHE_SIZE:
+                        ipv4_texts.clear()
+                    ip = ipv4_texts[ipv4] = ntoa(ipv4.to_bytes(4, "big"))
+            if stamp != last_stamp:
+                last_stamp = stamp
+                timestamp = from_epoch(stamp)[0]
+            user = data[field + ip_len:end].decode("utf-8", "ignore")
+            lines.append(new_record(EventRecord, (timestamp, ip, user, "login", "success" if success else "fail")))
+            if with_offsets:
+                ends.append(pos + end)
+            start = end
+        carry = data[start:]
+        pos += start
+        if lines:
+            yield lines, ends
 
 def read_logs(files):
     for file in files:
-        with open(file, "r", encoding="utf-8") as f:
-            for line in f:
-                yield line.strip()
+        with open_log_file(file) as f:
+            if is_event_file(file):
+                chunks = read_event_records(f, final=True)
+            else:
+                chunks = read_line_chunks(f, final=True)
+            for lines, _ in chunks:
+                yield from filter(None, lines)
 
 def parse_windows_csv(line: str) -> Optional[Tuple]:
     try:
@@ -52,7 +248,7 @@ def parse_windows_csv(line: str) -> Optional[Tuple]:
         if len(parts) < 5: return None
         if parts[0] == "Timestamp": return None # Skip header
 
-        timestamp = datetime.datetime.strptime(parts[0], "%Y-%m-%d %H:%M:%S")
+        timestamp = parse_iso_timestamp(parts[0])
         ip = parts[1]
         user = parts[2]
         action = parts[3]
@@ -64,22 +260,184 @@ def parse_windows_csv(line: str) -> Optional[Tuple]:
     except Exception:
         return None
 
-def parse_log_line(line: str) -> Optional[Tuple]:
+# JSON lines (e.g. nginx `log_format ... escape=json`, app servers): each
+# field is looked up under the first key that is present, with dotted keys
+# for nested objects. Replaced by json_fields in config.yaml.
+JSON_FIELDS: Dict[str, list] = {
+    "time": ["time", "timestamp", "@timestamp", "time_iso8601", "time_local"],
+    "ip": ["ip", "remote_addr", "client_ip", "src_ip"],
+    "user": ["user", "remote_user", "username"],
+    "action": ["action", "request_method", "method"],
+    "status": ["status", "result"],
+}
+
+# orjson when installed, the standard library otherwise (both raise ValueError)
+json_loads = orjson.loads if orjson is not None else json.loads
+JSON_DECODER = "orjson" if orjson is not None else "json"
+
+_json_paths: Dict[str, list] = {}
+
+def configure_json_fields(mapping: Optional[Dict] = None):
+    fields = dict(JSON_FIELDS)
+    for field, keys in (mapping or {}).items():
+        if field not in JSON_FIELDS:
+            raise ValueError(f"Unknown JSON field: {field!r}")
+        fields[field] = [keys] if isinstance(keys, str) else list(keys)
+    _json_paths.clear()
+    for field, keys in fields.items():
+        _json_paths[field] = [key.split(".") if "." in key else key for key in keys]
+
+configure_json_fields()
+
+# The key that matched is moved to the front, so in a homogeneous file the
+# first lookup hits
+def _json_value(record: dict, paths: list):
+    for i, path in enumerate(paths):
+        if type(path) is str:
+            value = record.get(path)
+        else:
+            value = record
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+        if value is not None and value != "":
+            if i:
+                paths.insert(0, paths.pop(i))
+            return value
+    return None
+
+_last_json_time = (None, None)
+
+# Divisors to seconds for epoch values below each bound: seconds (up to
+# year 5138), milliseconds, microseconds, nanoseconds
+EPOCH_UNITS = ((1e11, 1), (1e14, 1000), (1e17, 1000000), (1e20, 1000000000))
+
+# Epoch seconds, ms, µs or ns as local time, "2025-09-07T12:34:56+02:00"
+# ($time_iso8601) or "07/Sep/2025:12:34:56 +0200" ($time_local). As with the
+# Apache format, the UTC offset is ignored.
+def _json_timestamp(value) -> datetime.datetime:
+    global _last_json_time
+    if value == _last_json_time[0]:
+        return _last_json_time[1]
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        divisor = next((unit for bound, unit in EPOCH_UNITS if 0 <= value < bound), None)
+        if divisor is None:
+            raise ValueError(f"Epoch timestamp out of range: {value!r}")
+        result = datetime.datetime.fromtimestamp(int(value // divisor))
+    elif isinstance(value, str) and value[4:5] == "-" and value[10:11] in ("T", " "):
+        result = parse_iso_timestamp(f"{value[:10]} {value[11:19]}")
+    elif isinstance(value, str) and value[2:3] == "/":
+        result = parse_apache_timestamp(value[:20])
+    else:
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    _last_json_time = (value, result)
+    return result
+
+def parse_json_line(line: str) -> Optional[Tuple]:
+    if not line.startswith("{"):
+        return None
+    try:
+        record = json_loads(line)
+        paths = _json_paths
+        ip = _json_value(record, paths["ip"])
+        stamp = _json_value(record, paths["time"])
+        if ip is None or stamp is None:
+            return None
+        user = _json_value(record, paths["user"])
+        action = _json_value(record, paths["action"])
+        status = _json_value(record, paths["status"])
+        return (
+            _json_timestamp(stamp),
+            str(ip),
+            "-" if user is None else str(user),
+            "-" if action is None else str(action),
+            "-" if status is None else str(status),
+        )
+    except (ValueError, AttributeError, OverflowError, OSError):
+        return None
+
+def _regex_parser(fmt_name: str) -> Callable[[str], Optional[Tuple]]:
+    fmt = LOG_FORMATS[fmt_name]
+    compiled = fmt["compiled"]
+    build = fmt["parser"]
+
+    def parse(line: str) -> Optional[Tuple]:
+        match = compiled.search(line)
+        if not match:
+            return None
+        try:
+            return build(match)
+        except Exception as e:
+            print(f"[Error parsing line as {fmt_name}] {line} => {e}") # DEBUG LINE
+            return None
+    return parse
+
+# Every supported format, keyed by name
+FORMAT_PARSERS: Dict[str, Callable[[str], Optional[Tuple]]] = {
+    name: _regex_parser(name) for name in LOG_FORMATS
+}
+FORMAT_PARSERS["windows_csv"] = parse_windows_csv
+FORMAT_PARSERS["json"] = parse_json_line
+
+# Last format that matched for each source file, for at most MAX_SOURCES
+# sources (the oldest entry is dropped first: sources can come from the network)
+MAX_SOURCES = 4096
+source_formats: Dict[str, str] = {}
+
+def _remember_format(source: str, fmt_name: str):
+    if source not in source_formats and len(source_formats) >= MAX_SOURCES:
+        del source_formats[next(iter(source_formats))]
+    source_formats[source] = fmt_name
+
+# Pick the format a line most likely belongs to by looking at its first bytes.
+# The anchored prefixes come before the "sshd" keyword, which can also appear
+# in a URL or user name of the other formats.
+def detect_format(line: str) -> Optional[str]:
+    first = line[0]
+    if first == "{":
+        return "json"
+    if first.isdigit():
+        if line[4:5] == "-":  # Starts with a YYYY-MM-DD date
+            return "default" if line.startswith(", IP:", 19) else "windows_csv"
+        return "apache"  # Starts with the client IP
+    if "sshd" in line:
+        return "ssh"
+    if line.startswith("Timestamp,"):
+        return "windows_csv"  # CSV header
+    return None
+
+def parse_log_line(line: str, source: Optional[str] = None) -> Optional[Tuple]:
+    if type(line) is EventRecord:
+        return line
     if not line or not line.strip():
         return None
-    
-    if "n" in line:
-        csv_data = parse_windows_csv(line)
-        if csv_data:
-            return csv_data
-        
-    for fmt_name, fmt in LOG_FORMATS.items():
-        match = re.search(fmt["regex"], line)
-        if match:
-            try:
-                return fmt["parser"](match)
-            except Exception as e:
-                print(f"[Error parsing line as {fmt_name}] {line} => {e}") # DEBUG LINE
-                return None
+
+    # Homogeneous files: try the format that matched last time first
+    last_format = source_formats.get(source) if source else None
+    if last_format:
+        data = FORMAT_PARSERS[last_format](line)
+        if data:
+            return data
+
+    candidate = detect_format(line)
+    if candidate and candidate != last_format:
+        data = FORMAT_PARSERS[candidate](line)
+        if data:
+            if source:
+                _remember_format(source, candidate)
+            return data
+
+    # Unrecognized prefix: fall back to trying the remaining formats in order.
+    # A line whose candidate didn't match (e.g. sshd "Connection closed")
+    # is dropped here without paying for every other regex.
+    if candidate is None:
+        for fmt_name, parse in FORMAT_PARSERS.items():
+            if fmt_name == last_format:
+                continue
+            data = parse(line)
+            if data:
+                if source:
+                    _remember_format(source, fmt_name)
+                return data
+
     print(f"[ignored] {line}")   # DEBUG LINE
-    return None
\ No newline at end of file
+    return None
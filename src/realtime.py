@@ -1,74 +1,349 @@
+import os
 import time
-import subprocess
+import heapq
+import queue
 import threading
+import collections
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
+from tailer import FileTailer
+from journal import JournalSource
 
+def is_watched_file(path):
+    return path.endswith((".log", ".csv", ".jsonl", ".lmevt"))
+
+class DirtyFiles:
+    # Bounded queue of files with unread data, in the order they became dirty.
+    # Marking a file that is already queued is coalesced into the queued entry;
+    # a file marked while it is being read is queued again when the read ends,
+    # so a file is never read by two workers at once. mark() blocks while the
+    # queue is full (backpressure on the observer thread).
+    def __init__(self, max_size=1000):
+        self.max_size = max(1, int(max_size))
+        self.order = collections.deque()
+        self.queued = set()
+        self.reading = set()
+        self.redirty = set()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.marks = 0
+        self.coalesced = 0
+        self.full_waits = 0
+        self.max_depth = 0
+
+    def mark(self, path):
+        with self.cond:
+            self.marks += 1
+            if path in self.queued or path in self.redirty:
+                self.coalesced += 1
+                return
+            if path in self.reading:
+                self.redirty.add(path)
+                return
+            if len(self.order) >= self.max_size:
+                self.full_waits += 1
+                while len(self.order) >= self.max_size and not self.closed:
+                    self.cond.wait()
+            self.order.append(path)
+            self.queued.add(path)
+            self.max_depth = max(self.max_depth, len(self.order))
+            self.cond.notify_all()
+
+    # Next dirty file to read, or None once closed and empty
+    def take(self):
+        with self.cond:
+            while not self.order:
+                if self.closed:
+                    return None
+                self.cond.wait()
+            path = self.order.popleft()
+            self.queued.discard(path)
+            self.reading.add(path)
+            self.cond.notify_all()
+            return path
+
+    def done(self, path):
+        with self.cond:
+            self.reading.discard(path)
+            if path in self.redirty:
+                self.redirty.discard(path)
+                self.order.append(path)
+                self.queued.add(path)
+                self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def stats(self):
+        with self.cond:
+            return {"depth": len(self.order), "max_depth": self.max_depth, "reading": len(self.reading),
+                    "marks": self.marks, "coalesced": self.coalesced, "full_waits": self.full_waits}
 
 class LogHandler(FileSystemEventHandler):
-    def __init__(self, logger, process_line):
+    # Runs in the observer thread: only records which files changed
+    def __init__(self, logger, dirty):
         super().__init__()
         self.logger = logger
-        self.process_line = process_line
-        self.file_positions = {}
+        self.dirty = dirty
 
     def on_modified(self, event):
         if event.is_directory: 
             return
         
-        if not (event.src_path.endswith(".log") or event.src_path.endswith(".csv")):
+        if not is_watched_file(event.src_path):
+            return
+
+        self.dirty.mark(event.src_path)
+
+    def on_created(self, event):
+        self.on_modified(event)
+
+    # Rotation by rename: finish the old file, then pick up the new one if it already exists
+    def on_moved(self, event):
+        if event.is_directory:
             return
+        if is_watched_file(event.src_path):
+            self.dirty.mark(event.src_path)
+        if is_watched_file(event.dest_path):
+            self.dirty.mark(event.dest_path)
 
+class PollingWatcher:
+    # Replaces the watchdog observer on network shares (CIFS/NFS), where no
+    # inotify events arrive: stats the watched files itself and marks the ones
+    # whose (inode, size, mtime) changed. Each file has its own interval, reset
+    # to min_interval when it changes and doubled up to max_interval every time
+    # it is found unchanged, so idle files cost little and active ones are
+    # picked up quickly. A tick runs at most every min_interval and stats at
+    # most max_stats files (the most overdue first); the directory is listed
+    # again every rescan_interval seconds to find new files.
+    def __init__(self, log_dir, dirty, logger, min_interval=1.0, max_interval=30.0, max_stats=500,
+                 rescan_interval=10.0, clock=time.monotonic):
+        self.log_dir = log_dir
+        self.dirty = dirty
+        self.logger = logger
+        self.min_interval = max(0.01, float(min_interval))
+        self.max_interval = max(self.min_interval, float(max_interval))
+        self.max_stats = max(1, int(max_stats))
+        self.rescan_interval = rescan_interval
+        self.clock = clock
+        self.files = {}  # path -> [(ino, size, mtime_ns) or None, interval]
+        self.due = []  # heap of (time, path)
+        self.next_scan = 0.0
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stat_calls = 0
+        self.changes = 0
+        self.scans = 0
+        self.max_lag = 0.0
+
+    # New files are stat'ed on the next tick like the others; their first
+    # stat marks them, so nothing written before it can be missed
+    def _scan(self, now):
+        self.scans += 1
+        try:
+            entries = list(os.scandir(self.log_dir))
+        except OSError as e:
+            self.logger.error(f"Error listing {self.log_dir}: {e}")
+            return
+        for entry in entries:
+            if entry.path not in self.files and is_watched_file(entry.path):
+                self.files[entry.path] = [None, self.min_interval]
+                heapq.heappush(self.due, (now, entry.path))
+
+    def _check(self, path, now):
+        state = self.files[path]
+        self.stat_calls += 1
         try:
-            with open(event.src_path, "r", encoding="utf-8", errors = "ignore") as f:
-                last_position = self.file_positions.get(event.src_path, 0)
-                f.seek(last_position)
-
-                for line in f:
-                    if line.strip():
-                        self.process_line(line.strip())
-
-                self.file_positions[event.src_path] = f.tell()
-        except Exception as e:
-            self.logger.error(f"Error reading log file {event.src_path}: {e}")
-
-def start_watchdog(log_dir, logger, process_line):
-    event_handler = LogHandler(logger, process_line)
-    observer = Observer()
-    observer.schedule(event_handler, path=log_dir, recursive=False)
+            st = os.stat(path)
+        except FileNotFoundError:
+            # Rotated away or deleted: the tailer finishes it, a rescan finds the new one
+            del self.files[path]
+            self.dirty.mark(path)
+            return
+        except OSError as e:
+            self.logger.warning(f"Error checking {path}: {e}")
+            state[1] = self.max_interval
+        else:
+            signature = (st.st_ino, st.st_size, st.st_mtime_ns)
+            if signature != state[0]:
+                if state[0] is not None:
+                    self.changes += 1
+                state[0] = signature
+                state[1] = self.min_interval
+                self.dirty.mark(path)
+            else:
+                state[1] = min(state[1] * 2, self.max_interval)
+        heapq.heappush(self.due, (now + state[1], path))
+
+    # One round of checks; returns when the next one is needed
+    def tick(self, now):
+        if now >= self.next_scan:
+            self._scan(now)
+            self.next_scan = now + self.rescan_interval
+        budget = self.max_stats
+        while budget and self.due and self.due[0][0] <= now:
+            when, path = heapq.heappop(self.due)
+            self.max_lag = max(self.max_lag, now - when)
+            self._check(path, now)
+            budget -= 1
+        wake = min(self.due[0][0], self.next_scan) if self.due else self.next_scan
+        return max(wake, now + self.min_interval)
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            wake = self.tick(self.clock())
+            self.stop_event.wait(max(0.0, wake - self.clock()))
+
+    # Same interface as the watchdog observer
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="log-poller", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def join(self):
+        if self.thread is not None:
+            self.thread.join()
+
+    def stats(self):
+        return {"files": len(self.files), "stat_calls": self.stat_calls, "changes": self.changes,
+                "scans": self.scans, "max_lag": round(self.max_lag, 3)}
+
+class TailWorkers:
+    # Reader threads take dirty files and read them through the tailer; lines
+    # are handed to the processing thread in batches over a bounded queue
+    # (readers wait when processing falls behind).
+    def __init__(self, tailer, dirty, logger, readers=2, batch_lines=1000, max_batches=16):
+        self.tailer = tailer
+        self.dirty = dirty
+        self.logger = logger
+        self.batch_lines = max(1, int(batch_lines))
+        self.batches = queue.Queue(maxsize=max(1, int(max_batches)))
+        self.batches_put = 0
+        self.batches_full = 0
+        self.threads = [threading.Thread(target=self._read_loop, name=f"tail-reader-{i}", daemon=True)
+                        for i in range(max(1, int(readers)))]
+        for thread in self.threads:
+            thread.start()
+
+    def _put(self, batch):
+        if self.batches.full():
+            self.batches_full += 1
+        self.batches.put(batch)
+        self.batches_put += 1
+
+    def _read_loop(self):
+        while True:
+            path = self.dirty.take()
+            if path is None:
+                self.batches.put(None)
+                return
+            batch = []
+
+            def emit(line, source, done=None):
+                batch.append((line, source, done))
+                if len(batch) >= self.batch_lines:
+                    self._put(batch[:])
+                    batch.clear()
+
+            try:
+                self.tailer.poll(path, emit)
+            except Exception as e:
+                self.logger.error(f"Error reading log file {path}: {e}")
+            finally:
+                if batch:
+                    self._put(batch)
+                self.dirty.done(path)
+
+    # Run in the processing thread: pass lines on until the readers have stopped
+    def process(self, process_line, timeout=None):
+        batch = self.batches.get(timeout=timeout)
+        if batch is None:
+            return False
+        for line, source, done in batch:
+            if done is None:
+                process_line(line, source)
+            else:
+                process_line(line, source, done)
+        return True
+
+    def stats(self):
+        return {"batch_queue": self.batches.qsize(), "batches": self.batches_put,
+                "batch_queue_full": self.batches_full, "readers": len(self.threads)}
+
+def log_watch_stats(logger, observer, dirty, workers):
+    logger.info(f"Watch queue: {dirty.stats()} {workers.stats()}")
+    if isinstance(observer, PollingWatcher):
+        logger.info(f"Polling: {observer.stats()}")
+
+def start_watchdog(log_dir, logger, process_line, checkpoint=None, offsets=None, readers=2,
+                   queue_size=1000, batch_lines=1000, max_batches=16, stats_every=300,
+                   backend="native", poll_min_interval=1.0, poll_max_interval=30.0, poll_max_stats=500,
+                   poll_rescan=10.0, stop=None):
+    tailer = FileTailer(process_line, logger, checkpoint, offsets)
+    dirty = DirtyFiles(queue_size)
+    workers = TailWorkers(tailer, dirty, logger, readers, batch_lines, max_batches)
+    if backend == "polling":
+        observer = PollingWatcher(log_dir, dirty, logger, poll_min_interval, poll_max_interval,
+                                  poll_max_stats, poll_rescan)
+    elif backend == "native":
+        observer = Observer()
+        observer.schedule(LogHandler(logger, dirty), path=log_dir, recursive=False)
+    else:
+        raise ValueError(f"Unknown watch backend: {backend}")
+
+    # Catch up on what was written while we were stopped: files from the last
+    # run first (they may have been rotated), then everything else. Marked from
+    # its own thread: with more files than the dirty queue holds, mark() waits
+    # for the readers, and they wait for the processing loop below.
+    def catch_up():
+        for path in list(tailer.offsets):
+            dirty.mark(path)
+        for entry in sorted(os.scandir(log_dir), key=lambda e: e.path):
+            if entry.is_file() and is_watched_file(entry.path):
+                dirty.mark(entry.path)
+
+    catch_up_thread = threading.Thread(target=catch_up, name="tail-catch-up", daemon=True)
+    catch_up_thread.start()
     observer.start()
-    logger.info(f"Started watchdog on {log_dir}")
+    logger.info(f"Started watchdog ({backend}) on {log_dir}")
 
+    # `stop` (a threading.Event) ends the loop like Ctrl+C does
+    stop = stop or threading.Event()
+    next_stats = time.monotonic() + stats_every
     try:
-        while True:
-            time.sleep(1)
+        while not stop.is_set():
+            try:
+                workers.process(process_line, timeout=1)
+            except queue.Empty:
+                pass
+            if stats_every and time.monotonic() >= next_stats:
+                log_watch_stats(logger, observer, dirty, workers)
+                next_stats += stats_every
     except KeyboardInterrupt:
-        observer.stop()
+        pass
+    observer.stop()
+
+    # Let the readers finish and process what they already read
+    dirty.close()
+    catch_up_thread.join()
+    running = len(workers.threads)
+    while running:
+        if not workers.process(process_line):
+            running -= 1
     observer.join()
+    tailer.close()
+    log_watch_stats(logger, observer, dirty, workers)
+    logger.info(f"Tailer stats: {tailer.stats()}")
 
-def stream_journal_worker(service, process_line, logger):
-    # Worker to stream journalctl in separed tread/process.
-    cmd = ["journalctl", "-fu", service, "-n", "0"]
-    logger.info(f"Starting journalctl for service: {service}")
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    try:
-        for line in iter(process.stdout.readline, ''):
-            if line.strip():
-                process_line(line.strip())
-    except Exception as e:
-        logger.error(f"Error streaming journalctl for {service}: {e}")
-
-def stream_journal(service, process_line, logger):
-    # Initiate threads for each service to stream journalctl logs.
-    threads = []
-    for svc in service:
-        t = threading.Thread(target=stream_journal_worker, args=(svc, process_line, logger), daemon=True)
-        t.start()
-        threads.append(t)
-
-    # Keep the process alive while threads run in background.
+# Journal mode: one stream for all services, resumed from the saved cursor
+def stream_journal(services, process_line, logger, checkpoint=None, cursor=None, backend="auto"):
+    source = JournalSource(services, logger, checkpoint, cursor, backend)
     try:
-        while any(t.is_alive() for t in threads):
-            time.sleep(1)
+        source.run(process_line)
     except KeyboardInterrupt:
-        logger.info("Stopping journalctl streaming...")
\ No newline at end of file
+        logger.info("Stopping journal streaming...")
+    logger.info(f"Journal stats: {source.stats()}")
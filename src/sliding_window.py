@@ -0,0 +1,67 @@
+import array
+
+class SlidingWindow:
+    # Time window of events with amortized O(1) insert, expiry and distinct-value
+    # count. Times are epoch seconds kept in an int64 array (8 bytes per event);
+    # values, if tracked, sit in a parallel list with a reference count per value.
+    # Expired events are skipped with a start index and the arrays are compacted
+    # once more than half of them is dead. Events are expected in (roughly)
+    # increasing time order; expiry stops at the first event still in the window.
+    # With inclusive=True an event exactly `window` seconds old is still counted.
+    __slots__ = ("window", "inclusive", "times", "values", "counts", "start")
+
+    def __init__(self, window, inclusive=False, track_values=True):
+        self.window = window
+        self.inclusive = inclusive
+        self.times = array.array("q")
+        self.values = [] if track_values else None
+        self.counts = {} if track_values else None
+        self.start = 0
+
+    def __len__(self):
+        return len(self.times) - self.start
+
+    def add(self, now, value=None):
+        self.times.append(now)
+        if self.values is not None:
+            self.values.append(value)
+            self.counts[value] = self.counts.get(value, 0) + 1
+        self.expire(now)
+
+    def expired(self, now, time):
+        age = now - time
+        return age > self.window or (age == self.window and not self.inclusive)
+
+    def expire(self, now):
+        times, values, counts = self.times, self.values, self.counts
+        start, end = self.start, len(times)
+        while start < end and self.expired(now, times[start]):
+            if values is not None:
+                value = values[start]
+                remaining = counts[value] - 1
+                if remaining:
+                    counts[value] = remaining
+                else:
+                    del counts[value]
+            start += 1
+        self.start = start
+        if start > 32 and start * 2 > end:
+            del times[:start]
+            if values is not None:
+                del values[:start]
+            self.start = 0
+
+    # Time of the newest event, or None if the window is empty
+    def last(self):
+        return self.times[-1] if len(self) else None
+
+    # Number of different values currently in the window
+    def distinct(self):
+        return len(self.counts) if self.counts is not None else 0
+
+    def clear(self):
+        del self.times[:]
+        if self.values is not None:
+            self.values.clear()
+            self.counts.clear()
+        self.start = 0
@@ -0,0 +1,154 @@
+import sys
+import socket
+import collections
+from sliding_window import SlidingWindow
+
+# Rough memory cost used for the budget: one key with its window object,
+# dict entry and empty arrays, and one event (int64 time + value pointer)
+KEY_BYTES = 240
+EVENT_BYTES = 16
+SET_ENTRY_BYTES = 90
+
+# IPv4 addresses are kept as ints (compact, cheap to hash); anything else as str
+def ip_key(ip: str):
+    try:
+        return int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except (OSError, TypeError):
+        return ip
+
+class WindowMap:
+    # key -> SlidingWindow, ordered by last use. Keys whose newest event has left
+    # the window are dropped from the least recently used end as new events come
+    # in, so idle IPs/users don't stay in memory forever.
+    def __init__(self, window, inclusive=False, track_values=True):
+        self.window = window
+        self.inclusive = inclusive
+        self.track_values = track_values
+        self.windows = collections.OrderedDict()
+        self.events = 0
+        self.expired_keys = 0
+        self.evicted_keys = 0
+
+    def __len__(self):
+        return len(self.windows)
+
+    def __contains__(self, key):
+        return key in self.windows
+
+    def get(self, key):
+        return self.windows.get(key)
+
+    # Add an event to the key's window and return the window
+    def add(self, key, now, value=None):
+        window = self.windows.get(key)
+        if window is None:
+            window = SlidingWindow(self.window, self.inclusive, self.track_values)
+            self.windows[key] = window
+        else:
+            self.windows.move_to_end(key)
+        before = len(window)
+        window.add(now, value)
+        self.events += len(window) - before
+        self.drop_idle(now)
+        return window
+
+    def clear(self, key):
+        window = self.windows.get(key)
+        if window is not None:
+            self.events -= len(window)
+            window.clear()
+
+    # Remove least recently used keys whose windows are empty at `now`
+    def drop_idle(self, now, limit=4):
+        windows = self.windows
+        for _ in range(limit):
+            if not windows:
+                return
+            key, window = next(iter(windows.items()))
+            last = window.last()
+            if last is not None and not window.expired(now, last):
+                return
+            del windows[key]
+            self.events -= len(window)
+            self.expired_keys += 1
+
+    # Forget the least recently used key even if its window is not empty
+    def evict_oldest(self):
+        key, window = self.windows.popitem(last=False)
+        self.events -= len(window)
+        self.evicted_keys += 1
+
+    def nbytes(self):
+        return len(self.windows) * KEY_BYTES + self.events * EVENT_BYTES
+
+class BoundedSet:
+    # Set that forgets its least recently added members past max_size
+    def __init__(self, items=(), max_size=100000):
+        self.max_size = max(1, int(max_size))
+        self.items = collections.OrderedDict()
+        self.evicted = 0
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.items
+
+    def add(self, item):
+        self.items[item] = None
+        self.items.move_to_end(item)
+        if len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+            self.evicted += 1
+
+    def nbytes(self):
+        return len(self.items) * SET_ENTRY_BYTES
+
+class StateStore:
+    # Detector state with a global memory budget. Idle keys are dropped as events
+    # arrive; when the estimate is still over budget the least recently used keys
+    # of the largest map are evicted (their in-progress windows are lost).
+    def __init__(self, budget_bytes=256 * 1024 * 1024, check_every=1000):
+        self.budget_bytes = budget_bytes
+        self.check_every = check_every
+        self.maps = {}
+        self.sets = {}
+        self.ticks = 0
+
+    def window_map(self, name, window, inclusive=False, track_values=True):
+        self.maps[name] = WindowMap(window, inclusive, track_values)
+        return self.maps[name]
+
+    def bounded_set(self, name, items=(), max_size=100000):
+        self.sets[name] = BoundedSet(items, max_size)
+        return self.sets[name]
+
+    def nbytes(self):
+        return sum(m.nbytes() for m in self.maps.values()) + sum(s.nbytes() for s in self.sets.values())
+
+    # Called once per event; enforces the budget every check_every events
+    def tick(self):
+        self.ticks += 1
+        if self.ticks % self.check_every:
+            return
+        while self.nbytes() > self.budget_bytes:
+            largest = max(self.maps.values(), key=lambda m: m.nbytes())
+            if not largest.windows:
+                return
+            for _ in range(max(1, len(largest.windows) // 100)):
+                largest.evict_oldest()
+
+    def stats(self):
+        stats = {"bytes": self.nbytes(), "budget_bytes": self.budget_bytes}
+        for name, m in self.maps.items():
+            stats[name] = {"keys": len(m), "events": m.events, "bytes": m.nbytes(),
+                           "expired_keys": m.expired_keys, "evicted_keys": m.evicted_keys}
+        for name, s in self.sets.items():
+            stats[name] = {"keys": len(s), "bytes": s.nbytes(), "evicted_keys": s.evicted}
+        return stats
+
+# Users repeat a lot; keep one copy of each name
+def user_key(user: str) -> str:
+    return sys.intern(user)
@@ -0,0 +1,252 @@
+import time
+import queue
+import asyncio
+import datetime
+import threading
+
+# Syslog receiver so one analyzer can collect from many hosts. Messages arrive
+# over UDP (one per datagram) and TCP (RFC 6587: octet-counted "LEN MSG" or
+# one message per line), in RFC 3164 or RFC 5424 format. Both are turned into
+# the classic "Sep  7 12:00:00 host sshd[123]: message" line that the parser
+# formats expect, with "syslog:<peer address>" as the source.
+
+MAX_PRI = 191
+
+def _short_line(stamp, host, ident, pid, message):
+    prefix = f"{stamp:%b} {stamp.day:2d} {stamp:%H:%M:%S} {host} {ident}"
+    return f"{prefix}[{pid}]: {message}" if pid else f"{prefix}: {message}"
+
+# Skip the STRUCTURED-DATA of an RFC 5424 message ("-" or "[id k="v"]...")
+# and return the MSG part
+def _skip_structured_data(rest):
+    if rest.startswith("-"):
+        return rest[2:]
+    i = 0
+    while i < len(rest) and rest[i] == "[":
+        i += 1
+        while i < len(rest) and rest[i] != "]":
+            i += 2 if rest[i] == "\\" else 1
+        i += 1
+    return rest[i + 1:]
+
+# (line, host) for one syslog message, or None if it is empty. The peer
+# address is the host when the message doesn't name one.
+def parse_syslog_message(data, peer=None):
+    text = data.decode("utf-8", "ignore").strip("\r\n\x00 ")
+    if not text:
+        return None
+    if text.startswith("<"):
+        end = text.find(">", 1, 5)
+        if end > 1 and text[1:end].isdigit() and int(text[1:end]) <= MAX_PRI:
+            text = text[end + 1:]
+
+    if text.startswith("1 "):  # RFC 5424: VERSION TIMESTAMP HOSTNAME APP-NAME PROCID MSGID SD MSG
+        parts = text.split(" ", 6)
+        if len(parts) == 7:
+            _, stamp, host, app, pid, _, rest = parts
+            host = peer if host == "-" else host
+            try:
+                stamp = datetime.datetime.fromisoformat(stamp.replace("Z", "+00:00"))
+                if stamp.tzinfo is not None:
+                    stamp = stamp.astimezone().replace(tzinfo=None)
+            except ValueError:
+                stamp = datetime.datetime.now()
+            message = _skip_structured_data(rest).lstrip("\ufeff")  # BOM before UTF-8 MSG
+            return _short_line(stamp, host or "-", "" if app == "-" else app,
+                               "" if pid == "-" else pid, message), host
+
+    # RFC 3164: "Mmm dd hh:mm:ss HOST TAG: MSG", already the expected layout
+    fields = text.split(None, 4)
+    host = fields[3] if len(fields) > 3 and fields[0][:1].isalpha() else peer
+    return text, host
+
+class SyslogServer:
+    # Receives in an asyncio loop in its own thread and hands batches of
+    # (line, source, None) to the processing thread over a bounded queue,
+    # like TailWorkers. A batch is passed on when it has batch_lines lines or
+    # is batch_latency seconds old. When max_batches are waiting, TCP
+    # connections stop being read (the senders' buffers fill up and they slow
+    # down) and UDP datagrams are dropped and counted, since UDP can't push back.
+    def __init__(self, logger, host="0.0.0.0", udp_port=514, tcp_port=514, batch_lines=1000,
+                 max_batches=16, batch_latency=0.2, max_message=65536):
+        self.logger = logger
+        self.host = host
+        self.udp_port = udp_port
+        self.tcp_port = tcp_port
+        self.batch_lines = max(1, int(batch_lines))
+        self.batches = queue.Queue(maxsize=max(1, int(max_batches)))
+        self.batch_latency = batch_latency
+        self.max_message = max_message
+        self.pending = []
+        self.pending_since = 0.0
+        self.loop = None
+        self.stopping = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.error = None
+        self.received = 0
+        self.dropped = 0
+        self.paused = 0
+        self.connections = 0
+        self.batches_put = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="syslog-server", daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            raise self.error
+        self.logger.info(f"Syslog server listening on {self.host} (udp {self.udp_port}, tcp {self.tcp_port})")
+
+    def stop(self):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.stopping.set)
+
+    def _run(self):
+        try:
+            asyncio.run(self._serve())
+        except Exception as e:
+            self.error = e
+            self.ready.set()
+        # Whatever was received is still processed, then the consumer stops
+        if self.pending:
+            self.batches.put(self.pending)
+            self.pending = []
+        self.batches.put(None)
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        transport = server = None
+        if self.udp_port is not None:
+            transport, _ = await self.loop.create_datagram_endpoint(
+                lambda: _SyslogDatagrams(self), local_addr=(self.host, self.udp_port))
+            self.udp_port = transport.get_extra_info("sockname")[1]
+        if self.tcp_port is not None:
+            server = await asyncio.start_server(self._handle_tcp, self.host, self.tcp_port, limit=self.max_message)
+            self.tcp_port = server.sockets[0].getsockname()[1]
+        self.ready.set()
+
+        flusher = asyncio.ensure_future(self._flush_loop())
+        await self.stopping.wait()
+        flusher.cancel()
+        if transport is not None:
+            transport.close()
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+
+    def _add(self, data, peer):
+        parsed = parse_syslog_message(data, peer)
+        if parsed is None:
+            return
+        line, _ = parsed
+        if not self.pending:
+            self.pending_since = time.monotonic()
+        # Keyed by the sender's address: the HOSTNAME in the message is chosen by
+        # the sender, and each source gets an entry in parser.source_formats
+        self.pending.append((line, f"syslog:{peer}", None))
+        self.received += 1
+        if len(self.pending) >= self.batch_lines:
+            self._flush()
+
+    # Pass the current batch on; False while the queue is full
+    def _flush(self):
+        if not self.pending:
+            return True
+        try:
+            self.batches.put_nowait(self.pending)
+        except queue.Full:
+            return False
+        self.pending = []
+        self.batches_put += 1
+        return True
+
+    def _full(self):
+        return len(self.pending) >= self.batch_lines and not self._flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.batch_latency / 2)
+            if self.pending and time.monotonic() - self.pending_since >= self.batch_latency:
+                self._flush()
+
+    def datagram(self, data, addr):
+        if self._full():
+            self.dropped += 1
+            return
+        self._add(data, addr[0])
+
+    async def _handle_tcp(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        peer = peer[0] if peer else None
+        self.connections += 1
+        try:
+            while True:
+                if self._full():
+                    # Stop reading until the processing thread catches up
+                    self.paused += 1
+                    while self._full():
+                        await asyncio.sleep(0.01)
+                first = await reader.read(1)
+                if not first:
+                    return
+                if first.isdigit():  # octet counting: "LEN SP MSG"
+                    count = first + await reader.readuntil(b" ")
+                    size = int(count[:-1])
+                    if size > self.max_message:
+                        self.logger.warning(f"Syslog message of {size} bytes from {peer}, closing connection")
+                        return
+                    data = await reader.readexactly(size)
+                else:
+                    data = first + await reader.readuntil(b"\n")
+                self._add(data, peer)
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                self._add(e.partial, peer)
+        except (asyncio.LimitOverrunError, ValueError, ConnectionError) as e:
+            self.logger.warning(f"Syslog connection from {peer} closed: {e}")
+        finally:
+            writer.close()
+
+    # Run in the processing thread: pass lines on until the server has stopped
+    def process(self, process_line, timeout=None):
+        batch = self.batches.get(timeout=timeout)
+        if batch is None:
+            return False
+        for line, source, _ in batch:
+            process_line(line, source)
+        return True
+
+    def stats(self):
+        return {"received": self.received, "dropped": self.dropped, "tcp_paused": self.paused,
+                "connections": self.connections, "batches": self.batches_put,
+                "batch_queue": self.batches.qsize()}
+
+class _SyslogDatagrams(asyncio.DatagramProtocol):
+    def __init__(self, server):
+        self.server = server
+
+    def datagram_received(self, data, addr):
+        self.server.datagram(data, addr)
+
+def serve_syslog(logger, process_line, host="0.0.0.0", udp_port=514, tcp_port=514, batch_lines=1000,
+                 max_batches=16, batch_latency=0.2, stats_every=300):
+    server = SyslogServer(logger, host, udp_port, tcp_port, batch_lines, max_batches, batch_latency)
+    server.start()
+    next_stats = time.monotonic() + stats_every
+    try:
+        while True:
+            try:
+                server.process(process_line, timeout=1)
+            except queue.Empty:
+                pass
+            if stats_every and time.monotonic() >= next_stats:
+                logger.info(f"Syslog server: {server.stats()}")
+                next_stats += stats_every
+    except KeyboardInterrupt:
+        logger.info("Stopping syslog server...")
+    server.stop()
+    while server.process(process_line):
+        pass
+    logger.info(f"Syslog server: {server.stats()}")
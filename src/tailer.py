@@ -0,0 +1,152 @@
+import os
+import functools
+import threading
+from parser import read_line_chunks, read_event_records, is_event_file, has_event_magic
+
+class TailedFile:
+    __slots__ = ("path", "file", "dev", "ino", "offset", "skipped")
+
+    def __init__(self, path, file, dev, ino, offset=0):
+        self.path = path
+        self.file = file
+        self.dev = dev
+        self.ino = ino
+        self.offset = offset
+        self.skipped = False  # not in a format we can read; ignored until replaced
+
+class FileTailer:
+    # Follows log files by identity (device, inode) instead of by name.
+    #  - rotation (the path now points to another inode, or is gone): the old
+    #    file is read to the end through the handle still open on it, then the
+    #    new file is followed from offset 0
+    #  - truncation (size below our offset, e.g. copytruncate): restart at 0
+    #  - a last line without "\n" is still being written and is left for the
+    #    next poll
+    # With a checkpoint(path, dev, ino, offset) function, lines are passed as
+    # process_line(line, path, done) where done() saves the offset after the
+    # line; the caller runs it together with the line's own writes. `offsets`
+    # ({path: (dev, ino, offset)}) are the checkpoints of the previous run, so a
+    # restart resumes where it stopped, including a file rotated in between.
+    # use_mmap maps large appends instead of reading them (see read_line_chunks).
+    def __init__(self, process_line, logger, checkpoint=None, offsets=None, use_mmap=False):
+        self.process_line = process_line
+        self.use_mmap = use_mmap
+        self.logger = logger
+        self.checkpoint = checkpoint
+        self.offsets = dict(offsets or {})
+        self.files = {}
+        self.locks = {}  # path -> lock; different files can be read in parallel
+        self.locks_lock = threading.Lock()
+        self.lines = 0
+        self.rotations = 0
+        self.truncations = 0
+
+    def _lock(self, path):
+        with self.locks_lock:
+            lock = self.locks.get(path)
+            if lock is None:
+                lock = self.locks[path] = threading.Lock()
+            return lock
+
+    # Read whatever is new in `path` (call on every modify/create/move event).
+    # Lines go to emit(line, path[, done]) if given, else to process_line.
+    def poll(self, path, emit=None):
+        emit = emit or self.process_line
+        with self._lock(path):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                st = None
+
+            tailed = self.files.get(path)
+            if tailed is not None and (st is None or (st.st_dev, st.st_ino) != (tailed.dev, tailed.ino)):
+                self.logger.info(f"{path} was rotated, finishing the old file")
+                self._read(tailed, emit, final=True)
+                tailed.file.close()
+                del self.files[path]
+                self.rotations += 1
+                tailed = None
+
+            if st is None:
+                saved = self.offsets.pop(path, None)
+                if saved:
+                    self._drain_rotated(path, *saved, emit)
+                return
+
+            if tailed is None:
+                tailed = self._open(path, st, emit)
+            elif st.st_size < tailed.offset:
+                self.logger.warning(f"{path} was truncated, reading it again from the start")
+                tailed.offset = 0
+                self.truncations += 1
+            self._read(tailed, emit)
+
+    def _open(self, path, st, emit):
+        offset = 0
+        saved = self.offsets.pop(path, None)
+        if saved:
+            dev, ino, saved_offset = saved
+            if (dev, ino) != (st.st_dev, st.st_ino):
+                self._drain_rotated(path, dev, ino, saved_offset, emit)
+            elif st.st_size < saved_offset:
+                self.logger.warning(f"{path} was truncated while stopped, reading it again from the start")
+                self.truncations += 1
+            else:
+                offset = saved_offset
+        tailed = TailedFile(path, open(path, "rb"), st.st_dev, st.st_ino, offset)
+        self.files[path] = tailed
+        return tailed
+
+    # The file we followed at `path` was rotated while we were stopped: find it by
+    # inode next to the new one (auth.log -> auth.log.1) and read the rest of it
+    def _drain_rotated(self, path, dev, ino, offset, emit):
+        directory = os.path.dirname(path) or "."
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            entries = []
+        for entry in entries:
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) == (dev, ino) and entry.path != path:
+                self.logger.info(f"{path} was rotated to {entry.path} while stopped, finishing it")
+                with open(entry.path, "rb") as f:
+                    self._read(TailedFile(path, f, dev, ino, offset), emit, final=True)
+                self.rotations += 1
+                return
+        self.logger.warning(f"{path} was rotated while stopped and the old file was not found")
+
+    def _read(self, tailed, emit, final=False):
+        if tailed.skipped:
+            return
+        checkpoint = self.checkpoint
+        if is_event_file(tailed.path):
+            if tailed.offset == 0 and not has_event_magic(tailed.file):
+                self.logger.warning(f"{tailed.path} is not an event record file, skipping it")
+                tailed.skipped = True
+                return
+            chunks = read_event_records(tailed.file, tailed.offset, final=final, with_offsets=True)
+        else:
+            chunks = read_line_chunks(tailed.file, tailed.offset, final=final,
+                                      with_offsets=True, use_mmap=self.use_mmap)
+        for lines, ends in chunks:
+            for line, end in zip(lines, ends):
+                tailed.offset = end
+                if not line:
+                    continue
+                self.lines += 1
+                if checkpoint is None:
+                    emit(line, tailed.path)
+                else:
+                    emit(line, tailed.path, functools.partial(checkpoint, tailed.path, tailed.dev, tailed.ino, end))
+
+    def close(self):
+        for tailed in list(self.files.values()):
+            tailed.file.close()
+        self.files.clear()
+
+    def stats(self):
+        return {"files": len(self.files), "lines": self.lines,
+                "rotations": self.rotations, "truncations": self.truncations}
@@ -0,0 +1,127 @@
+import time
+import datetime
+
+# Fast decoders for the fixed timestamp layouts used by the log formats.
+# They slice fixed offsets instead of calling strptime, memoize the date part
+# and keep the last decoded value, since consecutive lines usually share the
+# same second. Invalid input raises ValueError, like strptime.
+
+MONTHS = {
+    "Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+    "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12,
+}
+
+_DATE_CACHE_SIZE = 4096
+_date_cache = {}
+
+# Last (raw value, datetime) decoded by each layout
+_last_iso = (None, None)
+_last_apache = (None, None)
+_last_syslog = (None, None, None)
+_last_epoch = (None, None)
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Current time, refreshed at most once per second
+_now_cache = (0, None)
+
+def _month(name: str) -> int:
+    try:
+        return MONTHS[name]
+    except KeyError:
+        raise ValueError(f"Unknown month: {name!r}") from None
+
+def _date(key, year, month, day) -> datetime.date:
+    date = _date_cache.get(key)
+    if date is None:
+        date = datetime.date(year, month, day)  # Validates the day of the month
+        if len(_date_cache) >= _DATE_CACHE_SIZE:
+            _date_cache.clear()
+        _date_cache[key] = date
+    return date
+
+def _time_of_day(value: str, start: int):
+    if value[start + 2] != ":" or value[start + 5] != ":":
+        raise ValueError(f"Invalid time: {value!r}")
+    return int(value[start:start + 2]), int(value[start + 3:start + 5]), int(value[start + 6:start + 8])
+
+def _combine(date: datetime.date, hour: int, minute: int, second: int) -> datetime.datetime:
+    return datetime.datetime(date.year, date.month, date.day, hour, minute, second)
+
+# Whole seconds since 1970 for a naive datetime (as if it were UTC; only used
+# to compare timestamps with each other)
+def to_epoch(value: datetime.datetime) -> int:
+    return (value - EPOCH) // datetime.timedelta(seconds=1)
+
+# Naive datetime and its "%Y-%m-%d %H:%M:%S" text for whole seconds since 1970 (UTC)
+def from_epoch(seconds: int):
+    global _last_epoch
+    if seconds == _last_epoch[0]:
+        return _last_epoch[1]
+    value = EPOCH + datetime.timedelta(seconds=seconds)
+    result = (value, value.isoformat(" "))
+    _last_epoch = (seconds, result)
+    return result
+
+def now() -> datetime.datetime:
+    global _now_cache
+    second = int(time.time())
+    if _now_cache[0] != second:
+        _now_cache = (second, datetime.datetime.now())
+    return _now_cache[1]
+
+# "2025-09-07 12:34:56" (%Y-%m-%d %H:%M:%S)
+def parse_iso_timestamp(value: str) -> datetime.datetime:
+    global _last_iso
+    if value == _last_iso[0]:
+        return _last_iso[1]
+    if len(value) != 19 or value[4] != "-" or value[7] != "-" or value[10] != " ":
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    key = value[:10]
+    date = _date(key, int(value[0:4]), int(value[5:7]), int(value[8:10]))
+    result = _combine(date, *_time_of_day(value, 11))
+    _last_iso = (value, result)
+    return result
+
+# "10/Oct/2000:13:55:36" (%d/%b/%Y:%H:%M:%S)
+def parse_apache_timestamp(value: str) -> datetime.datetime:
+    global _last_apache
+    if value == _last_apache[0]:
+        return _last_apache[1]
+    if len(value) != 20 or value[2] != "/" or value[6] != "/" or value[11] != ":":
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    key = value[:11]
+    date = _date(key, int(value[7:11]), _month(value[3:6]), int(value[0:2]))
+    result = _combine(date, *_time_of_day(value, 12))
+    _last_apache = (value, result)
+    return result
+
+# "Jan 10 10:32:15" / "Jan  1 10:32:15" (%b %d %H:%M:%S, no year).
+# The year comes from the reference time; a timestamp more than a day in
+# its future belongs to the previous year (e.g. "Dec 31" read on Jan 1).
+def parse_syslog_timestamp(value: str, reference: datetime.datetime = None) -> datetime.datetime:
+    global _last_syslog
+    reference = reference or now()
+    day_key = reference.toordinal()
+    if value == _last_syslog[0] and day_key == _last_syslog[1]:
+        return _last_syslog[2]
+
+    parts = value.split()
+    if len(parts) != 3 or len(parts[2]) != 8:
+        raise ValueError(f"Invalid timestamp: {value!r}")
+    month, day = _month(parts[0]), int(parts[1])
+    clock = _time_of_day(parts[2], 0)
+
+    year = reference.year
+    try:
+        result = _combine(_date((year, month, day), year, month, day), *clock)
+    except ValueError:
+        if (month, day) != (2, 29):
+            raise
+        result = None  # Feb 29 only exists in the previous (leap) year
+    if result is None or result - reference > datetime.timedelta(days=1):
+        year -= 1
+        result = _combine(_date((year, month, day), year, month, day), *clock)
+
+    _last_syslog = (value, day_key, result)
+    return result
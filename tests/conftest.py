@@ -0,0 +1,61 @@
+import sys
+import pkgutil
+import importlib
+import pytest
+import src
+
+# The modules in src/ import each other by bare name (pytest.ini puts src on
+# the path, like running python src/analyzer.py). Make "src.<name>" the same
+# module object as "<name>", so `from src import database` in a test shares
+# globals (e.g. database._writer) with the code under test.
+for info in pkgutil.iter_modules(src.__path__):
+    try:
+        module = importlib.import_module(info.name)
+    except ImportError:
+        continue  # optional dependency missing; the module's tests skip or fail on their own
+    sys.modules[f"src.{info.name}"] = module
+    setattr(src, info.name, module)
+
+
+class Recorder:
+    # Stands in for the pipeline of a reader: collects what is passed to
+    # process(line, source[, done]) and the positions given to checkpoint()
+    def __init__(self):
+        self.lines = []
+        self.sources = []
+        self.checkpoints = {}
+
+    def process(self, line, source, done=None):
+        self.lines.append(line)
+        self.sources.append(source)
+        if done is not None:
+            done()
+
+    def checkpoint(self, key, *position):
+        self.checkpoints[key] = position[0] if len(position) == 1 else position
+
+
+@pytest.fixture
+def make_recorder():
+    return Recorder
+
+
+# Module-level state of src/database.py set up by init_partitions,
+# init_profile_cache and set_raw_log_mode, restored after the test
+@pytest.fixture
+def database_state(monkeypatch):
+    database = sys.modules["database"]
+    monkeypatch.setattr(database, "_partitions", None)
+    monkeypatch.setattr(database, "_profiles", None)
+    monkeypatch.setattr(database, "_raw_mode", "inline")
+    monkeypatch.setattr(database, "_raw_blocks", database.RawLogBlocks())
+    monkeypatch.setattr(database, "_rollups", database.Rollups())
+    return database
+
+
+# Formats remembered per source by src/parser.py, emptied for the test
+@pytest.fixture
+def parser_state(monkeypatch):
+    parser = sys.modules["parser"]
+    monkeypatch.setattr(parser, "source_formats", {})
+    return parser
@@ -0,0 +1,70 @@
+import sqlite3
+import pytest
+from src import analytics
+
+ROWS = [
+    # timestamp, ip, user, result, country
+    ("2025-09-01 10:00:00", "1.1.1.1", "alice", "success", "BRAZIL"),
+    ("2025-09-01 10:05:00", "2.2.2.2", "bob", "fail", "CHINA"),
+    ("2025-09-01 10:06:00", "2.2.2.2", "bob", "fail", "CHINA"),
+    ("2025-09-01 11:00:00", "2.2.2.2", "bob", "success", "CHINA"),
+    ("2025-09-02 09:00:00", "3.3.3.3", "alice", "success", "AUSTRIA"),
+    ("2025-09-02 09:30:00", "1.1.1.1", "alice", "fail", "BRAZIL"),
+    ("2025-09-02 09:40:00", "1.1.1.1", "alice", "success", "BRAZIL"),
+    ("2025-09-03 08:00:00", "3.3.3.3", "bob", "fail", "AUSTRIA"),
+]
+
+
+@pytest.fixture(params=["numpy", "array"])
+def table(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(analytics, "np", None)
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE login_attempts (timestamp TEXT, ip TEXT, user TEXT, result TEXT, country TEXT)")
+    conn.executemany("INSERT INTO login_attempts VALUES (?, ?, ?, ?, ?)", ROWS)
+    yield analytics.load_columns(conn, chunk_size=3)
+    conn.close()
+
+
+def test_top_k(table):
+    assert len(table) == 8
+    assert analytics.top_k(table, "ip", 2) == [("1.1.1.1", 3), ("2.2.2.2", 3)]
+    assert analytics.top_k(table, "country", 1, table.where("result", "fail")) == [("CHINA", 2)]
+
+
+def test_fail_rate_per_user_per_day(table):
+    rows = analytics.fail_rate(table, "user", "day")
+    assert [(analytics.format_time(s)[:10], user, total, failed) for s, user, total, failed, _ in rows] == [
+        ("2025-09-03", "bob", 1, 1),
+        ("2025-09-01", "bob", 3, 2),
+        ("2025-09-02", "alice", 3, 1),
+        ("2025-09-01", "alice", 1, 0),
+    ]
+
+
+def test_new_country_logins(table):
+    rows = analytics.new_country_logins(table)
+    assert [(analytics.format_time(t), user, country) for t, user, country, _ in rows] == [
+        ("2025-09-02 09:00:00", "alice", "AUSTRIA"),
+    ]
+
+
+def test_ip_churn(table):
+    rows = analytics.ip_churn(table, "day")
+    assert [row[1:] for row in rows] == [(2, 2, 0), (2, 1, 1), (1, 0, 1)]
+
+
+def test_cli(tmp_path, capsys):
+    db_file = tmp_path / "test.db"
+    conn = sqlite3.connect(db_file)
+    conn.execute("CREATE TABLE login_attempts (timestamp TEXT, ip TEXT, user TEXT, result TEXT, country TEXT)")
+    conn.executemany("INSERT INTO login_attempts VALUES (?, ?, ?, ?, ?)", ROWS)
+    conn.commit()
+    conn.close()
+
+    analytics.main(["--db", str(db_file), "--since", "2025-09-02", "top", "--by", "user"])
+    out = capsys.readouterr().out.splitlines()
+    assert out[1].split() == ["alice", "3"]
+    assert out[2].split() == ["bob", "1"]
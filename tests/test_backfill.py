@@ -0,0 +1,41 @@
+import os
+import bz2
+import gzip
+import logging
+from src.backfill import collect_backfill_files, run_backfill
+
+
+def test_backfill_reads_plain_and_compressed_archives(tmp_path):
+    (tmp_path / "nested").mkdir()
+    old = tmp_path / "auth.log.2.gz"
+    with gzip.open(old, "wt") as f:
+        f.write("line 1\nline 2\n")
+    older = tmp_path / "nested" / "access.log-20250901.bz2"
+    with bz2.open(older, "wt") as f:
+        f.write("line 0\n")
+    current = tmp_path / "auth.log"
+    current.write_text("line 3\n\nline 4\n")
+    (tmp_path / "notes.txt").write_text("not a log\n")
+
+    os.utime(older, (1, 1))
+    os.utime(old, (2, 2))
+    assert collect_backfill_files([str(tmp_path)]) == [str(older), str(old), str(current)]
+
+    seen = []
+    total, _ = run_backfill([str(tmp_path)], lambda line, source: seen.append(line), logging.getLogger("test"))
+    assert total == 5
+    assert seen == ["line 0", "line 1", "line 2", "line 3", "line 4"]
+
+
+def test_backfill_skips_files_that_are_not_event_records(tmp_path, caplog):
+    from src.parser import EVENT_MAGIC
+    from scripts.windows_agent import pack_event
+    (tmp_path / "Application.evt").write_bytes(b"0\x00\x00\x00LfLe legacy event log")
+    (tmp_path / "renamed.lmevt").write_bytes(b"LfLe not ours")
+    (tmp_path / "windows_events.lmevt").write_bytes(
+        EVENT_MAGIC + pack_event(["2025-09-07 12:00:01", "203.0.113.7", "administrator", "login", "fail"]))
+
+    seen = []
+    total, _ = run_backfill([str(tmp_path)], lambda line, source: seen.append(str(line)), logging.getLogger("test"))
+    assert seen == ["2025-09-07 12:00:01,203.0.113.7,administrator,login,fail"]
+    assert "renamed.lmevt is not an event record file" in caplog.text
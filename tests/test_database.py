@@ -0,0 +1,267 @@
+import sqlite3
+import datetime
+import pytest
+from src import database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch, database_state):
+    monkeypatch.setattr(database, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "test.db"))
+    database.init_db()
+    yield database
+    database.close_writer()
+
+
+def count_rows(db_file, table):
+    conn = sqlite3.connect(db_file)
+    count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_writer_commits_per_batch(db):
+    writer = db.init_writer(batch_size=3, max_latency=0)
+    ts = datetime.datetime(2025, 9, 7, 12, 0, 0)
+
+    db.add_login_attempt(ts, "1.1.1.1", "alice", "fail", "BRAZIL", "raw")
+    db.add_login_attempt(ts, "1.1.1.1", "alice", "fail", "BRAZIL", "raw")
+    assert count_rows(db.DB_FILE, "login_attempts") == 0
+
+    db.add_login_attempt(ts, "1.1.1.1", "alice", "fail", "BRAZIL", "raw")
+    assert count_rows(db.DB_FILE, "login_attempts") == 3
+    assert writer.commits == 1
+
+
+def test_writer_reads_pending_writes(db):
+    db.init_writer(batch_size=100, max_latency=0)
+    ts = datetime.datetime(2025, 9, 7, 12, 0, 0)
+
+    db.add_alert("2.2.2.2", "bob", "CHINA", ts, "test")
+    assert db.is_ip_alerted("2.2.2.2")
+
+    db.update_user_profile_country("bob", "CHINA")
+    db.update_user_login_counters("bob", success=True)
+    profile = db.get_or_create_user_profile("bob")
+    assert profile["known_countries"] == "CHINA"
+    assert profile["successful_logins"] == 1
+
+
+def test_close_writer_flushes(db):
+    db.init_writer(batch_size=100, max_latency=0)
+    db.add_blocked_ip("3.3.3.3", "eve", "AUSTRIA", datetime.datetime(2025, 9, 7, 12, 0, 0))
+    assert count_rows(db.DB_FILE, "blocked_ips") == 0
+
+    db.close_writer()
+    assert count_rows(db.DB_FILE, "blocked_ips") == 1
+
+
+def test_profile_cache_writes_behind(db):
+    db.init_writer(batch_size=1, max_latency=0)
+    cache = db.init_profile_cache(max_size=10, max_dirty=100, max_latency=60)
+
+    db.update_user_login_counters("carol", success=False)  # no profile yet: not counted
+    for _ in range(3):
+        db.update_user_profile_country("carol", "BRAZIL")
+        db.update_user_login_counters("carol", success=True)
+    db.update_user_profile_country("carol", "CHINA")
+    db.update_user_login_counters("carol", success=False)
+    assert count_rows(db.DB_FILE, "user_profiles") == 0
+
+    profile = db.get_user_profile("carol")
+    assert profile.known_countries == {"BRAZIL", "CHINA"}
+    assert (profile.successful_logins, profile.failed_logins) == (3, 1)
+
+    db.close_writer()
+    conn = sqlite3.connect(db.DB_FILE)
+    row = conn.execute("SELECT known_countries, successful_logins, failed_logins FROM user_profiles WHERE user = 'carol'").fetchone()
+    conn.close()
+    assert row == ("BRAZIL,CHINA", 3, 1)
+    assert cache.writes == 1
+
+
+# Schema created by init_db in 1.3.0 (no user_version, no ip_cache, no indexes)
+V1_3_0_SCHEMA = """
+CREATE TABLE login_attempts (id INTEGER PRIMARY KEY AUTOINCREMENT, timestamp TEXT NOT NULL, ip TEXT NOT NULL,
+    user TEXT NOT NULL, result TEXT NOT NULL, country TEXT, raw_log TEXT);
+CREATE TABLE user_profiles (id INTEGER PRIMARY KEY AUTOINCREMENT, user TEXT NOT NULL UNIQUE,
+    known_countries TEXT NOT NULL, successful_logins INTEGER DEFAULT 0, failed_logins INTEGER DEFAULT 0);
+CREATE TABLE blocked_ips (id INTEGER PRIMARY KEY AUTOINCREMENT, ip TEXT NOT NULL UNIQUE, user TEXT,
+    country TEXT, block_time TEXT NOT NULL);
+CREATE TABLE alerts (id INTEGER PRIMARY KEY AUTOINCREMENT, ip TEXT, user TEXT, country TEXT,
+    alert_time TEXT NOT NULL, reason TEXT NOT NULL);
+INSERT INTO login_attempts (timestamp, ip, user, result, country, raw_log)
+    VALUES ('2025-09-07 12:00:00', '1.1.1.1', 'alice', 'fail', 'BRAZIL', 'raw');
+INSERT INTO alerts (ip, user, country, alert_time, reason)
+    VALUES ('1.1.1.1', 'alice', 'BRAZIL', '2025-09-07 12:00:00', 'Brute force');
+"""
+
+
+def test_migrates_v1_3_0_database(tmp_path, monkeypatch):
+    db_file = tmp_path / "old.db"
+    conn = sqlite3.connect(db_file)
+    conn.executescript(V1_3_0_SCHEMA)
+    conn.close()
+
+    monkeypatch.setattr(database, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(database, "DB_FILE", str(db_file))
+    database.init_db()
+    database.init_db()  # already up to date: no-op
+
+    conn = sqlite3.connect(db_file)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == database.SCHEMA_VERSION
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {"idx_alerts_ip", "idx_login_attempts_timestamp", "idx_login_attempts_ip",
+            "idx_login_attempts_user_result"} <= indexes
+    # Old rows stay readable through the view as the legacy partition
+    assert conn.execute("SELECT name FROM login_partitions").fetchall() == [("login_attempts_legacy",)]
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT 1 FROM alerts WHERE ip = ? LIMIT 1", ("1.1.1.1",)).fetchall()
+    assert "idx_alerts_ip" in plan[0][-1]
+    assert conn.execute("SELECT COUNT(*) FROM login_attempts").fetchone()[0] == 1
+    # Rollups are filled from the existing rows
+    assert conn.execute("SELECT count FROM login_totals WHERE dim = 'ip' AND key = '1.1.1.1'").fetchone()[0] == 1
+    assert conn.execute("SELECT count FROM login_totals WHERE dim = 'failed_ip' AND key = '1.1.1.1'").fetchone()[0] == 1
+    assert conn.execute("SELECT count FROM alert_totals WHERE ip = '1.1.1.1'").fetchone()[0] == 1
+    conn.close()
+
+    try:
+        assert database.is_ip_alerted("1.1.1.1")
+        database.save_ip_cache_entry("8.8.8.8", "UNITED STATES", 1e12)
+        assert database.load_ip_cache() == [("8.8.8.8", "UNITED STATES", 1e12)]
+    finally:
+        database.close_writer()
+
+
+def test_login_attempts_are_partitioned(db):
+    db.init_writer(batch_size=100, max_latency=0)
+    partitions = db.init_partitions("day", retention_days=2)
+    for day in (1, 2, 2, 5):
+        db.add_login_attempt(datetime.datetime(2025, 9, day, 12, 0, 0), "1.1.1.1", "alice", "fail", "BRAZIL", "raw")
+    db.close_writer()
+
+    conn = sqlite3.connect(db.DB_FILE)
+    names = [row[0] for row in conn.execute("SELECT name FROM login_partitions ORDER BY start")]
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+    # Sep 1 and 2 ended more than 2 days before Sep 5 and were dropped whole
+    assert names == ["login_attempts_d20250905"]
+    assert "login_attempts_d20250901" not in tables
+    assert count_rows(db.DB_FILE, "login_attempts") == 1
+    assert (partitions.created, partitions.dropped) == (3, 2)
+    # Hourly/minute rollups follow the partitions; all-time totals are kept
+    conn = sqlite3.connect(db.DB_FILE)
+    assert {row[0][:10] for row in conn.execute("SELECT bucket FROM login_rollups")} == {"2025-09-05"}
+    assert conn.execute("SELECT count FROM login_totals WHERE dim = 'user' AND key = 'alice'").fetchone() == (4,)
+    conn.close()
+
+
+def test_rows_older_than_retention_are_not_stored(db):
+    db.init_writer(batch_size=100, max_latency=0)
+    partitions = db.init_partitions("day", retention_days=7)
+    # Live ingestion, then a backfill of older logs
+    for day in (30, 1, 25, 22):
+        db.add_login_attempt(datetime.datetime(2025, 9, day, 12, 0, 0), "1.1.1.1", "alice", "fail", "BRAZIL", "raw")
+    db.close_writer()
+
+    conn = sqlite3.connect(db.DB_FILE)
+    names = [row[0] for row in conn.execute("SELECT name FROM login_partitions ORDER BY start")]
+    conn.close()
+    assert names == ["login_attempts_d20250925", "login_attempts_d20250930"]
+    assert count_rows(db.DB_FILE, "login_attempts") == 2
+    assert (partitions.created, partitions.expired) == (2, 2)
+
+
+def test_week_partitions_span_the_view(db):
+    db.init_writer(batch_size=100, max_latency=0)
+    db.init_partitions("week")
+    for day in (1, 7, 8, 20):
+        db.add_login_attempt(datetime.datetime(2025, 9, day, 12, 0, 0), "1.1.1.1", "alice", "fail", "BRAZIL", "raw")
+    db.close_writer()
+
+    conn = sqlite3.connect(db.DB_FILE)
+    names = [row[0] for row in conn.execute("SELECT name FROM login_partitions ORDER BY start")]
+    per_week = conn.execute("SELECT COUNT(*) FROM login_attempts WHERE timestamp < '2025-09-08'").fetchone()[0]
+    conn.close()
+    assert names == ["login_attempts_w20250901", "login_attempts_w20250908", "login_attempts_w20250915"]
+    assert per_week == 2
+    assert count_rows(db.DB_FILE, "login_attempts") == 4
+
+
+def test_compressed_raw_log(db, monkeypatch):
+    monkeypatch.setattr(db, "_raw_blocks", db.RawLogBlocks())
+    db.set_raw_log_mode("compressed")
+    try:
+        db.init_writer(batch_size=2, max_latency=0)
+        ts = datetime.datetime(2025, 9, 7, 12, 0, 0)
+        for i in range(3):
+            db.add_login_attempt(ts, "1.1.1.1", "alice", "fail", "BRAZIL", f"sshd: Failed password for alice port {i}")
+
+        rows = db.get_writer().query("SELECT raw_log, raw_ref FROM login_attempts ORDER BY id")
+        assert all(row["raw_log"] is None for row in rows)
+        # The first two rows were committed in one block, the third is still pending
+        assert [db.get_raw_log(*row) for row in rows] == [f"sshd: Failed password for alice port {i}" for i in range(3)]
+        db.close_writer()
+    finally:
+        db.set_raw_log_mode("inline")
+
+    conn = sqlite3.connect(db.DB_FILE)
+    assert conn.execute("SELECT lines FROM raw_blocks ORDER BY id").fetchall() == [(2,), (1,)]
+    reader = db.RawLogReader(lambda sql, params: conn.execute(sql, params).fetchall())
+    refs = conn.execute("SELECT raw_log, raw_ref FROM login_attempts ORDER BY id").fetchall()
+    assert reader.get(*refs[2]) == "sshd: Failed password for alice port 2"
+    assert reader.get("inline text", None) == "inline text"
+    conn.close()
+
+
+def test_retention_deletes_compressed_blocks(db, monkeypatch):
+    monkeypatch.setattr(db, "_raw_blocks", db.RawLogBlocks())
+    db.set_raw_log_mode("compressed")
+    try:
+        db.init_writer(batch_size=2, max_latency=0)
+        db.init_partitions("day", retention_days=2)
+        for day in (1, 2, 2, 5, 5):
+            db.add_login_attempt(datetime.datetime(2025, 9, day, 12, 0, 0), "1.1.1.1", "alice", "fail", "BRAZIL",
+                                 f"sshd: Failed password for alice on day {day}")
+        db.close_writer()
+    finally:
+        db.set_raw_log_mode("inline")
+
+    conn = sqlite3.connect(db.DB_FILE)
+    # Only the blocks of the Sep 5 rows are left (the open block was sealed
+    # before the drop, so it didn't keep a Sep 2 line), and they still resolve
+    assert conn.execute("SELECT lines, last_time FROM raw_blocks").fetchall() == [(1, "2025-09-05 12:00:00")] * 2
+    reader = db.RawLogReader(lambda sql, params: conn.execute(sql, params).fetchall())
+    refs = conn.execute("SELECT raw_log, raw_ref FROM login_attempts").fetchall()
+    assert [reader.get(*ref) for ref in refs] == ["sshd: Failed password for alice on day 5"] * 2
+    conn.close()
+
+
+def test_file_offset_commits_with_the_unit(db):
+    writer = db.init_writer(batch_size=2, max_latency=0)
+    ts = datetime.datetime(2025, 9, 7, 12, 0, 0)
+
+    # A unit is never split by a batch commit
+    with writer.unit():
+        for _ in range(3):
+            db.add_login_attempt(ts, "1.1.1.1", "alice", "fail", "BRAZIL", "raw")
+        db.save_file_offset("logs/auth.log", 1, 2, 300)
+        assert writer.commits == 0
+    assert writer.commits == 1
+    assert count_rows(db.DB_FILE, "login_attempts") == 3
+    assert count_rows(db.DB_FILE, "file_offsets") == 1
+
+    db.save_file_offset("logs/auth.log", 1, 2, 400)
+    db.close_writer()
+    db.init_writer()
+    assert db.load_file_offsets() == {"logs/auth.log": (1, 2, 400)}
+
+
+def test_journal_cursor_is_saved(db):
+    db.init_writer(batch_size=100, max_latency=0)
+    assert db.load_journal_cursors() == {}
+    db.save_journal_cursor("journal", "s=1;i=1")
+    db.save_journal_cursor("journal", "s=1;i=2")
+    db.close_writer()
+    db.init_writer()
+    assert db.load_journal_cursors() == {"journal": "s=1;i=2"}
@@ -0,0 +1,46 @@
+import time
+import threading
+from src.geo_pipeline import GeoPipeline
+
+
+def test_events_released_in_order_with_one_lookup_per_ip():
+    calls = []
+    slow_ip_ready = threading.Event()
+
+    def lookup(ip):
+        calls.append(ip)
+        if ip == "1.1.1.1":
+            slow_ip_ready.wait(2)
+        return {"1.1.1.1": "BRAZIL", "2.2.2.2": "CHINA"}[ip]
+
+    released = []
+    pipeline = GeoPipeline(lookup, lambda item, country: released.append((item, country)), concurrency=4)
+    pipeline.submit("1.1.1.1", "a")
+    pipeline.submit("2.2.2.2", "b")
+    pipeline.submit("1.1.1.1", "c")
+
+    time.sleep(0.1)
+    assert released == []  # "a" is still waiting, so nothing behind it is released
+
+    slow_ip_ready.set()
+    pipeline.close()
+
+    assert released == [("a", "BRAZIL"), ("b", "CHINA"), ("c", "BRAZIL")]
+    assert sorted(calls) == ["1.1.1.1", "2.2.2.2"]
+
+
+def test_cached_ips_skip_lookup_and_deadline_gives_unknown():
+    never = threading.Event()
+    released = []
+    pipeline = GeoPipeline(
+        lambda ip: never.wait(1) or "CHINA",
+        lambda item, country: released.append((item, country)),
+        cached=lambda ip: "BRAZIL" if ip == "8.8.8.8" else None,
+        deadline=0.05,
+    )
+    pipeline.submit("8.8.8.8", "cached")
+    pipeline.submit("9.9.9.9", "slow")
+    pipeline.close()
+
+    assert released == [("cached", "BRAZIL"), ("slow", "UNKNOWN")]
+    assert pipeline.stats()["timeouts"] == 1
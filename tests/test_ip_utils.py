@@ -1,4 +1,5 @@
-from src.ip_utils import normalize_country
+import time
+from src.ip_utils import normalize_country, country_from_code, LocalGeoIPResolver, IPCache
 
 def test_normalize_country_basic():
     assert normalize_country("Brasil") == "BRASIL"
@@ -9,3 +10,57 @@ def test_normalize_country_basic():
 def test_normalize_country_with_spaces():
     assert normalize_country("  France  ") == "FRANCE"
     assert normalize_country(" United States ") == "UNITED STATES"
+
+
+def test_local_geoip_resolver(tmp_path):
+    db_file = tmp_path / "geoip.csv"
+    db_file.write_text(
+        "start_ip,end_ip,country_code\n"
+        "8.8.8.0,8.8.8.255,US\n"
+        "177.0.0.0,177.255.255.255,BR\n"
+        "16777216,16777471,AU\n"
+        "2001:db8::,2001:db8::ffff,DE\n"
+    )
+    resolver = LocalGeoIPResolver(str(db_file))
+
+    assert len(resolver) == 4
+    assert resolver.lookup("8.8.8.8") == "US"
+    assert resolver.lookup("177.10.20.30") == "BR"
+    assert resolver.lookup("1.0.0.1") == "AU"
+    assert resolver.lookup("2001:db8::1") == "DE"
+    assert resolver.lookup("9.9.9.9") is None
+    assert resolver.lookup("not-an-ip") is None
+
+
+def test_country_from_code():
+    assert country_from_code("BR") == "BRAZIL"
+    assert country_from_code("XX") == "XX"
+
+
+def test_ip_cache_lru_and_ttl():
+    stored = []
+    cache = IPCache(max_size=2, ttl=60, negative_ttl=0, persist=lambda *row: stored.append(row))
+
+    cache.set("1.1.1.1", "BRAZIL")
+    cache.set("2.2.2.2", "CHINA")
+    assert cache.get("1.1.1.1") == "BRAZIL"
+    cache.set("3.3.3.3", "GERMANY")  # evicts 2.2.2.2, the least recently used
+
+    assert cache.get("2.2.2.2") is None
+    assert cache.get("3.3.3.3") == "GERMANY"
+
+    cache.set("4.4.4.4", "UNKNOWN")  # negative entry expires immediately
+    assert cache.get("4.4.4.4") is None
+
+    stats = cache.stats()
+    assert stats["evictions"] == 2
+    assert stats["expirations"] == 1
+    assert stats["hits"] == 2
+    assert len(stored) == 4
+
+
+def test_ip_cache_load_skips_expired():
+    cache = IPCache()
+    loaded = cache.load([("1.1.1.1", "BRAZIL", time.time() + 60), ("2.2.2.2", "CHINA", time.time() - 1)])
+    assert loaded == 1
+    assert cache.get("1.1.1.1") == "BRAZIL"
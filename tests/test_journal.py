@@ -0,0 +1,115 @@
+import sys
+import json
+import logging
+import datetime
+import pytest
+from src.journal import JournalSource, format_entry
+from src.parser import parse_log_line
+
+logger = logging.getLogger("test")
+
+# Stands in for journalctl: prints the entries of journal.json as "-o json"
+# does, honoring --after-cursor and _SYSTEMD_UNIT= matches, and records its
+# arguments. It never follows, so the reader sees the end of the stream.
+FAKE_JOURNALCTL = """#!{python}
+import sys, json
+args = sys.argv[1:]
+open({calls!r}, "a").write(json.dumps(args) + "\\n")
+units = {{a.split("=", 1)[1] for a in args if a.startswith("_SYSTEMD_UNIT=")}}
+after = args[args.index("--after-cursor") + 1] if "--after-cursor" in args else None
+entries = [json.loads(line) for line in open({journal!r})]
+if after is not None:
+    entries = entries[[e["__CURSOR"] for e in entries].index(after) + 1:]
+elif "-n" in args:
+    entries = []
+for entry in entries:
+    if not units or entry["_SYSTEMD_UNIT"] in units:
+        print(json.dumps(entry))
+"""
+
+STAMP = int(datetime.datetime(2025, 9, 7, 12, 0, 5).timestamp() * 1e6)
+
+
+def entry(n, unit, message, pid=100):
+    return {"__CURSOR": f"s=1;i={n}", "__REALTIME_TIMESTAMP": str(STAMP + n * 1000000), "_HOSTNAME": "server",
+            "_SYSTEMD_UNIT": unit, "SYSLOG_IDENTIFIER": unit.split(".")[0], "_PID": str(pid), "MESSAGE": message}
+
+
+class FakeJournal:
+    def __init__(self, tmp_path):
+        self.journal = tmp_path / "journal.json"
+        self.calls = tmp_path / "calls.json"
+        self.command = tmp_path / "journalctl"
+        self.command.write_text(FAKE_JOURNALCTL.format(python=sys.executable, calls=str(self.calls),
+                                                       journal=str(self.journal)))
+        self.command.chmod(0o755)
+        self.journal.write_text("")
+
+    def append(self, *entries):
+        with open(self.journal, "a") as f:
+            for e in entries:
+                f.write(json.dumps(e) + "\n")
+
+    def calls_made(self):
+        return [json.loads(line) for line in self.calls.read_text().splitlines()]
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return FakeJournal(tmp_path)
+
+
+def test_reads_all_units_in_one_stream(journal, make_recorder):
+    journal.append(
+        entry(1, "sshd.service", "Failed password for root from 1.2.3.4 port 22 ssh2"),
+        entry(2, "cron.service", "running job"),
+        entry(3, "nginx.service", '5.6.7.8 - - [07/Sep/2025:12:00:08 +0000] "POST /login HTTP/1.1" 403 12'),
+        entry(4, "sshd.service", [104, 105, 255]),  # not UTF-8
+    )
+    rec = make_recorder()
+    source = JournalSource(["sshd", "nginx.service"], logger, rec.checkpoint, backend="journalctl",
+                           command=str(journal.command))
+    source.run(rec.process, follow=False)
+
+    assert journal.calls_made() == [["-o", "json", "--no-pager",
+                                     "_SYSTEMD_UNIT=sshd.service", "_SYSTEMD_UNIT=nginx.service"]]
+    assert rec.sources == ["sshd.service", "nginx.service", "sshd.service"]
+    assert rec.lines[0] == "Sep  7 12:00:06 server sshd[100]: Failed password for root from 1.2.3.4 port 22 ssh2"
+    assert rec.lines[2].endswith("sshd[100]: hi")
+    assert rec.checkpoints == {"journal": "s=1;i=4"}
+    assert parse_log_line(rec.lines[0], "sshd.service")[1:] == ("1.2.3.4", "root", "ssh_login", "Failed")
+    assert parse_log_line(rec.lines[1], "nginx.service")[1] == "5.6.7.8"
+
+
+def test_resumes_after_the_saved_cursor(journal, make_recorder):
+    journal.append(entry(1, "sshd.service", "one"), entry(2, "sshd.service", "two"))
+    rec = make_recorder()
+    JournalSource(["sshd"], logger, rec.checkpoint, backend="journalctl",
+                  command=str(journal.command)).run(rec.process, follow=False)
+
+    # Entries written while the analyzer was stopped are not lost
+    journal.append(entry(3, "sshd.service", "three"))
+    again = make_recorder()
+    source = JournalSource(["sshd"], logger, again.checkpoint, rec.checkpoints["journal"], backend="journalctl",
+                           command=str(journal.command))
+    source.run(again.process, follow=False)
+
+    assert journal.calls_made()[1][3:5] == ["--after-cursor", "s=1;i=2"]
+    assert [line.split(": ", 1)[1] for line in again.lines] == ["three"]
+    assert again.checkpoints == {"journal": "s=1;i=3"}
+    assert source.stats() == {"entries": 1, "skipped": 0, "restarts": 0}
+
+
+def test_follow_without_cursor_reads_only_new_entries(journal):
+    source = JournalSource(["sshd"], logger, backend="journalctl", command=str(journal.command))
+    assert source.command_args(follow=True)[4:] == ["-f", "-n", "0", "_SYSTEMD_UNIT=sshd.service"]
+    source.cursor = "s=1;i=9"
+    assert source.command_args(follow=True)[4:7] == ["-f", "--after-cursor", "s=1;i=9"]
+
+
+def test_format_entry_from_python_systemd():
+    # python-systemd converts the fields: datetime timestamp, int pid
+    line = format_entry({"__REALTIME_TIMESTAMP": datetime.datetime(2025, 9, 17, 8, 1, 2), "_HOSTNAME": "h",
+                         "_COMM": "sshd", "_PID": 7, "MESSAGE": "Accepted password for bob from 9.9.9.9 port 22",
+                         "_SYSTEMD_UNIT": "sshd.service"})
+    assert line == "Sep 17 08:01:02 h sshd[7]: Accepted password for bob from 9.9.9.9 port 22"
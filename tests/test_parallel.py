@@ -0,0 +1,72 @@
+import logging
+import datetime
+import pytest
+from src import database, ip_utils
+from src.analyzer import init_state, process_line
+from src.parallel import ShardedIngestor, shard_of
+
+CONFIG = {
+    "allowed_countries": ["BRAZIL", "CHINA"],
+    "login_fail_limit": 5,
+    "login_fail_window": 60,
+    "ip_to_user_limit": 10,
+    "user_to_ip_limit": 20,
+}
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch, database_state):
+    monkeypatch.setattr(database, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "test.db"))
+    database.init_db()
+    database.init_writer(max_latency=0)
+    countries = {"1.1.1.": "BRAZIL", "2.2.2.": "CHINA", "3.3.3.": "AUSTRIA"}
+    monkeypatch.setattr(ip_utils, "resolve_country", lambda ip, logger: countries[ip[:6]])
+    monkeypatch.setattr(ip_utils, "ip_cache", ip_utils.IPCache())
+    yield database
+    database.close_writer()
+
+
+def make_lines():
+    start = datetime.datetime(2025, 9, 1, 10, 0, 0)
+    lines = []
+    for i in range(300):
+        ip = f"{['1.1.1', '2.2.2', '3.3.3'][i % 3]}.{i % 7}"
+        ts = (start + datetime.timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S")
+        lines.append(f"{ts}, IP: {ip}, user: user{i % 13}, action: login, result: fail")
+    return lines
+
+
+def alerts():
+    rows = database.get_writer().query("SELECT ip, user, reason FROM alerts ORDER BY ip, reason")
+    return [tuple(row) for row in rows]
+
+
+def test_shard_of_is_stable():
+    assert shard_of("10.0.0.1", 4) == shard_of("10.0.0.1", 4)
+    assert {shard_of(f"10.0.0.{i}", 4) for i in range(50)} == {0, 1, 2, 3}
+
+
+def test_sharded_ingestion_matches_single_process(db):
+    logger = logging.getLogger("test")
+    lines = make_lines()
+
+    state = init_state(CONFIG)
+    state["event_time"] = True
+    for line in lines:
+        process_line(line, logger, CONFIG, state)
+    assert state["store"].ticks == len(lines)  # once per failed login
+    expected = alerts()
+    assert expected
+
+    database.get_writer().execute("DELETE FROM alerts")
+    database.get_writer().execute("DELETE FROM blocked_ips")
+    state = init_state(CONFIG)
+    state["event_time"] = True
+    sharded = ShardedIngestor(CONFIG, logger, state, shards=3, parse_workers=2, chunk_size=50)
+    for line in lines:
+        sharded.submit(line)
+    sharded.close()
+
+    assert sharded.stats()["applied"] == len(lines)
+    assert alerts() == expected
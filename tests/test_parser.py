@@ -1,5 +1,8 @@
+import io
 import datetime
-from src.parser import parse_log_line
+import pytest
+from src import parser
+from src.parser import parse_log_line, detect_format, read_line_chunks
 
 
 def test_default_log():
@@ -47,4 +50,122 @@ def test_ssh_log():
     assert ip == "192.168.1.100"
     assert user == "root"
     assert action == "ssh_login"
-    assert result == "Failed"
\ No newline at end of file
+    assert result == "Failed"
+
+def test_windows_csv_log():
+    parsed = parse_log_line("2025-09-07 12:34:56,10.0.0.5,bob,login,4625")
+    assert parsed is not None
+    ts, ip, user, action, result = parsed
+    assert ip == "10.0.0.5"
+    assert user == "bob"
+    assert result == "failure"
+    assert parse_log_line("Timestamp,IP,User,Action,Result") is None
+
+
+def test_detect_format():
+    assert detect_format("Jan 10 10:32:15 server sshd[1]: Failed password for root from 1.2.3.4 port 22") == "ssh"
+    assert detect_format("2025-09-07 12:34:56, IP: 1.1.1.1, user: a, action: login, result: fail") == "default"
+    assert detect_format("2025-09-07 12:34:56,1.1.1.1,a,login,success") == "windows_csv"
+    assert detect_format('127.0.0.1 - frank [10/Oct/2000:13:55:36 -0700] "GET / HTTP/1.0" 200 1') == "apache"
+    assert detect_format("hello world") is None
+
+
+def test_lines_mentioning_sshd_keep_their_format():
+    apache = '1.2.3.4 - - [07/Sep/2025:12:34:56 +0000] "GET /admin/sshd_config HTTP/1.1" 403 12'
+    assert detect_format(apache) == "apache"
+    assert parse_log_line(apache)[1:] == ("1.2.3.4", "-", "GET", "403")
+    default = "2025-09-07 12:34:56, IP: 5.6.7.8, user: sshd, action: login, result: fail"
+    assert parse_log_line(default)[1:] == ("5.6.7.8", "sshd", "login", "fail")
+    # A detected format that doesn't match is not retried against the others
+    assert parse_log_line("Jan 10 10:32:15 server sshd[1]: Connection closed by 1.2.3.4 port 22") is None
+
+
+def test_source_format_is_remembered(parser_state):
+    line = '127.0.0.1 - frank [10/Oct/2000:13:55:36 -0700] "GET /apache.gif HTTP/1.0" 200 2326'
+    assert parse_log_line(line, "access.log") is not None
+    assert parser.source_formats == {"access.log": "apache"}
+
+
+def test_source_formats_are_bounded(parser_state, monkeypatch):
+    monkeypatch.setattr(parser, "MAX_SOURCES", 3)
+    line = "2025-09-07 12:34:56, IP: 1.1.1.1, user: a, action: login, result: fail"
+    for i in range(5):
+        parse_log_line(line, f"syslog:host{i}")
+    assert list(parser.source_formats) == ["syslog:host2", "syslog:host3", "syslog:host4"]
+
+
+def collect(f, **kwargs):
+    lines, ends = [], []
+    for chunk, chunk_ends in read_line_chunks(f, with_offsets=True, **kwargs):
+        lines += chunk
+        ends += chunk_ends
+    return lines, ends
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1024])
+def test_read_line_chunks_carries_partial_lines(chunk_size):
+    data = "a\r\nçã é\n\nlast".encode("utf-8")
+    lines, ends = collect(io.BytesIO(data), chunk_size=chunk_size)
+    # Offsets are in bytes, and the unfinished last line is left for later
+    assert lines == ["a", "çã é", ""]
+    assert ends == [3, 11, 12]
+
+    lines, ends = collect(io.BytesIO(data), offset=3, chunk_size=chunk_size, final=True)
+    assert lines == ["çã é", "", "last"]
+    assert ends == [11, 12, len(data)]
+
+
+def test_read_line_chunks_mmap(tmp_path, monkeypatch):
+    monkeypatch.setattr(parser, "MMAP_THRESHOLD", 1)
+    path = tmp_path / "auth.log"
+    path.write_bytes(b"one\ntwo\nthr")
+    with open(path, "rb") as f:
+        assert collect(f, offset=4, chunk_size=2, use_mmap=True) == (["two"], [8])
+
+
+def test_json_lines(parser_state):
+    nginx = ('{"time_iso8601":"2025-09-07T12:34:56+02:00","remote_addr":"203.0.113.9","remote_user":"",'
+             '"request_method":"POST","request_uri":"/login","status":403}')
+    assert detect_format(nginx) == "json"
+    assert parse_log_line(nginx) == (datetime.datetime(2025, 9, 7, 12, 34, 56), "203.0.113.9", "-", "POST", "403")
+
+    app = '{"ts":1757248496,"client":{"ip":"10.1.2.3"},"event":"login","user":"bob","outcome":"fail","msg":"sshd"}'
+    assert parse_log_line(app) is None  # no time or IP under the default keys
+    parser.configure_json_fields({"time": "ts", "ip": "client.ip", "action": "event", "status": ["outcome"]})
+    try:
+        ts, ip, user, action, result = parse_log_line(app, "app.jsonl")
+        assert ts == datetime.datetime.fromtimestamp(1757248496)
+        assert (ip, user, action, result) == ("10.1.2.3", "bob", "login", "fail")
+        assert parser.source_formats["app.jsonl"] == "json"
+    finally:
+        parser.configure_json_fields()
+
+    with pytest.raises(ValueError):
+        parser.configure_json_fields({"host": "hostname"})
+    assert parse_log_line('{"remote_addr": "1.2.3.4", "time": "not a time"}') is None
+    assert parse_log_line('{"truncated": ') is None
+    assert parser.is_log_file("app.jsonl") and parser.is_log_file("app.jsonl.1.gz")
+
+
+def test_json_lines_stdlib_decoder(monkeypatch):
+    import json
+    monkeypatch.setattr(parser, "json_loads", json.loads)
+    line = '{"@timestamp":"2025-09-07T12:00:00.123Z","ip":"::1","user":"joão","action":"login","status":"success"}'
+    assert parse_log_line(line) == (datetime.datetime(2025, 9, 7, 12, 0), "::1", "joão", "login", "success")
+    line = '{"time_local":"07/Sep/2025:12:00:01 +0000","remote_addr":"1.2.3.4","request_method":"GET","status":200}'
+    assert parse_log_line(line)[0] == datetime.datetime(2025, 9, 7, 12, 0, 1)
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1757248496", 1757248496),
+    ("1757248496123", 1757248496),           # milliseconds
+    ("1757248496123456", 1757248496),        # microseconds
+    ("1757248496123456789", 1757248496),     # nanoseconds
+    ("1e300", None), ("99999999999999999999", None), ("-5", None), ("true", None),
+])
+def test_json_epoch_timestamps(value, expected):
+    parsed = parser.parse_json_line(f'{{"ip": "1.2.3.4", "time": {value}}}')
+    if expected is None:
+        assert parsed is None
+    else:
+        assert parsed[0] == datetime.datetime.fromtimestamp(expected)
@@ -0,0 +1,40 @@
+import sqlite3
+import datetime
+from src import database
+from scripts.report import generate_report
+
+
+def test_report_reads_rollups(tmp_path, monkeypatch, capsys, database_state):
+    monkeypatch.setattr(database, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "test.db"))
+    database.init_db()
+    database.init_writer(batch_size=100, max_latency=0)
+    ts = datetime.datetime(2025, 9, 7, 12, 0, 0)
+    for ip, country, n in (("1.1.1.1", "BRAZIL", 3), ("2.2.2.2", "CHINA", 5), ("3.3.3.3", "UNKNOWN", 9)):
+        for i in range(n):
+            database.add_login_attempt(ts + datetime.timedelta(minutes=i), ip, "alice", "fail", country, "raw")
+    # Successful logins count as attempts, not as failures
+    for i in range(20):
+        database.add_login_attempt(ts + datetime.timedelta(minutes=i), "4.4.4.4", "bob", "success", "BRAZIL", "raw")
+    database.add_alert("2.2.2.2", "alice", "CHINA", ts, "Brute force")
+    database.add_alert("2.2.2.2", "alice", "CHINA", ts, "Brute force")
+    database.add_blocked_ip("3.3.3.3", "alice", "UNKNOWN", ts)
+    database.close_writer()
+
+    conn = sqlite3.connect(database.DB_FILE)
+    totals = dict(conn.execute("SELECT key, count FROM login_totals WHERE dim = 'country'").fetchall())
+    minutes = conn.execute("SELECT COUNT(*) FROM login_rollups WHERE period = 'minute'").fetchone()[0]
+    conn.close()
+    assert totals == {"BRAZIL": 23, "CHINA": 5, "UNKNOWN": 9}
+    assert minutes == 29
+
+    generate_report(database.DB_FILE)
+    out = capsys.readouterr().out
+    assert "Total de logs analisados: 37" in out
+    assert "  - BRAZIL: 23 tentativas\n  - CHINA: 5 tentativas" in out
+    assert "UNKNOWN: 9 tentativas" not in out.split("Top 5 países")[1].split("[+]")[0]
+    failed_ips = out.split("tentativas com falha")[1].split("[+]")[0]
+    assert "  - 3.3.3.3: 9 falhas\n  - 2.2.2.2: 5 falhas\n  - 1.1.1.1: 3 falhas\n" in failed_ips
+    assert "4.4.4.4" not in failed_ips
+    assert "  - 2.2.2.2: 2 alertas" in out
+    assert "IP: 3.3.3.3 (UNKNOWN)" in out
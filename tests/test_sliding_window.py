@@ -0,0 +1,35 @@
+from src.sliding_window import SlidingWindow
+
+
+def test_distinct_counts_follow_expiry():
+    window = SlidingWindow(10)
+    window.add(0, "alice")
+    window.add(1, "bob")
+    window.add(2, "alice")
+    assert len(window) == 3
+    assert window.distinct() == 2
+
+    window.add(10, "carol")  # event at 0 is now 10 old and expires
+    assert len(window) == 3
+    assert window.distinct() == 3
+
+    window.add(12, "carol")  # both events of alice/bob have expired
+    assert window.distinct() == 1
+    assert len(window) == 2
+
+
+def test_inclusive_window_keeps_boundary():
+    window = SlidingWindow(60, inclusive=True)
+    window.add(0)
+    window.add(60)
+    assert len(window) == 2
+    window.add(61)
+    assert len(window) == 2
+
+
+def test_clear():
+    window = SlidingWindow(10)
+    window.add(0, "a")
+    window.clear()
+    assert len(window) == 0
+    assert window.distinct() == 0
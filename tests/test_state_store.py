@@ -0,0 +1,38 @@
+from src.state_store import StateStore, BoundedSet, ip_key
+
+
+def test_ip_key():
+    assert ip_key("1.2.3.4") == 0x01020304
+    assert ip_key("2001:db8::1") == "2001:db8::1"
+
+
+def test_idle_keys_are_dropped():
+    store = StateStore()
+    windows = store.window_map("ip_to_user", 60)
+    windows.add("a", 0, "alice")
+    windows.add("b", 10, "bob")
+    assert len(windows) == 2
+
+    windows.add("c", 100, "carol")  # "a" and "b" have no event in the last 60s
+    assert len(windows) == 1
+    assert windows.events == 1
+    assert windows.expired_keys == 2
+
+
+def test_budget_evicts_least_recently_used_keys():
+    store = StateStore(budget_bytes=10 * 1024, check_every=1)
+    windows = store.window_map("fail_logins", 3600, track_values=False)
+    for i in range(200):
+        windows.add(i, 0)
+        store.tick()
+    assert store.nbytes() <= 10 * 1024
+    assert windows.evicted_keys > 0
+    assert 199 in windows and 0 not in windows
+
+
+def test_bounded_set():
+    items = BoundedSet(max_size=2)
+    for item in (1, 2, 3):
+        items.add(item)
+    assert 1 not in items and 3 in items
+    assert items.evicted == 1
@@ -0,0 +1,83 @@
+import time
+import queue
+import logging
+import datetime
+from src.syslog_server import SyslogServer, parse_syslog_message
+from src.parser import parse_log_line
+from scripts.syslog_loadgen import make_messages, send_tcp, send_udp
+
+logger = logging.getLogger("test")
+
+
+def collect(server, expected, timeout=10):
+    lines = []
+    deadline = time.monotonic() + timeout
+    while len(lines) < expected and time.monotonic() < deadline:
+        try:
+            server.process(lambda line, source: lines.append((line, source)), timeout=0.1)
+        except queue.Empty:
+            pass
+    return lines
+
+
+def test_parse_rfc3164_and_rfc5424():
+    line, host = parse_syslog_message(b"<38>Sep  7 12:00:00 web1 sshd[42]: Failed password for root from 1.2.3.4 port 22\n")
+    assert (line, host) == ("Sep  7 12:00:00 web1 sshd[42]: Failed password for root from 1.2.3.4 port 22", "web1")
+
+    stamp = datetime.datetime(2025, 9, 7, 12, 0, 1).astimezone()
+    message = (f'<38>1 {stamp.isoformat()} db2 sshd 77 - [origin ip="10.0.0.2"][x k="a\\]b"] '
+               f'\ufeffAccepted password for bob from 5.6.7.8 port 22').encode()
+    line, host = parse_syslog_message(message, "10.0.0.2")
+    assert host == "db2"
+    assert line == "Sep  7 12:00:01 db2 sshd[77]: Accepted password for bob from 5.6.7.8 port 22"
+    assert parse_log_line(line, "syslog:db2")[1:] == ("5.6.7.8", "bob", "ssh_login", "Accepted")
+
+    # No header at all: the peer is the host
+    assert parse_syslog_message(b"plain text", "10.0.0.9") == ("plain text", "10.0.0.9")
+    assert parse_syslog_message(b"\n") is None
+
+
+def test_load_generator_over_tcp_and_udp():
+    server = SyslogServer(logger, "127.0.0.1", udp_port=0, tcp_port=0, batch_lines=50, batch_latency=0.05)
+    server.start()
+    try:
+        tcp = make_messages(1000, hosts=5, rfc="3164")
+        send_tcp("127.0.0.1", server.tcp_port, tcp[:500], framing="octet")
+        send_tcp("127.0.0.1", server.tcp_port, tcp[500:], framing="newline")
+        lines = collect(server, 1000)
+        # TCP keeps every message, in order
+        assert [line for line, _ in lines] == [m.decode()[4:] for m in tcp]
+        # Sources are senders' addresses, not the (spoofable) hostnames in the messages
+        assert {line.split()[3] for line, _ in lines} == {f"host{i:03d}" for i in range(5)}
+        assert {source for _, source in lines} == {"syslog:127.0.0.1"}
+        assert all(parse_log_line(line) for line, _ in lines)
+
+        udp = make_messages(200, rfc="5424", seed=2)
+        send_udp("127.0.0.1", server.udp_port, udp, rate=2000)
+        lines = collect(server, 200)
+        assert len(lines) == 200
+        assert all("sshd[" in line for line, _ in lines)
+    finally:
+        server.stop()
+    while server.process(lambda line, source: None):
+        pass
+    assert server.stats()["connections"] == 2
+
+
+def test_tcp_senders_are_paused_when_processing_falls_behind():
+    server = SyslogServer(logger, "127.0.0.1", udp_port=None, tcp_port=0, batch_lines=10, max_batches=1,
+                          batch_latency=0.05)
+    server.start()
+    messages = make_messages(300, seed=3)
+    send_tcp("127.0.0.1", server.tcp_port, messages)
+
+    # Nothing is processed for a while: the queue fills and the connection stops being read
+    time.sleep(0.3)
+    assert server.stats()["batch_queue"] == 1
+    lines = collect(server, 300)
+    server.stop()
+    while server.process(lambda line, source: None):
+        pass
+    assert len(lines) == 300
+    stats = server.stats()
+    assert stats["tcp_paused"] > 0 and stats["dropped"] == 0
@@ -0,0 +1,261 @@
+import os
+import logging
+import threading
+import pytest
+from src.tailer import FileTailer
+
+logger = logging.getLogger("test")
+
+
+def test_partial_lines_and_truncation(tmp_path, make_recorder):
+    path = str(tmp_path / "auth.log")
+    rec = make_recorder()
+    tailer = FileTailer(rec.process, logger, rec.checkpoint)
+
+    with open(path, "w") as f:
+        f.write("one\ntw")
+    tailer.poll(path)
+    assert rec.lines == ["one"]
+
+    with open(path, "a") as f:
+        f.write("o\nthree\n")
+    tailer.poll(path)
+    assert rec.lines == ["one", "two", "three"]
+    assert rec.checkpoints[path][2] == os.path.getsize(path)
+
+    # copytruncate
+    with open(path, "w") as f:
+        f.write("four\n")
+    tailer.poll(path)
+    assert rec.lines[-1] == "four"
+    assert tailer.truncations == 1
+    tailer.close()
+
+
+def test_rotation_drains_old_file_first(tmp_path, make_recorder):
+    path = str(tmp_path / "auth.log")
+    rec = make_recorder()
+    tailer = FileTailer(rec.process, logger, rec.checkpoint)
+    with open(path, "w") as f:
+        f.write("old 1\n")
+    tailer.poll(path)
+
+    # Written just before the rename, not seen yet
+    with open(path, "a") as f:
+        f.write("old 2\n")
+    os.rename(path, path + ".1")
+    with open(path, "w") as f:
+        f.write("new 1\n")
+    tailer.poll(path)
+
+    assert rec.lines == ["old 1", "old 2", "new 1"]
+    assert tailer.rotations == 1
+    tailer.close()
+
+
+def test_resume_from_checkpoint(tmp_path, make_recorder):
+    path = str(tmp_path / "auth.log")
+    with open(path, "w") as f:
+        f.write("a\nb\n")
+    rec = make_recorder()
+    tailer = FileTailer(rec.process, logger, rec.checkpoint)
+    tailer.poll(path)
+    tailer.close()
+
+    # Appended while stopped
+    with open(path, "a") as f:
+        f.write("c\n")
+    again = make_recorder()
+    tailer = FileTailer(again.process, logger, again.checkpoint, rec.checkpoints)
+    tailer.poll(path)  # first poll after a restart, as start_watchdog does
+    assert again.lines == ["c"]
+    tailer.close()
+
+
+def test_resume_after_rotation_while_stopped(tmp_path, make_recorder):
+    path = str(tmp_path / "auth.log")
+    with open(path, "w") as f:
+        f.write("a\n")
+    rec = make_recorder()
+    tailer = FileTailer(rec.process, logger, rec.checkpoint)
+    tailer.poll(path)
+    tailer.close()
+
+    with open(path, "a") as f:
+        f.write("b\n")
+    os.rename(path, path + ".1")
+    with open(path, "w") as f:
+        f.write("c\n")
+
+    again = make_recorder()
+    tailer = FileTailer(again.process, logger, again.checkpoint, rec.checkpoints)
+    tailer.poll(path)  # first poll after a restart, as start_watchdog does
+    assert again.lines == ["b", "c"]
+    tailer.close()
+
+
+def test_dirty_files_coalesce_and_requeue():
+    from src.realtime import DirtyFiles
+    dirty = DirtyFiles(max_size=10)
+    dirty.mark("a.log")
+    dirty.mark("b.log")
+    dirty.mark("a.log")
+    assert dirty.take() == "a.log"
+
+    # Modified again while being read: queued once more after the read
+    dirty.mark("a.log")
+    dirty.mark("a.log")
+    assert dirty.take() == "b.log"
+    dirty.done("b.log")
+    dirty.done("a.log")
+    assert dirty.take() == "a.log"
+    dirty.done("a.log")
+
+    dirty.close()
+    assert dirty.take() is None
+    stats = dirty.stats()
+    assert (stats["marks"], stats["coalesced"], stats["max_depth"]) == (5, 2, 2)
+
+
+def test_workers_hand_over_batches_in_file_order(tmp_path, make_recorder):
+    from src.realtime import DirtyFiles, TailWorkers
+    path = str(tmp_path / "auth.log")
+    with open(path, "w") as f:
+        f.writelines(f"line {i}\n" for i in range(25))
+
+    rec = make_recorder()
+    tailer = FileTailer(rec.process, logger, rec.checkpoint)
+    dirty = DirtyFiles()
+    workers = TailWorkers(tailer, dirty, logger, readers=2, batch_lines=10, max_batches=1)
+    dirty.mark(path)
+    dirty.close()
+    running = 2
+    while running:
+        if not workers.process(rec.process, timeout=5):
+            running -= 1
+    assert rec.lines == [f"line {i}" for i in range(25)]
+    assert workers.batches_put == 3
+    assert rec.checkpoints[path][2] == os.path.getsize(path)
+
+
+class MarkRecorder:
+    def __init__(self):
+        self.marked = []
+
+    def mark(self, path):
+        self.marked.append(os.path.basename(path))
+
+
+def test_polling_watcher_backs_off_and_stays_bounded(tmp_path):
+    from src.realtime import PollingWatcher
+    for name in ("a.log", "b.log", "c.log", "notes.txt"):
+        (tmp_path / name).write_text("one\n")
+    dirty = MarkRecorder()
+    watcher = PollingWatcher(str(tmp_path), dirty, logger, min_interval=1, max_interval=8, max_stats=2,
+                             rescan_interval=100)
+
+    # First stats mark every file, two per round
+    assert watcher.tick(0) == 1
+    assert watcher.tick(1) == 2
+    assert sorted(dirty.marked) == ["a.log", "b.log", "c.log"]
+    assert watcher.stat_calls == 4  # the first file checked is due again at 1
+
+    # Unchanged files back off: 2, 4, 8, 8 seconds
+    dirty.marked = []
+    now = 1
+    for _ in range(20):
+        now = watcher.tick(now)
+    assert dirty.marked == []
+    assert {state[1] for state in watcher.files.values()} == {8}
+
+    # A change is picked up at the next check and tightens the interval again
+    with open(tmp_path / "b.log", "a") as f:
+        f.write("two\n")
+    (tmp_path / "d.log").write_text("new\n")
+    watcher.next_scan = now
+    start = now
+    while "b.log" not in dirty.marked:
+        now = watcher.tick(now)
+    assert now - start <= 8
+    assert watcher.files[str(tmp_path / "b.log")][1] == 1
+    while "d.log" not in dirty.marked:
+        now = watcher.tick(now)
+    assert sorted(dirty.marked) == ["b.log", "d.log"]
+
+    # A deleted file is marked once so the tailer can finish it, then forgotten
+    dirty.marked = []
+    os.remove(tmp_path / "a.log")
+    for _ in range(6):
+        now = watcher.tick(now)
+    assert dirty.marked == ["a.log"]
+    assert str(tmp_path / "a.log") not in watcher.files
+    assert watcher.stats()["changes"] == 1
+
+
+def test_event_record_files_are_tailed_by_record(tmp_path, make_recorder):
+    from src.parser import EVENT_MAGIC
+    from scripts.windows_agent import pack_event
+    path = str(tmp_path / "windows_events.lmevt")
+    first = pack_event(["2025-09-07 12:00:01", "203.0.113.7", "administrator", "login", "fail"])
+    second = pack_event(["2025-09-07 12:00:02", "::1", "joão", "login", "success"])
+    with open(path, "wb") as f:
+        f.write(EVENT_MAGIC + first + second[:5])
+
+    rec = make_recorder()
+    tailer = FileTailer(rec.process, logger, rec.checkpoint)
+    tailer.poll(path)
+    assert list(map(str, rec.lines)) == ["2025-09-07 12:00:01,203.0.113.7,administrator,login,fail"]
+    assert rec.checkpoints[path][2] == len(EVENT_MAGIC) + len(first)
+
+    with open(path, "ab") as f:
+        f.write(second[5:])
+    tailer.poll(path)
+    assert str(rec.lines[1]) == "2025-09-07 12:00:02,::1,joão,login,success"
+    assert rec.lines[1][1:] == ("::1", "joão", "login", "success")
+    assert rec.checkpoints[path][2] == os.path.getsize(path)
+    tailer.close()
+
+
+def test_files_with_another_header_are_skipped(tmp_path, make_recorder, caplog):
+    from src.realtime import is_watched_file
+    assert not is_watched_file(str(tmp_path / "Application.evt"))  # legacy Windows Event Log
+    path = str(tmp_path / "renamed.lmevt")
+    with open(path, "wb") as f:
+        f.write(b"LfLe not an event record file")
+    rec = make_recorder()
+    tailer = FileTailer(rec.process, logger, rec.checkpoint)
+    tailer.poll(path)
+    with open(path, "ab") as f:
+        f.write(b"more")
+    tailer.poll(path)
+    assert rec.lines == []
+    assert caplog.text.count("is not an event record file") == 1
+    tailer.close()
+
+
+def run_watchdog_until(tmp_path, expected, **options):
+    from src.realtime import start_watchdog
+    stop = threading.Event()
+    lines = []
+
+    def process_line(line, source):
+        lines.append(line)
+        if len(lines) == expected:
+            stop.set()
+
+    timer = threading.Timer(20, stop.set)
+    timer.start()
+    try:
+        start_watchdog(str(tmp_path), logger, process_line, stats_every=0, stop=stop, **options)
+    finally:
+        timer.cancel()
+    return lines
+
+
+@pytest.mark.parametrize("backend", ["native", "polling"])
+def test_startup_catch_up_with_more_files_than_the_queue(tmp_path, backend):
+    for i in range(40):
+        (tmp_path / f"{i:02}.log").write_text(f"line {i}\n")
+    lines = run_watchdog_until(tmp_path, 40, queue_size=10, readers=2, max_batches=1, backend=backend,
+                               poll_min_interval=0.05, poll_max_interval=0.2, poll_max_stats=8)
+    assert sorted(lines) == sorted(f"line {i}" for i in range(40))
@@ -0,0 +1,29 @@
+import datetime
+import pytest
+from src.time_utils import parse_iso_timestamp, parse_apache_timestamp, parse_syslog_timestamp
+
+
+def test_matches_strptime():
+    assert parse_iso_timestamp("2025-09-07 12:34:56") == datetime.datetime.strptime("2025-09-07 12:34:56", "%Y-%m-%d %H:%M:%S")
+    assert parse_apache_timestamp("10/Oct/2000:13:55:36") == datetime.datetime.strptime("10/Oct/2000:13:55:36", "%d/%b/%Y:%H:%M:%S")
+
+
+def test_invalid_values_raise():
+    with pytest.raises(ValueError):
+        parse_iso_timestamp("2025-02-30 12:00:00")
+    with pytest.raises(ValueError):
+        parse_apache_timestamp("10/Foo/2000:13:55:36")
+    with pytest.raises(ValueError):
+        parse_syslog_timestamp("Jan 10 10:32")
+
+
+def test_syslog_uses_reference_year():
+    reference = datetime.datetime(2025, 6, 1, 12, 0, 0)
+    assert parse_syslog_timestamp("Jan  5 10:32:15", reference) == datetime.datetime(2025, 1, 5, 10, 32, 15)
+    assert parse_syslog_timestamp("Jun  2 08:00:00", reference) == datetime.datetime(2025, 6, 2, 8, 0, 0)
+
+
+def test_syslog_year_rollover():
+    new_year = datetime.datetime(2026, 1, 1, 0, 0, 5)
+    assert parse_syslog_timestamp("Dec 31 23:59:58", new_year) == datetime.datetime(2025, 12, 31, 23, 59, 58)
+    assert parse_syslog_timestamp("Jan  1 00:00:01", new_year) == datetime.datetime(2026, 1, 1, 0, 0, 1)
@@ -0,0 +1,104 @@
+import os
+import re
+import csv
+from scripts import windows_agent
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "wevtutil_security.xml")
+
+
+class FakeWevtutil:
+    # Serves the recorded events like "wevtutil qe Security /f:xml": after the
+    # watermark oldest first, or the newest ones first; output comes in small
+    # chunks so events are split across reads
+    def __init__(self, path=FIXTURE, chunk=97):
+        with open(path, "rb") as f:
+            self.events = re.findall(rb"<Event .*?</Event>\s*", f.read(), re.S)
+        self.chunk = chunk
+        self.calls = []
+
+    def record_id(self, event):
+        return int(re.search(rb"<EventRecordID>(\d+)<", event).group(1))
+
+    def __call__(self, after, count):
+        self.calls.append((after, count))
+        if after is None:
+            events = self.events[::-1][:count]
+        else:
+            events = [e for e in self.events if self.record_id(e) > after][:count]
+        data = b"".join(events)
+        for start in range(0, len(data), self.chunk):
+            yield data[start:start + self.chunk]
+
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_parse_events_streams_recorded_xml():
+    events = list(windows_agent.parse_events(FakeWevtutil()(0, 100)))
+    assert [e[0] for e in events] == list(range(1001, 1008))
+    assert events[3] == (1004, "2025-09-07T12:01:10.5000000Z", "4624", "198.51.100.20", "joão.silva")
+
+
+def test_export_pages_from_the_watermark(tmp_path):
+    log_file = str(tmp_path / "windows_events.csv")
+    watermark = str(tmp_path / "agent_watermark.txt")
+    windows_agent.ensure_setup(log_file)
+    windows_agent.save_watermark(1000, watermark)
+
+    fetch = FakeWevtutil()
+    assert windows_agent.export_events(fetch, log_file, watermark, page_size=3) == 6
+    # Pages of 3 until a short one; the machine account without IP is skipped
+    assert fetch.calls == [(1000, 3), (1003, 3), (1006, 3)]
+    assert windows_agent.load_watermark(watermark) == 1007
+    rows = read_rows(log_file)
+    assert rows[0] == ["Timestamp", "IP", "User", "Action", "Result"]
+    assert rows[1] == ["2025-09-07 12:00:01", "203.0.113.7", "administrator", "login", "fail"]
+    assert [row[2] for row in rows[1:]] == ["administrator", "administrator", "joão.silva", "svc_backup",
+                                            "maria", "guest"]
+
+    # Nothing new: nothing appended twice
+    assert windows_agent.export_events(fetch, log_file, watermark, page_size=3) == 0
+    assert fetch.calls[-1] == (1007, 3)
+    assert len(read_rows(log_file)) == 7
+
+
+def test_first_run_takes_the_newest_events_in_order(tmp_path):
+    log_file = str(tmp_path / "windows_events.csv")
+    watermark = str(tmp_path / "agent_watermark.txt")
+    fetch = FakeWevtutil()
+    assert windows_agent.export_events(fetch, log_file, watermark, first_run_events=2) == 2
+    assert fetch.calls == [(None, 2)]
+    assert [row[2] for row in read_rows(log_file)] == ["maria", "guest"]
+    assert windows_agent.load_watermark(watermark) == 1007
+
+
+def test_binary_export_reads_like_the_csv(tmp_path):
+    from src.parser import read_logs, parse_log_line, read_event_records
+    csv_file = str(tmp_path / "windows_events.csv")
+    evt_file = str(tmp_path / "windows_events.lmevt")
+    for path, output_format in ((csv_file, "csv"), (evt_file, "binary")):
+        windows_agent.ensure_setup(path, output_format)
+        windows_agent.export_events(FakeWevtutil(), path, str(tmp_path / f"{output_format}.txt"),
+                                    output_format=output_format)
+
+    csv_lines = list(read_logs([csv_file]))[1:]  # without the header
+    evt_lines = list(read_logs([evt_file]))
+    # Same text (stored as raw_log) and same parsed fields, without building the text
+    assert [str(line) for line in evt_lines] == csv_lines
+    assert [parse_log_line(line) for line in evt_lines] == [parse_log_line(line) for line in csv_lines]
+    assert parse_log_line(evt_lines[0]) is evt_lines[0]
+
+    # An incomplete record is left for the next read, offsets point after whole records
+    with open(evt_file, "rb") as f:
+        data = f.read()
+    with open(evt_file, "wb") as f:
+        f.write(data[:-3])
+    with open(evt_file, "rb") as f:
+        chunks = list(read_event_records(f, chunk_size=7, with_offsets=True))
+    ends = [end for _, chunk_ends in chunks for end in chunk_ends]
+    assert [line for lines, _ in chunks for line in lines] == evt_lines[:-1]
+    assert ends[-1] == len(data) - len(windows_agent.pack_event(str(evt_lines[-1]).split(",")))
+    with open(evt_file, "rb") as f:
+        assert [line for lines, _ in read_event_records(f, ends[2]) for line in lines] == evt_lines[3:-1]